@@ -18,3 +18,4 @@ from pathlib import Path
 # Paths
 CWD: str = Path().cwd()
 OUTPUT_DIR: str = f"{CWD}/output"
+CACHE_DIR: str = f"{CWD}/.explabox_cache"
@@ -13,6 +13,26 @@
 
 """Ingestibles are turned into digestibles, containing information to explore/examine/explain/expose your model."""
 
-from .digestibles import Dataset, Descriptives, Instances, Performance, WronglyClassified
+from .digestibles import (
+    Calibration,
+    Comparison,
+    Dataset,
+    Descriptives,
+    Instances,
+    LabelIssues,
+    Performance,
+    Slices,
+    WronglyClassified,
+)
 
-__all__ = ["Dataset", "Descriptives", "Instances", "Performance", "WronglyClassified"]
+__all__ = [
+    "Calibration",
+    "Comparison",
+    "Dataset",
+    "Descriptives",
+    "Instances",
+    "LabelIssues",
+    "Performance",
+    "Slices",
+    "WronglyClassified",
+]
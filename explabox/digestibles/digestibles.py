@@ -13,22 +13,61 @@
 
 """Main Digestibles classes."""
 
+import copy
 from collections.abc import Sequence as SequenceType
-from typing import Callable, Dict, FrozenSet, Optional, Sequence, Tuple, Union
+from typing import Callable, Dict, FrozenSet, Iterable, List, Mapping, Optional, Sequence, Tuple, Union
 
+import numpy as np
+import pandas as pd
 from genbase import MetaInfo
 from genbase.utils import extract_metrics
 from instancelib.typehints import DT, KT, LT
 from text_explainability.generation.return_types import Instances
 
+from ..examine.metrics import AVERAGES, average_metrics, label_metrics
 from ..ui.notebook import Render
 
 
+def _to_column(values: list) -> Union[np.ndarray, list]:
+    """Store a column of values in a typed array (int64/float64) if possible, else keep the list of objects."""
+    if all(isinstance(v, (int, np.integer)) and not isinstance(v, bool) for v in values):
+        return np.asarray(values, dtype=np.int64)
+    if all(isinstance(v, (int, float, np.integer, np.floating)) and not isinstance(v, bool) for v in values):
+        return np.asarray(values, dtype=np.float64)
+    return list(values)
+
+
+def _encode_labels(labels: Sequence[LT]) -> Tuple[List[FrozenSet[LT]], np.ndarray]:
+    """Encode labels as unique label sets and an integer code per row."""
+    labelset, lookup = [], {}
+    codes = np.empty(len(labels), dtype=np.int32)
+    for i, label in enumerate(labels):
+        if not isinstance(label, frozenset):
+            label = frozenset([label])
+        if label not in lookup:
+            lookup[label] = len(labelset)
+            labelset.append(label)
+        codes[i] = lookup[label]
+    return labelset, codes
+
+
+def _sorted(values: Iterable) -> list:
+    """Values in sorted order, or sorted by their representation if they cannot be compared (e.g. mixed types)."""
+    try:
+        return sorted(values)
+    except TypeError:
+        return sorted(values, key=repr)
+
+
 class Performance(MetaInfo):
     def __init__(
         self,
         labels: Sequence[LT],
-        metrics: dict,
+        metrics: Optional[dict] = None,
+        confusion_matrix: Optional[np.ndarray] = None,
+        confidence_intervals: Optional[dict] = None,
+        approximation: Optional[dict] = None,
+        n_excluded: int = 0,
         type: str = "model_performance",
         subtype: Optional[str] = "classification",
         callargs: Optional[dict] = None,
@@ -38,28 +77,301 @@ class Performance(MetaInfo):
 
         Args:
             labels (Sequence[LT]): Names of labels.
-            metrics (dict): Performance metrics per label.
+            metrics (Optional[dict], optional): Performance metrics per label. Defaults to None.
+            confusion_matrix (Optional[np.ndarray], optional): Confusion matrix (rows are ground-truth labels, columns
+                are predicted labels, both in the order of `labels`) to derive the metrics from. Defaults to None.
+            confidence_intervals (Optional[dict], optional): Bootstrap confidence intervals of the metrics per label and
+                of the averages. Defaults to None.
+            approximation (Optional[dict], optional): Summary of the sample the (estimated) confusion matrix was derived
+                from, including the number of predictions spent, if the metrics are approximated. Defaults to None.
+            n_excluded (int, optional): Number of instances left out of the confusion matrix, as their ground-truth or
+                predicted labels are not exactly one known label (e.g. multilabel instances). Defaults to 0.
             type (str, optional): Type description. Defaults to "model_performance".
             subtype (Optional[str], optional): Subtype description. Defaults to None.
             callargs (Optional[dict], optional): Call arguments for reproducibility. Defaults to None.
+
+        Raises:
+            ValueError: Either `metrics` or `confusion_matrix` should be provided.
         """
         super().__init__(type=type, subtype=subtype, callargs=callargs, renderer=Render, **kwargs)
         self.labels = labels
-        self._metrics, self._properties = extract_metrics(metrics)
+        self._confusion_matrix = None
+        if metrics is not None:
+            metrics, self._properties = extract_metrics(metrics)
+            self._columns = {p: _to_column([metrics[label][p] for label in labels]) for p in self._properties}
+        elif confusion_matrix is not None:
+            # Approximated confusion matrices hold estimated (weighted) counts
+            dtype = np.int64 if approximation is None else np.float64
+            self._confusion_matrix = np.asarray(confusion_matrix, dtype=dtype)
+            self._columns = label_metrics(self._confusion_matrix)
+            self._columns.update(pos_label=list(labels), neg_label=[None] * len(labels))
+            self._properties = sorted(list(self._columns.keys()) + ["confusion_matrix"])
+        else:
+            raise ValueError("Either `metrics` or `confusion_matrix` should be provided.")
+        self._confidence_intervals = confidence_intervals
+        self._approximation = approximation
+        self.n_excluded = int(n_excluded)
+        self._metrics = None
+        self._content = None
+
+    def _label_confusion_matrices(self) -> List[pd.DataFrame]:
+        """One-vs-rest confusion matrix of each label, formatted as in `instancelib` (rows are ground-truth labels)."""
+        columns = {
+            p: self._columns[p].tolist()
+            for p in ["true_positives", "false_negatives", "false_positives", "true_negatives"]
+        }
+        return [
+            pd.DataFrame([[tp, fn], [fp, tn]], columns=[f"{label}", f"~{label}"], index=[f"{label}", f"~{label}"])
+            for label, tp, fn, fp, tn in zip(self.labels, *columns.values())
+        ]
+
+    @property
+    def confusion_matrix(self) -> Optional[np.ndarray]:
+        """Confusion matrix (rows are ground-truth labels, columns are predicted labels), if available."""
+        return self._confusion_matrix
+
+    @property
+    def averages(self) -> Optional[Dict[str, float]]:
+        """Accuracy and macro-, micro- and weighted-averaged precision, recall and F1-score, if available."""
+        if self._confusion_matrix is None:
+            return None
+        return {k: float(v) for k, v in average_metrics(self._confusion_matrix).items()}
+
+    @property
+    def confidence_intervals(self) -> Optional[dict]:
+        """Bootstrap confidence intervals (lower and upper bound) of the metrics, if computed."""
+        return self._confidence_intervals
+
+    @property
+    def approximation(self) -> Optional[dict]:
+        """Summary of the stratified sample the metrics are estimated from, if approximated."""
+        return self._approximation
 
     @property
     def metrics(self):
         """Metrics values."""
+        if self._metrics is None:
+            columns = {p: v.tolist() if isinstance(v, np.ndarray) else v for p, v in self._columns.items()}
+            if "confusion_matrix" not in columns:
+                columns["confusion_matrix"] = self._label_confusion_matrices()
+            self._metrics = {label: {p: columns[p][i] for p in self._properties} for i, label in enumerate(self.labels)}
         return self._metrics
 
     @property
     def content(self):
         """Content as dictionary."""
-        label_metrics = [{"label": label, "metrics": self.metrics[label]} for label in self.labels]
+        if self._content is None:
+            label_metrics = [{"label": label, "metrics": self.metrics[label]} for label in self.labels]
+            self._content = {
+                "labels": self.labels,
+                "label_metrics": label_metrics,
+                "metrics": self._properties,
+            }
+            if self._confusion_matrix is not None:
+                averages = self.averages
+                self._content["accuracy"] = averages.pop("accuracy")
+                self._content["averages"] = {
+                    average: {m.split("_", 1)[1]: v for m, v in averages.items() if m.startswith(f"{average}_")}
+                    for average in AVERAGES
+                }
+                self._content["confusion_matrix"] = self._confusion_matrix.tolist()
+                self._content["n_excluded"] = self.n_excluded
+            if self._confidence_intervals is not None:
+                self._content["confidence_intervals"] = self._confidence_intervals
+            if self._approximation is not None:
+                self._content["approximation"] = self._approximation
+        return self._content
+
+
+class Comparison(MetaInfo):
+    def __init__(
+        self,
+        models: Sequence[str],
+        labels: Sequence[LT],
+        metrics: Sequence[Dict[str, float]],
+        disagreement: np.ndarray,
+        only_correct: np.ndarray,
+        p_value: np.ndarray,
+        n_instances: int,
+        n_unique: int,
+        type: str = "model_comparison",
+        subtype: Optional[str] = "classification",
+        callargs: Optional[dict] = None,
+        **kwargs,
+    ):
+        """Digestible for comparing the performance of multiple models.
+
+        Args:
+            models (Sequence[str]): Names of models.
+            labels (Sequence[LT]): Names of labels.
+            metrics (Sequence[Dict[str, float]]): Accuracy and averaged metrics of each model.
+            disagreement (np.ndarray): Fraction of instances each pair of models predicts differently.
+            only_correct (np.ndarray): Number of instances only the row model (and not the column model) classifies
+                correctly.
+            p_value (np.ndarray): McNemar p-value of each pair of models.
+            n_instances (int): Number of instances.
+            n_unique (int): Number of unique instances (predicted by each model).
+            type (str, optional): Type description. Defaults to "model_comparison".
+            subtype (Optional[str], optional): Subtype description. Defaults to "classification".
+            callargs (Optional[dict], optional): Call arguments for reproducibility. Defaults to None.
+        """
+        super().__init__(type=type, subtype=subtype, callargs=callargs, renderer=Render, **kwargs)
+        self.models = list(models)
+        self.labels = labels
+        self.metrics = list(metrics)
+        self.disagreement = np.asarray(disagreement)
+        self.only_correct = np.asarray(only_correct)
+        self.p_value = np.asarray(p_value)
+        self.n_instances = n_instances
+        self.n_unique = n_unique
+
+    @property
+    def content(self):
+        """Content as dictionary."""
         return {
+            "models": self.models,
             "labels": self.labels,
-            "label_metrics": label_metrics,
-            "metrics": self._properties,
+            "metrics": dict(zip(self.models, self.metrics)),
+            "disagreement": self.disagreement.tolist(),
+            "mcnemar": {"only_correct": self.only_correct.tolist(), "p_value": self.p_value.tolist()},
+            "n_instances": self.n_instances,
+            "n_unique": self.n_unique,
+        }
+
+
+class Calibration(MetaInfo):
+    def __init__(
+        self,
+        labels: Sequence[LT],
+        calibration: dict,
+        n_bins: int,
+        n_instances: int,
+        type: str = "calibration",
+        subtype: Optional[str] = "classification",
+        callargs: Optional[dict] = None,
+        **kwargs,
+    ):
+        """Digestible for the calibration of predicted probabilities.
+
+        Args:
+            labels (Sequence[LT]): Names of labels.
+            calibration (dict): Calibration as returned from `explabox.examine.metrics.calibration()`.
+            n_bins (int): Number of equal-width probability bins.
+            n_instances (int): Number of instances.
+            type (str, optional): Type description. Defaults to "calibration".
+            subtype (Optional[str], optional): Subtype description. Defaults to "classification".
+            callargs (Optional[dict], optional): Call arguments for reproducibility. Defaults to None.
+        """
+        super().__init__(type=type, subtype=subtype, callargs=callargs, renderer=Render, **kwargs)
+        self.labels = labels
+        self.n_bins = n_bins
+        self.n_instances = n_instances
+        self._calibration = calibration
+        self._content = None
+
+    @staticmethod
+    def _curve(reliability: dict, i: Optional[int] = None) -> dict:
+        """Non-empty bins of a reliability curve."""
+        count, confidence, fraction_positive = (
+            reliability[k] if i is None else reliability[k][i] for k in ["count", "confidence", "fraction_positive"]
+        )
+        nonempty = count > 0
+        return {
+            "confidence": confidence[nonempty].tolist(),
+            "fraction_positive": fraction_positive[nonempty].tolist(),
+            "count": count[nonempty].tolist(),
+        }
+
+    @property
+    def ece(self) -> Dict[LT, float]:
+        """Expected calibration error of each label."""
+        return dict(zip(self.labels, self._calibration["labels"]["ece"].tolist()))
+
+    @property
+    def mce(self) -> Dict[LT, float]:
+        """Maximum calibration error of each label."""
+        return dict(zip(self.labels, self._calibration["labels"]["mce"].tolist()))
+
+    @property
+    def brier(self) -> float:
+        """Multi-class Brier score."""
+        return self._calibration["brier"]
+
+    @property
+    def content(self):
+        """Content as dictionary."""
+        if self._content is None:
+            labels, top_label = self._calibration["labels"], self._calibration["top_label"]
+            self._content = {
+                "labels": self.labels,
+                "n_bins": self.n_bins,
+                "n_instances": self.n_instances,
+                "brier": self.brier,
+                "label_calibration": [
+                    {
+                        "label": label,
+                        "ece": float(labels["ece"][i]),
+                        "mce": float(labels["mce"][i]),
+                        "brier": float(labels["brier"][i]),
+                        "curve": self._curve(labels, i),
+                    }
+                    for i, label in enumerate(self.labels)
+                ],
+                "top_label": {
+                    "ece": float(top_label["ece"]),
+                    "mce": float(top_label["mce"]),
+                    "curve": self._curve(top_label),
+                },
+            }
+        return self._content
+
+
+class Slices(MetaInfo):
+    def __init__(
+        self,
+        slices: List[dict],
+        accuracy: float,
+        n_instances: int,
+        n_candidates: int,
+        n_excluded: int = 0,
+        alpha: float = 0.05,
+        type: str = "slices",
+        subtype: Optional[str] = "classification",
+        callargs: Optional[dict] = None,
+        **kwargs,
+    ):
+        """Digestible for data slices where the model performs significantly worse.
+
+        Args:
+            slices (List[dict]): Ranked slices, each with their feature, value, size, accuracy and significance.
+            accuracy (float): Accuracy on the whole split.
+            n_instances (int): Number of instances in the split the slices are tested on.
+            n_candidates (int): Number of candidate slices tested.
+            n_excluded (int, optional): Number of instances left out, as their ground-truth or predicted labels are not
+                exactly one known label (e.g. multilabel instances). Defaults to 0.
+            alpha (float, optional): False discovery rate. Defaults to 0.05.
+            type (str, optional): Type description. Defaults to "slices".
+            subtype (Optional[str], optional): Subtype description. Defaults to "classification".
+            callargs (Optional[dict], optional): Call arguments for reproducibility. Defaults to None.
+        """
+        super().__init__(type=type, subtype=subtype, callargs=callargs, renderer=Render, **kwargs)
+        self.slices = slices
+        self.accuracy = accuracy
+        self.n_instances = n_instances
+        self.n_candidates = n_candidates
+        self.n_excluded = int(n_excluded)
+        self.alpha = alpha
+
+    @property
+    def content(self):
+        """Content as dictionary."""
+        return {
+            "slices": self.slices,
+            "accuracy": self.accuracy,
+            "n_instances": self.n_instances,
+            "n_candidates": self.n_candidates,
+            "n_excluded": self.n_excluded,
+            "alpha": self.alpha,
         }
 
 
@@ -103,39 +415,184 @@ class WronglyClassified(Instances):
         self,
         instances,
         contingency_table: Dict[Tuple[LT, LT], FrozenSet[KT]],
+        scores: Optional[Mapping[KT, float]] = None,
+        sort_by: Optional[str] = None,
+        top_k: Optional[int] = None,
+        page_size: Optional[int] = None,
+        page: int = 0,
         type: str = "wrongly_classified",
         callargs: Optional[dict] = None,
         **kwargs,
     ):
         """Digestible for wrongly classified instances
 
+        Instances are only resolved for the current page. Within each (ground-truth, predicted) cell, instances can be
+        ranked by a score (e.g. the confidence of the model in its wrong prediction), highest first.
+
+        Examples:
+            Show the second page of wrongly classified instances:
+
+            >>> wrongly_classified.page(1)
+
         Args:
             instances (_type_): Instances.
             contingency_table (Dict[Tuple[LT, LT], FrozenSet[KT]]): Classification contingency table as returned from
                 `instancelib.analysis.base.contingency_table()`.
+            scores (Optional[Mapping[KT, float]], optional): Score of each wrongly classified instance to rank by.
+                Defaults to None.
+            sort_by (Optional[str], optional): Name of the score. Defaults to None.
+            top_k (Optional[int], optional): Only keep the k highest scoring instances per cell. Defaults to None.
+            page_size (Optional[int], optional): Number of instances per cell on a page; if None all instances are on
+                a single page. Defaults to None.
+            page (int, optional): Current page. Defaults to 0.
             type (str, optional): Type description. Defaults to "wrongly_classified".
             callargs (Optional[dict], optional): Call arguments for reproducibility. Defaults to None.
         """
         super().__init__(instances=instances, type=type, subtype=None, callargs=callargs, renderer=Render, **kwargs)
-        self.__contingency_table = contingency_table
+        # Cells and the keys within them in a fixed order, so pages do not depend on the order of (frozen)sets
+        self._cells = [
+            (g, p, np.asarray(_sorted(contingency_table[g, p]))) for g, p in _sorted(contingency_table) if g != p
+        ]
+        self._scores = scores
+        self._ranked = {}
+        self.sort_by = sort_by
+        self.top_k = top_k
+        self.page_size = page_size
+        self._page = page
+        self._wrongly_classified = None
+
+    def _ranking(self, i: int) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """Keys (and scores) of cell `i`, ranked from highest to lowest score and limited to the top-k."""
+        if i not in self._ranked:
+            _, _, keys = self._cells[i]
+            if self._scores is None:
+                self._ranked[i] = keys[: self.top_k], None
+            else:
+                scores = np.fromiter((self._scores[k] for k in keys.tolist()), dtype=np.float64, count=len(keys))
+                if self.top_k is not None and self.top_k < len(keys):
+                    index = np.argpartition(-scores, self.top_k - 1)[: self.top_k]
+                    index = index[np.argsort(-scores[index], kind="stable")]
+                else:
+                    index = np.argsort(-scores, kind="stable")
+                self._ranked[i] = keys[index], scores[index]
+        return self._ranked[i]
+
+    @property
+    def n_pages(self) -> int:
+        """Number of pages."""
+        if self.page_size is None:
+            return 1
+        n = max((len(self._ranking(i)[0]) for i in range(len(self._cells))), default=0)
+        return max(1, -(-n // self.page_size))
+
+    def page(self, page: int) -> "WronglyClassified":
+        """Get a page of wrongly classified instances, sharing the ranking with this one.
+
+        Args:
+            page (int): Page number, starting at 0.
+
+        Raises:
+            ValueError: Page should be in range(n_pages).
+
+        Returns:
+            WronglyClassified: Wrongly classified instances on the page.
+        """
+        if not 0 <= page < self.n_pages:
+            raise ValueError(f"{page=} should be in range({self.n_pages})")
+        res = copy.copy(self)
+        res._page, res._wrongly_classified = page, None
+        return res
 
     @property
     def wrongly_classified(self):
         """Wrongly classified instances, grouped by their ground-truth value, predicted value and instances."""
-        return [
-            {
-                "ground_truth": g,
-                "predicted": p,
-                "instances": [self.instances.get(v_) for v_ in list(v)],
-            }
-            for (g, p), v in self.__contingency_table.items()
-            if g != p
-        ]
+        if self._wrongly_classified is None:
+            start = 0 if self.page_size is None else self._page * self.page_size
+            end = None if self.page_size is None else start + self.page_size
+            self._wrongly_classified = []
+            for i, (g, p, keys) in enumerate(self._cells):
+                ranked_keys, scores = self._ranking(i)
+                cell = {
+                    "ground_truth": g,
+                    "predicted": p,
+                    "instances": [self.instances.get(k) for k in ranked_keys[start:end].tolist()],
+                    "n": len(keys),
+                }
+                if scores is not None:
+                    cell[self.sort_by or "score"] = scores[start:end].tolist()
+                self._wrongly_classified.append(cell)
+        return self._wrongly_classified
 
     @property
     def content(self):
         """Content as dictionary."""
-        return {"wrongly_classified": self.wrongly_classified}
+        return {"wrongly_classified": self.wrongly_classified, "page": self._page, "n_pages": self.n_pages}
+
+
+class LabelIssues(Instances):
+    def __init__(
+        self,
+        instances,
+        labels: Sequence[LT],
+        keys: Sequence[KT],
+        given: np.ndarray,
+        suggested: np.ndarray,
+        self_confidence: np.ndarray,
+        joint: np.ndarray,
+        n_instances: int,
+        n_estimated: int,
+        n: Optional[int] = 50,
+        type: str = "label_issues",
+        callargs: Optional[dict] = None,
+        **kwargs,
+    ):
+        """Digestible for likely mislabelled instances.
+
+        Only the first `n` instances are resolved for the content; all label issues are kept in `keys`.
+
+        Args:
+            instances (_type_): Instances.
+            labels (Sequence[LT]): Names of labels.
+            keys (Sequence[KT]): Keys of the label issues, from most to least likely mislabelled.
+            given (np.ndarray): Given label code of each label issue.
+            suggested (np.ndarray): Suggested label code of each label issue.
+            self_confidence (np.ndarray): Predicted probability of the given label of each label issue.
+            joint (np.ndarray): Estimated joint distribution of given labels (rows) and true labels (columns).
+            n_instances (int): Number of instances in the split.
+            n_estimated (int): Estimated number of label issues in the split.
+            n (Optional[int], optional): Number of label issues in the content; if None it includes all of them.
+                Defaults to 50.
+            type (str, optional): Type description. Defaults to "label_issues".
+            callargs (Optional[dict], optional): Call arguments for reproducibility. Defaults to None.
+        """
+        super().__init__(instances=instances, type=type, subtype=None, callargs=callargs, renderer=Render, **kwargs)
+        self._labels = labels
+        self.keys = np.asarray(keys)
+        self.given = np.asarray(given)
+        self.suggested = np.asarray(suggested)
+        self.self_confidence = np.asarray(self_confidence)
+        self.joint = np.asarray(joint)
+        self.n_instances = n_instances
+        self.n_estimated = n_estimated
+        self.n = n
+
+    @property
+    def content(self):
+        """Content as dictionary."""
+        labels = list(self.labels)
+        return {
+            "labels": labels,
+            "label_issues": {
+                "instances": [self.instances.get(key) for key in self.keys[: self.n].tolist()],
+                "given": [labels[code] for code in self.given[: self.n].tolist()],
+                "suggested": [labels[code] for code in self.suggested[: self.n].tolist()],
+                "self_confidence": self.self_confidence[: self.n].tolist(),
+            },
+            "n_issues": len(self.keys),
+            "n_estimated": self.n_estimated,
+            "n_instances": self.n_instances,
+            "joint": self.joint.tolist(),
+        }
 
 
 class Dataset(MetaInfo):
@@ -177,7 +634,22 @@ class Dataset(MetaInfo):
         """
         super().__init__(type=type, subtype=subtype, callargs=callargs, renderer=Render, **kwargs)
         self._instances = instances
-        self._labels = [label if isinstance(label, frozenset) else frozenset({[label]}) for label in labels]
+        self._labelset, self._label_codes = _encode_labels(labels)
+        self._labels = self._data = self._keys = self._key_index = None
+
+    def _select(self, index) -> "Dataset":
+        """Select a subset by integer indices, re-using the encoded labels."""
+        index = np.asarray(index, dtype=int)
+        codes = self._label_codes[index]
+        keys = self.keys
+        dataset = Dataset(
+            instances=[self._instances[keys[i]] for i in index.tolist()],
+            labels=[],
+            type=self.type,
+            subtype=self.subtype,
+        )
+        dataset._labelset, dataset._label_codes = self._labelset, codes
+        return dataset
 
     @property
     def instances(self):
@@ -187,21 +659,44 @@ class Dataset(MetaInfo):
     @property
     def data(self):
         """Get data property."""
-        return (
-            list(self._instances.all_data())
-            if hasattr(self._instances, "all_data")
-            else [instance.data for instance in self._instances]
-        )
+        if self._data is None:
+            self._data = (
+                list(self._instances.all_data())
+                if hasattr(self._instances, "all_data")
+                else [instance.data for instance in self._instances]
+            )
+        return self._data
 
     @property
     def keys(self):
         """Get keys property"""
-        return list(self._instances) if hasattr(self._instances, "keys") else list(range(len(self._instances)))
+        if self._keys is None:
+            self._keys = (
+                list(self._instances) if hasattr(self._instances, "keys") else list(range(len(self._instances)))
+            )
+        return self._keys
 
     @property
     def labels(self):
         """Get labels property."""
-        return list(self._labels)
+        if self._labels is None:
+            self._labels = [self._labelset[code] for code in self._label_codes.tolist()]
+        return self._labels
+
+    @property
+    def label_codes(self) -> np.ndarray:
+        """Integer code of the label of each instance, indexing into `label_names`."""
+        return self._label_codes
+
+    @property
+    def label_names(self) -> List[FrozenSet[LT]]:
+        """Unique labels in the dataset, in the order of their code."""
+        return self._labelset
+
+    def _index_of_key(self, key) -> int:
+        if self._key_index is None:
+            self._key_index = {k: i for i, k in enumerate(self.keys)}
+        return self._key_index[key]
 
     @property
     def content(self):
@@ -221,23 +716,21 @@ class Dataset(MetaInfo):
         elif isinstance(index, slice):
             index = range(len(self.keys))[index]
 
-        return self.get_by_key(index) if all(i in self.keys for i in index) else self.get_by_index(index)
+        if self._key_index is None:
+            self._key_index = {k: i for i, k in enumerate(self.keys)}
+        return self.get_by_key(index) if all(i in self._key_index for i in index) else self.get_by_index(index)
 
     def get_by_index(self, index) -> "Dataset":
         """Get item(s) by integer index."""
         if isinstance(index, (int, str)):
             index = [index]
-        instances = [self._instances[self.keys[i]] for i in index]
-        labels = [self.labels[i] for i in index]
-        return Dataset(instances=instances, labels=labels, type=self.type, subtype=self.subtype)
+        return self._select(list(index))
 
     def get_by_key(self, index) -> "Dataset":
         """Get item(s) by key."""
         if isinstance(index, (int, str)):
             index = [index]
-        instances = [self._instances[i] for i in index]
-        labels = [self.labels[self.keys.index(i)] for i in index]
-        return Dataset(instances=instances, labels=labels, type=self.type, subtype=self.subtype)
+        return self._select([self._index_of_key(i) for i in index])
 
     def head(self, n: int = 10) -> "Dataset":
         """Get the first n elements in the dataset.
@@ -336,7 +829,9 @@ class Dataset(MetaInfo):
         if isinstance(indexer, (frozenset, str, int)):
             if not isinstance(indexer, frozenset):
                 indexer = frozenset([indexer])
-            return self.filter(lambda _, label: label == indexer)
+            if indexer not in self._labelset:
+                return self._select([])
+            return self._select(np.flatnonzero(self._label_codes == self._labelset.index(indexer)))
         elif isinstance(indexer, SequenceType):
             indexer = [i for i in indexer]
             if len(indexer) != len(self):
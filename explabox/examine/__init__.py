@@ -13,6 +13,16 @@
 
 """Calculate quantitative metrics on how the model performs, and examine where the model went wrong."""
 
-from .examiner import Examiner, Performance, WronglyClassified
+from .examiner import Calibration, Comparison, Examiner, LabelIssues, Performance, Slices, WronglyClassified
+from .metrics import ConfusionMatrix
 
-__all__ = ["Examiner", "Performance", "WronglyClassified"]
+__all__ = [
+    "Calibration",
+    "Comparison",
+    "ConfusionMatrix",
+    "Examiner",
+    "LabelIssues",
+    "Performance",
+    "Slices",
+    "WronglyClassified",
+]
@@ -13,15 +13,130 @@
 
 """Main Examiner class."""
 
-from typing import Optional
+import warnings
+from collections.abc import Sequence as SequenceType
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, FrozenSet, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
 
+import numpy as np
 from genbase import Readable, add_callargs
-from instancelib import AbstractClassifier, Environment, MemoryLabelProvider
-from instancelib.analysis.base import contingency_table, get_keys, label_metrics
+from instancelib import AbstractClassifier, Environment, InstanceProvider, MemoryLabelProvider
+from instancelib.instances.text import MemoryTextInstance
+from instancelib.machinelearning.base import InstanceInput
+from instancelib.typehints import KT, LT
 
-from ..digestibles import Performance, WronglyClassified
+from ..digestibles import Calibration, Comparison, LabelIssues, Performance, Slices, WronglyClassified
+from ..explain.text.terms import document_terms
 from ..ingestibles import Ingestible
 from ..mixins import IngestiblesMixin, ModelMixin
+from ..utils import MultipleReturn
+from .label_issues import find_label_issues
+from .metrics import (
+    ConfusionMatrix,
+    average_metrics,
+    bootstrap_metrics,
+    calibration,
+    confusion_matrix,
+    disagreement,
+    encode_labels,
+    mcnemar,
+    proportional_allocation,
+)
+from .slices import candidate_slices, length_buckets, rank_slices
+
+
+def _is_stream(split) -> bool:
+    """Whether `split` is a stream (iterable) of data instead of the name(s) of split(s)."""
+    if isinstance(split, str):
+        return False
+    if isinstance(split, SequenceType):
+        return not all(isinstance(s, str) for s in split)
+    return isinstance(split, Iterable)
+
+
+def _batches(stream: Iterable, batch_size: int) -> Iterator[list]:
+    """Group a stream of (text, label) pairs into batches, keeping batches that are already in the stream."""
+    batch = []
+    for item in stream:
+        if isinstance(item, tuple) and len(item) == 2 and isinstance(item[0], str):
+            batch.append(item)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        else:
+            if batch:
+                yield batch
+                batch = []
+            if len(item) > 0:
+                yield list(item)
+    if batch:
+        yield batch
+
+
+def _hash(data) -> int:
+    """Hash of instance data, to detect changes."""
+    try:
+        return hash(data)
+    except TypeError:
+        return hash(repr(data))
+
+
+class _EncodedSplit:
+    __slots__ = ("keys", "y_true", "y_pred", "confusion", "_versions", "_rows")
+
+    def __init__(self, n_labels: int):
+        """Label codes and confusion matrix of a split, updated incrementally as keys are added, changed or removed.
+
+        Args:
+            n_labels (int): Number of labels.
+        """
+        self.keys: List[KT] = []
+        self.y_true = np.empty(0, dtype=np.int64)
+        self.y_pred = np.empty(0, dtype=np.int64)
+        self.confusion = np.zeros((n_labels, n_labels), dtype=np.int64)
+        self._versions = np.empty(0, dtype=np.int64)
+        self._rows: Dict[KT, int] = {}
+
+    def update(self, keys: List[KT], versions: np.ndarray, encode: Callable) -> bool:
+        """Update to the current keys, only encoding keys that are new or have a changed version.
+
+        Args:
+            keys (List[KT]): Current keys of the split.
+            versions (np.ndarray): Version (hash of data and labels) of each key.
+            encode (Callable): Function giving the ground-truth and predicted label codes for indices into `keys`.
+
+        Returns:
+            bool: Whether anything changed.
+        """
+        n_labels = len(self.confusion)
+        rows = np.fromiter((self._rows.get(key, -1) for key in keys), dtype=np.int64, count=len(keys))
+        known = rows >= 0
+        stale = ~known
+        stale[known] = self._versions[rows[known]] != versions[known]
+        kept = np.zeros(len(self.keys), dtype=bool)
+        kept[rows[known & ~stale]] = True
+        if not stale.any() and kept.all() and len(keys) == len(self.keys):
+            if keys != self.keys:  # only the order changed
+                self.keys, self.y_true, self.y_pred, self._versions = (
+                    keys,
+                    self.y_true[rows],
+                    self.y_pred[rows],
+                    versions,
+                )
+                self._rows = {key: i for i, key in enumerate(keys)}
+            return False
+
+        # Remove counts of keys that were removed or changed, add counts of keys that were added or changed
+        self.confusion -= confusion_matrix(self.y_true[~kept], self.y_pred[~kept], n_labels)
+        stale_index = np.flatnonzero(stale)
+        y_true, y_pred = np.empty(len(keys), dtype=np.int64), np.empty(len(keys), dtype=np.int64)
+        y_true[~stale], y_pred[~stale] = self.y_true[rows[~stale]], self.y_pred[rows[~stale]]
+        y_true[stale_index], y_pred[stale_index] = encode(stale_index.tolist())
+        self.confusion += confusion_matrix(y_true[stale_index], y_pred[stale_index], n_labels)
+
+        self.keys, self.y_true, self.y_pred, self._versions = keys, y_true, y_pred, versions
+        self._rows = {key: i for i, key in enumerate(keys)}
+        return True
 
 
 class Examiner(Readable, ModelMixin, IngestiblesMixin):
@@ -60,72 +175,824 @@ class Examiner(Readable, ModelMixin, IngestiblesMixin):
         self.ingestibles = ingestibles
         self.check_requirements(["data", "model"])
         self.predictions = {}
-
-    def __predict(self, split):
+        self._predicted: Dict[KT, FrozenSet[LT]] = {}
+        self._proba_matrix: Optional[np.ndarray] = None
+        self._proba_rows: Dict[KT, int] = {}
+        self._hashes: Dict[KT, int] = {}
+        self._instances: Dict[KT, object] = {}
+        self._codes: Dict[Tuple[str, Tuple[LT, ...]], _EncodedSplit] = {}
+
+    def _get_splits(self, split: Union[str, Sequence[str]]) -> List[str]:
+        """Names of splits, where 'all' gives all splits in the ingestibles."""
+        if isinstance(split, str):
+            return self.splits if split == "all" else [split]
+        return list(split)
+
+    def __predict_proba(
+        self, instances: InstanceInput, model: Optional[AbstractClassifier] = None
+    ) -> Optional[np.ndarray]:
+        """Probability matrix (rows in the order of the instances), or None if the model does not provide them."""
+        model = self.model if model is None else model
+        try:
+            batches = [np.asarray(matrix, dtype=np.float64) for _, matrix in model.predict_proba_raw(instances)]
+        except NotImplementedError:
+            return None
+        return np.vstack(batches)
+
+    def __is_stale(self, key: KT, instance, hashes: Dict[KT, int]) -> bool:
+        """Whether a key was not predicted before or its data changed.
+
+        Only the data of new or replaced instances is hashed (and added to `hashes`), so unchanged keys cost a lookup.
+        """
+        if key in self._predicted and self._instances.get(key) is instance:
+            return False
+        hashes[key] = _hash(instance.data)
+        if key in self._predicted and self._hashes.get(key) == hashes[key]:
+            self._instances[key] = instance
+            return False
+        return True
+
+    def __predict_keys(self, keys: List[KT], hashes: Dict[KT, int], instances: Dict[KT, object]) -> None:
+        """Predict the given keys and cache their predictions with the hashes of their data."""
+        if not keys:
+            return
+        bucket = self.data.create_bucket(keys)
+        keys = list(bucket.key_list)
+        # Predictions are matched by position, as instance identifiers may differ from the keys in the provider
+        self._predicted.update(zip(keys, (labels for _, labels in self.model.predict(bucket))))
+        for key in keys:  # probabilities of changed data are predicted again when needed
+            self._proba_rows.pop(key, None)
+        self._hashes.update((key, hashes[key]) for key in keys)
+        self._instances.update((key, instances[key]) for key in keys)
+        self.__compact()
+
+    def __compact(self) -> None:
+        """Forget keys that were removed from the data, and drop unused rows once they outnumber the used ones."""
+        dataset = self.data.dataset
+        for cache in (self._predicted, self._hashes, self._instances, self._proba_rows):
+            for key in [key for key in cache if key not in dataset]:
+                del cache[key]
+        if self._proba_matrix is not None and len(self._proba_matrix) > 2 * len(self._proba_rows):
+            rows = np.fromiter(self._proba_rows.values(), dtype=np.int64, count=len(self._proba_rows))
+            self._proba_matrix = self._proba_matrix[rows]
+            self._proba_rows = dict(zip(self._proba_rows, range(len(rows))))
+
+    def __predict(self, *splits: str) -> Dict[str, InstanceProvider]:
+        """Predict the union of the splits once, only predicting keys that are new or whose data has changed.
+
+        Only the data of instances that are new or were replaced is hashed, so an unchanged split is not hashed again.
+        Hard labels are those of `model.predict()`. Class probabilities are only predicted (and cached) when they are
+        needed, see `__proba()`.
+        """
         if not self.is_classifier:
             raise NotImplementedError("Only supported for classifiers")
 
+        named_splits = {split: self.ingestibles.get_named_split(split, validate=True) for split in splits}
+
+        seen, hashes, stale, stale_splits = set(), {}, {}, set()
+        for split, named_split in named_splits.items():
+            for key in named_split.key_list:
+                if key not in seen:
+                    seen.add(key)
+                    instance = named_split[key]
+                    if self.__is_stale(key, instance, hashes):
+                        stale[key] = instance
+                if key in stale:
+                    stale_splits.add(split)
+        self.__predict_keys(list(stale), hashes, stale)
+
+        for split, named_split in named_splits.items():
+            if split in stale_splits or len(self.predictions.get(split, ())) != len(named_split):
+                self.predictions[split] = MemoryLabelProvider.from_tuples(
+                    [(key, self._predicted[key]) for key in named_split.key_list]
+                )
+        return named_splits
+
+    def __encode(self, split: str, labelset: List[LT]) -> "_EncodedSplit":
+        """Keys, ground-truth and predicted label codes and confusion matrix of a (predicted) split.
+
+        The codes and confusion matrix are updated incrementally for keys that were added, changed or removed.
+        """
+        cache_key = (split, tuple(labelset))
+        if cache_key not in self._codes:
+            self._codes[cache_key] = _EncodedSplit(len(labelset))
+        label_index = {label: i for i, label in enumerate(labelset)}
+        keys = list(self.ingestibles.get_named_split(split, validate=True).key_list)
+        ground_truth = [self.labels.get_labels(key) for key in keys]
+        self._codes[cache_key].update(
+            keys,
+            np.fromiter(
+                (hash((self._hashes.get(key), labels)) for key, labels in zip(keys, ground_truth)),
+                dtype=np.int64,
+                count=len(keys),
+            ),
+            lambda index: (
+                encode_labels((ground_truth[i] for i in index), label_index),
+                encode_labels((self._predicted[keys[i]] for i in index), label_index),
+            ),
+        )
+        return self._codes[cache_key]
+
+    def __approximate(
+        self,
+        split: str,
+        labelset: List[LT],
+        tolerance: float,
+        sample_size: int,
+        growth: float,
+        max_sample_size: Optional[int],
+        n_length_buckets: int,
+        n_resamples: int,
+        alpha: float,
+        n_jobs: int,
+        seed: Optional[int],
+    ) -> Tuple[np.ndarray, Tuple[Dict[str, np.ndarray], Dict[str, np.ndarray]], dict]:
+        """Estimate the confusion matrix of a split from a growing sample, stratified by label and length bucket.
+
+        The sample grows by `growth` each round, keeping the instances sampled before, until the bootstrap confidence
+        intervals of all averaged metrics are narrower than `tolerance` (half-width) or the sample size budget is spent.
+        Only sampled instances are predicted, and predictions are cached as for full splits.
+
+        Returns:
+            Tuple[np.ndarray, Tuple[Dict[str, np.ndarray], Dict[str, np.ndarray]], dict]: Estimated confusion matrix,
+                its bootstrap confidence intervals and a summary of the approximation.
+        """
         named_split = self.ingestibles.get_named_split(split, validate=True)
+        keys = list(named_split.key_list)
+        n_labels = len(labelset)
+        label_index = {label: i for i, label in enumerate(labelset)}
+        y_true = encode_labels((self.labels.get_labels(key) for key in keys), label_index)
+        instances = [named_split[key] for key in keys]
+        data = [instance.data for instance in instances]
+
+        # Strata are (ground-truth label, length bucket) pairs, with instances in a random order within each stratum
+        lengths = np.fromiter((len(str(d)) for d in data), dtype=np.int64, count=len(keys))
+        buckets, bucket_names = length_buckets(lengths, n_buckets=n_length_buckets) if keys else (lengths, [])
+        _, stratum = np.unique((y_true + 1) * max(len(bucket_names), 1) + buckets, return_inverse=True)
+        stratum = stratum.ravel()
+        stratum_sizes = np.bincount(stratum)
+        starts = np.cumsum(stratum_sizes) - stratum_sizes
+        order = np.random.default_rng(seed).permutation(len(keys))
+        order = order[np.argsort(stratum[order], kind="stable")]
+
+        budget = len(keys) if max_sample_size is None else min(max_sample_size, len(keys))
+        n, n_rounds, n_predictions = min(sample_size, budget), 0, 0
+        while True:
+            n_rounds += 1
+            sizes = proportional_allocation(stratum_sizes, n)
+            sample = np.concatenate([order[start:end] for start, end in zip(starts, starts + sizes)]).astype(int)
+            sample_keys = [keys[i] for i in sample.tolist()]
+            hashes, stale = {}, {}
+            for key, i in zip(sample_keys, sample.tolist()):
+                if self.__is_stale(key, instances[i], hashes):
+                    stale[key] = instances[i]
+            self.__predict_keys(list(stale), hashes, stale)
+            n_predictions += len(stale)
+
+            y_pred = encode_labels((self._predicted[key] for key in sample_keys), label_index)
+            valid = (y_true[sample] >= 0) & (y_pred >= 0)
+            n_excluded = int(len(sample) - valid.sum())
+            cells = (stratum[sample] * n_labels + y_true[sample]) * n_labels + y_pred
+            strata = np.bincount(cells[valid], minlength=len(stratum_sizes) * n_labels**2)
+            strata = strata.reshape(-1, n_labels, n_labels)
+            weights = stratum_sizes / np.maximum(sizes, 1)
+            intervals = bootstrap_metrics(
+                strata, n_resamples=n_resamples, alpha=alpha, n_jobs=n_jobs, seed=seed, weights=weights
+            )
+            half_width = max((float(hi - lo) / 2 for lo, hi in intervals[1].values()), default=0.0)
+            if half_width <= tolerance or n >= budget or len(sample) >= budget:
+                break
+            # Grow beyond the current sample, which may be larger than `n` because of the minimum size of each stratum
+            n = min(max(n + 1, int(np.ceil(n * growth)), len(sample) + 1), budget)
+
+        return (
+            np.einsum("s,sij->ij", weights, strata),
+            intervals,
+            {
+                "tolerance": tolerance,
+                "half_width": half_width,
+                "converged": half_width <= tolerance,
+                "n_rounds": n_rounds,
+                "n_sampled": len(sample),
+                "n_excluded": n_excluded,
+                "n_predictions": n_predictions,
+                "n_instances": len(keys),
+                "n_strata": len(stratum_sizes),
+            },
+        )
 
-        if split in self.predictions:
-            return named_split, self.predictions[split]
+    def __proba(self, split: str, keys: List[KT], labelset: List[LT]) -> np.ndarray:
+        """Cached probability matrix of a split, with rows in the order of `keys` and columns in that of `labelset`.
 
-        self.predictions[split] = MemoryLabelProvider.from_tuples(self.model.predict(named_split))
-        return named_split, self.predictions[split]
+        Probabilities of keys that were not predicted before (or whose data changed) are predicted once and cached.
+        """
+        missing = [key for key in dict.fromkeys(keys) if key not in self._proba_rows]
+        if missing:
+            self.__compact()
+            bucket = self.data.create_bucket(missing)
+            proba = self.__predict_proba(bucket)
+            if proba is None:
+                raise NotImplementedError("Only supported for models that provide class probabilities")
+            offset = 0 if self._proba_matrix is None else len(self._proba_matrix)
+            self._proba_matrix = proba if self._proba_matrix is None else np.vstack([self._proba_matrix, proba])
+            self._proba_rows.update(zip(bucket.key_list, range(offset, offset + len(proba))))
+        rows = np.fromiter((self._proba_rows[key] for key in keys), dtype=np.int64, count=len(keys))
+        columns = [self.model.get_label_column_index(label) for label in labelset]
+        return self._proba_matrix[np.ix_(rows, columns)]
 
     @add_callargs
-    def wrongly_classified(self, split: str = "test", **kwargs) -> WronglyClassified:
+    def wrongly_classified(
+        self,
+        split: str = "test",
+        sort_by: Optional[str] = None,
+        top_k: Optional[int] = None,
+        page_size: Optional[int] = 50,
+        **kwargs,
+    ) -> WronglyClassified:
         """Give all wrongly classified samples.
 
+        Instances are resolved lazily, one page at a time. They can be ranked by the confidence of the model (the
+        probability of the predicted label) or its margin (the difference between the two most probable labels), taken
+        from the cached probabilities.
+
+        Examples:
+            The 10 most confident mistakes for each combination of ground-truth and predicted label:
+
+            >>> examiner.wrongly_classified(split='test', sort_by='confidence', top_k=10)
+
+            Show the next page:
+
+            >>> examiner.wrongly_classified(split='test').page(1)
+
         Args:
             split (str, optional): Name of split. Defaults to 'test'.
+            sort_by (Optional[str], optional): Rank by 'confidence' or 'margin' (highest first); if None instances are
+                not ranked. Defaults to None.
+            top_k (Optional[int], optional): Only keep the first k instances for each combination of ground-truth and
+                predicted label. Defaults to None.
+            page_size (Optional[int], optional): Number of instances per combination on a page; if None all instances
+                are shown on one page. Defaults to 50.
+
+        Raises:
+            ValueError: Unknown sort_by.
 
         Returns:
             WronglyClassified: Wrongly classified examples in this  split.
         """
         callargs = kwargs.pop("__callargs__", None)
 
-        named_split, predictions = self.__predict(split)
-        ground_truth = MemoryLabelProvider.from_provider(self.labels, named_split)
+        if sort_by not in (None, "confidence", "margin"):
+            raise ValueError(f'Unknown {sort_by=}, choose from "confidence" or "margin"')
+
+        named_split = self.__predict(split)[split]
+        labelset = self.labelset
+        encoded = self.__encode(split, labelset)
+        keys, y_true, y_pred = encoded.keys, encoded.y_true, encoded.y_pred
+
+        # Group the indices of wrongly classified instances by their (ground-truth, predicted) pair
+        wrong = np.flatnonzero((y_true != y_pred) & (y_true >= 0) & (y_pred >= 0))
+        pairs = y_true[wrong] * len(labelset) + y_pred[wrong]
+        order = np.argsort(pairs, kind="stable")
+        unique_pairs, starts = np.unique(pairs[order], return_index=True)
+        wrong_keys = np.asarray(keys, dtype=object)[wrong]
+        table = {
+            (labelset[pair // len(labelset)], labelset[pair % len(labelset)]): frozenset(wrong_keys[indices].tolist())
+            for pair, indices in zip(unique_pairs.tolist(), np.split(order, starts[1:]))
+        }
+
+        scores = None
+        if sort_by is not None:
+            proba = self.__proba(split, [keys[i] for i in wrong.tolist()], labelset)
+            top_two = -np.sort(-proba, axis=1)[:, :2]
+            score = top_two[:, 0] if sort_by == "confidence" or proba.shape[1] < 2 else top_two[:, 0] - top_two[:, 1]
+            scores = dict(zip(wrong_keys.tolist(), score.tolist()))
 
         return WronglyClassified(
             named_split,
-            contingency_table=contingency_table(ground_truth, predictions, named_split),
+            contingency_table=table,
+            scores=scores,
+            sort_by=sort_by,
+            top_k=top_k,
+            page_size=page_size,
             callargs=callargs,
             **kwargs,
         )
 
     @add_callargs
-    def performance(self, split: str = "test", **kwargs) -> Performance:
+    def performance(
+        self,
+        split: Union[str, Sequence[str], Iterable, ConfusionMatrix] = "test",
+        confidence_intervals: bool = False,
+        n_resamples: int = 1000,
+        alpha: float = 0.05,
+        n_jobs: int = 1,
+        seed: Optional[int] = None,
+        batch_size: int = 200,
+        approximate: bool = False,
+        tolerance: float = 0.01,
+        sample_size: int = 1000,
+        growth: float = 2.0,
+        max_sample_size: Optional[int] = None,
+        n_length_buckets: int = 5,
+        **kwargs,
+    ) -> Union[Performance, MultipleReturn]:
         """Determine performance metrics, the amount of predictions for each label in the test set
         and the values for the confusion matrix for each label in the test set.
 
+        All metrics are derived from a single confusion matrix per split. When multiple splits are given, the model
+        predicts their union only once.
+
+        Examples:
+            Performance on the test set:
+
+            >>> examiner.performance(split='test')
+
+            Performance on the train and test set:
+
+            >>> examiner.performance(split=['train', 'test'])
+
+            Performance on all splits:
+
+            >>> examiner.performance(split='all')
+
+            Performance on the test set, with 95% bootstrap confidence intervals:
+
+            >>> examiner.performance(split='test', confidence_intervals=True, alpha=0.05, seed=0)
+
+            Performance on a stream of (text, label) pairs, evaluated in batches of 1000:
+
+            >>> examiner.performance(split=((text, label) for text, label in read_logs()), batch_size=1000)
+
+            Estimate the performance on a large test set, sampling until the 95% confidence intervals are within 0.01 of
+            the estimates, but predicting at most 50,000 instances:
+
+            >>> examiner.performance(split='test', approximate=True, tolerance=0.01, max_sample_size=50_000)
+
         Args:
-            split (str, optional): Split to calculate metrics on. Defaults to 'test'.
+            split (Union[str, Sequence[str], Iterable, ConfusionMatrix], optional): Split(s) to calculate metrics on,
+                'all' for all splits, a stream of (text, label) pairs (see `confusion_matrix()`) or an accumulated
+                confusion matrix. Defaults to 'test'.
+            confidence_intervals (bool, optional): Whether to include bootstrap confidence intervals for the metrics.
+                Defaults to False.
+            n_resamples (int, optional): Number of bootstrap resamples. Defaults to 1000.
+            alpha (float, optional): Significance level, giving `1 - alpha` confidence intervals. Defaults to 0.05.
+            n_jobs (int, optional): Number of processes for bootstrapping. Defaults to 1.
+            seed (Optional[int], optional): Seed for reproducibility of the confidence intervals; if None it takes a
+                random seed. Defaults to None.
+            batch_size (int, optional): Batch size when evaluating a stream. Defaults to 200.
+            approximate (bool, optional): Whether to estimate the metrics from a stratified sample (by ground-truth
+                label and length bucket) that grows until the confidence intervals are narrow enough, instead of
+                predicting the whole split. Defaults to False.
+            tolerance (float, optional): Maximum half-width of the confidence intervals of the averaged metrics when
+                approximating. Defaults to 0.01.
+            sample_size (int, optional): Initial sample size when approximating. Defaults to 1000.
+            growth (float, optional): Factor by which the sample grows each round when approximating. Defaults to 2.0.
+            max_sample_size (Optional[int], optional): Maximum sample size (the budget of predictions) when
+                approximating; if None the sample may grow to the whole split. Defaults to None.
+            n_length_buckets (int, optional): Maximum number of length buckets to stratify by when approximating.
+                Defaults to 5.
+
+        Raises:
+            ValueError: Invalid approximation arguments, or approximating a stream or confusion matrix.
 
         Returns:
-            Performance: Performance metrics of your model on the split.
+            Union[Performance, MultipleReturn]: Performance metrics of your model on the split, or for each split if
+                multiple splits are given.
         """
         callargs = kwargs.pop("__callargs__", None)
 
         if not self.is_classifier:
             raise NotImplementedError("Only supported for classifiers")
 
-        split, predictions = self.__predict(split)
-        performance = {
-            label: label_metrics(self.labels, predictions, get_keys(split), label) for label in self.labelset
-        }
+        if approximate:
+            if isinstance(split, ConfusionMatrix) or _is_stream(split):
+                raise ValueError("Approximation is only supported for named splits")
+            if tolerance <= 0.0:
+                raise ValueError(f"{tolerance=} should be > 0!")
+            if sample_size < 1:
+                raise ValueError(f"{sample_size=} should be >= 1!")
+            if growth <= 1.0:
+                raise ValueError(f"{growth=} should be > 1!")
+
+        def to_intervals(labelset, per_label, averages) -> dict:
+            return {
+                "alpha": alpha,
+                "n_resamples": n_resamples,
+                "label_metrics": {
+                    label: {m: v[:, i].tolist() for m, v in per_label.items()} for i, label in enumerate(labelset)
+                },
+                "averages": {m: v.tolist() for m, v in averages.items()},
+            }
+
+        approximations = {}
+        if isinstance(split, ConfusionMatrix) or _is_stream(split):
+            confusion = split if isinstance(split, ConfusionMatrix) else self.confusion_matrix(split, batch_size)
+            confusions = [(None, confusion.labels, confusion.matrix, confusion.n_skipped)]
+            if callargs is not None:
+                callargs = {k: v for k, v in callargs.items() if k != "split"}
+        else:
+            splits = self._get_splits(split)
+            labelset = self.labelset
+            confusions = []
+            if approximate:
+                for s in splits:
+                    confusion, intervals, approximations[s] = self.__approximate(
+                        s,
+                        labelset,
+                        tolerance=tolerance,
+                        sample_size=sample_size,
+                        growth=growth,
+                        max_sample_size=max_sample_size,
+                        n_length_buckets=n_length_buckets,
+                        n_resamples=n_resamples,
+                        alpha=alpha,
+                        n_jobs=n_jobs,
+                        seed=seed,
+                    )
+                    approximations[s]["confidence_intervals"] = to_intervals(labelset, *intervals)
+                    confusions.append((s, labelset, confusion, approximations[s]["n_excluded"]))
+            else:
+                self.__predict(*splits)
+                for s in splits:
+                    encoded = self.__encode(s, labelset)
+                    n_excluded = int(((encoded.y_true < 0) | (encoded.y_pred < 0)).sum())
+                    confusions.append((s, labelset, encoded.confusion.copy(), n_excluded))
+
+        performances = []
+        for s, labelset, confusion, n_excluded in confusions:
+            if n_excluded > 0:
+                warnings.warn(
+                    f"{n_excluded} instances{'' if s is None else f' of split {s!r}'} do not have exactly one known "
+                    "ground-truth and predicted label, and are excluded from the metrics (see `n_excluded`)."
+                )
+            split_callargs = dict(callargs, split=s) if callargs is not None and s is not None else callargs
+            approximation = approximations.get(s)
+            intervals = None
+            if approximation is not None:
+                intervals = approximation.pop("confidence_intervals")
+            elif confidence_intervals:
+                intervals = to_intervals(
+                    labelset,
+                    *bootstrap_metrics(confusion, n_resamples=n_resamples, alpha=alpha, n_jobs=n_jobs, seed=seed),
+                )
+            performances.append(
+                Performance(
+                    labels=labelset,
+                    confusion_matrix=confusion,
+                    confidence_intervals=intervals,
+                    approximation=approximation,
+                    n_excluded=n_excluded,
+                    callargs=split_callargs,
+                    **kwargs,
+                )
+            )
+
+        if isinstance(split, ConfusionMatrix) or _is_stream(split):
+            return performances[0]
+        if isinstance(split, str) and split == "all" or isinstance(split, SequenceType) and not isinstance(split, str):
+            return MultipleReturn(*performances)
+        return performances[0]
+
+    @add_callargs
+    def compare(
+        self,
+        models: Union[Sequence[AbstractClassifier], Dict[str, AbstractClassifier]],
+        split: str = "test",
+        n_jobs: Optional[int] = None,
+        **kwargs,
+    ) -> Comparison:
+        """Compare the performance of several models on the same split.
+
+        The split is read and its texts are deduplicated once, after which all models predict the unique texts
+        concurrently. Predictions of the Examiner's own model are taken from its cache.
+
+        Examples:
+            Compare two candidate models on the test set:
+
+            >>> examiner.compare({'baseline': baseline_model, 'candidate': candidate_model}, split='test')
+
+        Args:
+            models (Union[Sequence[AbstractClassifier], Dict[str, AbstractClassifier]]): Models to compare, optionally
+                with their names.
+            split (str, optional): Name of split. Defaults to 'test'.
+            n_jobs (Optional[int], optional): Number of models predicting concurrently; if None it runs all models
+                concurrently. Defaults to None.
+
+        Raises:
+            ValueError: At least two models are needed for a comparison.
+
+        Returns:
+            Comparison: Metrics of each model, their disagreement and the McNemar significance of their differences.
+        """
+        callargs = kwargs.pop("__callargs__", None)
+
+        if isinstance(models, dict):
+            names, models = [str(name) for name in models.keys()], list(models.values())
+        else:
+            models = list(models)
+            names = [str(getattr(model, "name", f"model_{i}")) for i, model in enumerate(models)]
+            if len(set(names)) != len(names):
+                names = [f"{i}: {name}" for i, name in enumerate(names)]
+        if len(models) < 2:
+            raise ValueError("At least two models are needed for a comparison.")
+        for model in models:
+            if "classifier" not in str(model.__class__).lower():
+                raise NotImplementedError("Only supported for classifiers")
+
+        labelset = self.labelset
+        label_index = {label: i for i, label in enumerate(labelset)}
+        named_split = self.ingestibles.get_named_split(split, validate=True)
+        keys = list(named_split.key_list)
+        y_true = encode_labels((self.labels.get_labels(key) for key in keys), label_index)
+
+        texts = {}
+        inverse = np.fromiter(
+            (texts.setdefault(named_split[key].data, len(texts)) for key in keys), dtype=np.int64, count=len(keys)
+        )
+        instances = [MemoryTextInstance(i, text, None) for text, i in texts.items()]
+
+        def predict(model: AbstractClassifier) -> np.ndarray:
+            if model is self.model:
+                self.__predict(split)
+                return self.__encode(split, labelset).y_pred
+            predictions = [labels for _, labels in model.predict(instances)]
+            return encode_labels(predictions, label_index)[inverse]
+
+        with ThreadPoolExecutor(max_workers=n_jobs or len(models)) as executor:
+            y_preds = np.stack(list(executor.map(predict, models)))
+
+        metrics = [
+            {k: float(v) for k, v in average_metrics(confusion_matrix(y_true, y_pred, len(labelset))).items()}
+            for y_pred in y_preds
+        ]
+        only_correct, p_value = mcnemar((y_preds == y_true) & (y_true >= 0))
+
+        return Comparison(
+            models=names,
+            labels=labelset,
+            metrics=metrics,
+            disagreement=disagreement(y_preds),
+            only_correct=only_correct,
+            p_value=p_value,
+            n_instances=len(keys),
+            n_unique=len(texts),
+            callargs=callargs,
+            **kwargs,
+        )
+
+    def confusion_matrix(self, stream: Iterable, batch_size: int = 200) -> ConfusionMatrix:
+        """Evaluate the model on a stream of (text, label) pairs in bounded memory.
+
+        The stream is predicted batch by batch, only keeping the confusion matrix accumulated so far. The resulting
+        confusion matrices of separately evaluated shards can be serialized (`to_dict()`) and merged (`+`).
 
-        return Performance(labels=self.labelset, metrics=performance, callargs=callargs, **kwargs)
+        Examples:
+            Evaluate on a generator reading a large file, and get the performance metrics:
+
+            >>> def read_logs():
+            ...     with open('logs.csv') as f:
+            ...         for line in f:
+            ...             text, label = line.rstrip().rsplit(',', 1)
+            ...             yield text, label
+            >>> cm = examiner.confusion_matrix(read_logs(), batch_size=1000)
+            >>> examiner.performance(split=cm)
+
+        Args:
+            stream (Iterable): Iterable of (text, label) pairs or of batches (sequences) of (text, label) pairs.
+            batch_size (int, optional): Number of pairs to predict at once, if the stream is not batched.
+                Defaults to 200.
+
+        Returns:
+            ConfusionMatrix: Confusion matrix for the labels of the model's ground-truth data.
+        """
+        if not self.is_classifier:
+            raise NotImplementedError("Only supported for classifiers")
+
+        labelset = self.labelset
+        confusion = ConfusionMatrix(labelset)
+        for batch in _batches(stream, batch_size):
+            texts, labels = zip(*batch)
+            instances = [MemoryTextInstance(i, text, None) for i, text in enumerate(texts)]
+            confusion.update_labels(labels, [labels for _, labels in self.model.predict(instances)])
+        return confusion
+
+    @add_callargs
+    def calibration(self, split: str = "test", n_bins: int = 10, **kwargs) -> Calibration:
+        """Calibration of the predicted probabilities: reliability curves, expected (ECE) and maximum (MCE) calibration
+        error and Brier score, for each label and for the top (predicted) label.
+
+        Examples:
+            Calibration on the test set with 15 bins:
+
+            >>> examiner.calibration(split='test', n_bins=15)
+
+        Args:
+            split (str, optional): Name of split. Defaults to 'test'.
+            n_bins (int, optional): Number of equal-width probability bins. Defaults to 10.
+
+        Raises:
+            ValueError: n_bins should be >= 1.
+
+        Returns:
+            Calibration: Calibration of the model on the split.
+        """
+        callargs = kwargs.pop("__callargs__", None)
+
+        if n_bins < 1:
+            raise ValueError(f"{n_bins=} should be >= 1!")
+
+        self.__predict(split)
+        labelset = self.labelset
+        encoded = self.__encode(split, labelset)
+        keys, y_true = encoded.keys, encoded.y_true
+        proba = self.__proba(split, keys, labelset)
+
+        return Calibration(
+            labels=labelset,
+            calibration=calibration(proba, y_true, n_bins=n_bins),
+            n_bins=n_bins,
+            n_instances=int((y_true >= 0).sum()),
+            callargs=callargs,
+            **kwargs,
+        )
+
+    @add_callargs
+    def label_issues(self, split: str = "train", n: Optional[int] = 50, **kwargs) -> LabelIssues:
+        """Find instances that are likely mislabelled, with confident learning on the predicted probabilities.
+
+        An instance is a label issue if its probability for another label than its given label is at least the average
+        probability of that other label over the instances given it. The label issues are ranked from the lowest to
+        the highest probability of their given label. All is computed from the cached probabilities, so once a split
+        is predicted no further model calls are made.
+
+        Examples:
+            Get the 100 most likely mislabelled instances in the train set:
+
+            >>> examiner.label_issues(split='train', n=100)
+
+        Args:
+            split (str, optional): Name of split. Defaults to 'train'.
+            n (Optional[int], optional): Number of label issues to show; if None it shows all. Defaults to 50.
+
+        Returns:
+            LabelIssues: Likely mislabelled instances, their suggested labels and the estimated joint distribution of
+                given and true labels.
+        """
+        callargs = kwargs.pop("__callargs__", None)
+
+        named_split = self.__predict(split)[split]
+        labelset = self.labelset
+        encoded = self.__encode(split, labelset)
+        keys, y_true = encoded.keys, encoded.y_true
+        issues = find_label_issues(self.__proba(split, keys, labelset), y_true)
+
+        return LabelIssues(
+            named_split,
+            labels=labelset,
+            keys=[keys[i] for i in issues["issues"].tolist()],
+            given=y_true[issues["issues"]],
+            suggested=issues["suggested"],
+            self_confidence=issues["self_confidence"],
+            joint=issues["joint"],
+            n_instances=len(keys),
+            n_estimated=issues["n_estimated"],
+            n=n,
+            callargs=callargs,
+            **kwargs,
+        )
+
+    def __term_matrix(self, split: str, keys: List[KT]):
+        """Instance×term count matrix (rows in the order of `keys`), terms and token lengths of a split.
+
+        The split is tokenized as in `slices.term_matrix()`, sharing its document-term matrix with the explainer.
+        """
+        named_split = self.ingestibles.get_named_split(split, validate=True)
+        rows = {key: row for row, key in enumerate(named_split.key_list)}
+        matrix = document_terms(named_split, lower=False, lowercase=False)
+        return matrix.count_matrix(np.asarray([rows[key] for key in keys], dtype=np.int64))
+
+    @add_callargs
+    def slices(
+        self,
+        split: str = "test",
+        metadata: Optional[Dict[str, Sequence]] = None,
+        min_size: int = 10,
+        max_terms: Optional[int] = 5000,
+        n_length_buckets: int = 5,
+        alpha: float = 0.05,
+        n: Optional[int] = 20,
+        **kwargs,
+    ) -> Slices:
+        """Find subgroups of instances (data slices) where the model performs significantly worse.
+
+        Candidate slices are all instances containing a term, instances in a length bucket, instances with a
+        ground-truth or predicted label and instances with a metadata value. Slices are tested with a one-sided
+        two-proportion z-test, corrected for multiple testing with the Benjamini-Hochberg procedure. Instances without
+        exactly one known ground-truth and predicted label are left out (with a warning).
+
+        Examples:
+            Find the 10 worst slices in the test set:
+
+            >>> examiner.slices(split='test', n=10)
+
+            Include a metadata column with the source of each instance:
+
+            >>> examiner.slices(split='test', metadata={'source': ['web', 'mail', 'web', ...]})
+
+        Args:
+            split (str, optional): Name of split. Defaults to 'test'.
+            metadata (Optional[Dict[str, Sequence]], optional): Metadata columns, with a value for each instance in the
+                split. Defaults to None.
+            min_size (int, optional): Minimum number of instances in a slice. Defaults to 10.
+            max_terms (Optional[int], optional): Maximum number of (most frequent) terms to consider as slices.
+                Defaults to 5000.
+            n_length_buckets (int, optional): Maximum number of tokenized length buckets. Defaults to 5.
+            alpha (float, optional): False discovery rate. Defaults to 0.05.
+            n (Optional[int], optional): Maximum number of slices to return; if None it returns all significant
+                slices. Defaults to 20.
+
+        Raises:
+            ValueError: Metadata columns should have a value for each instance in the split.
+
+        Returns:
+            Slices: Significantly underperforming slices, ranked from most to least significant.
+        """
+        callargs = kwargs.pop("__callargs__", None)
+
+        self.__predict(split)
+        labelset = self.labelset
+        encoded = self.__encode(split, labelset)
+        keys, y_true, y_pred = encoded.keys, encoded.y_true, encoded.y_pred
+        for column, values in (metadata or {}).items():
+            if len(values) != len(keys):
+                raise ValueError(f'Metadata column "{column}" has {len(values)} values, expected {len(keys)}')
+
+        X, terms, lengths = self.__term_matrix(split, keys)
+
+        # Leave out instances without exactly one known ground-truth and predicted label, as in `performance()`
+        valid = (y_true >= 0) & (y_pred >= 0)
+        n_excluded = int(len(keys) - valid.sum())
+        if n_excluded > 0:
+            warnings.warn(
+                f"{n_excluded} instances of split {split!r} do not have exactly one known ground-truth and predicted "
+                "label, and are excluded from the slices (see `n_excluded`)."
+            )
+            X, lengths, y_true, y_pred = X[valid], lengths[valid], y_true[valid], y_pred[valid]
+            metadata = {
+                column: [value for value, keep in zip(values, valid) if keep]
+                for column, values in (metadata or {}).items()
+            }
+
+        S, names = candidate_slices(
+            terms=(X, terms),
+            lengths=lengths,
+            labels={"ground_truth": (y_true, labelset), "predicted": (y_pred, labelset)},
+            metadata=metadata,
+            min_size=min_size,
+            max_terms=max_terms,
+            n_length_buckets=n_length_buckets,
+        )
+        errors = y_true != y_pred
+        ranking = rank_slices(S, errors, alpha=alpha)
+
+        significant = np.flatnonzero(ranking["significant"])
+        significant = significant[np.lexsort((-ranking["z"][significant], ranking["p_value"][significant]))][:n]
+        accuracy = 1.0 - float(errors.mean()) if len(errors) else 0.0
+        slices = [
+            {
+                "feature": names[i][0],
+                "value": names[i][1],
+                "size": int(ranking["size"][i]),
+                "accuracy": 1.0 - float(ranking["error_rate"][i]),
+                "difference": float(ranking["complement_error_rate"][i] - ranking["error_rate"][i]),
+                "z": float(ranking["z"][i]),
+                "p_value": float(ranking["p_value"][i]),
+                "q_value": float(ranking["q_value"][i]),
+            }
+            for i in significant.tolist()
+        ]
+
+        return Slices(
+            slices=slices,
+            accuracy=accuracy,
+            n_instances=len(errors),
+            n_candidates=len(names),
+            n_excluded=n_excluded,
+            alpha=alpha,
+            callargs=callargs,
+            **kwargs,
+        )
 
-    def __call__(self, split: str = "test", **kwargs) -> Performance:
+    def __call__(self, split: Union[str, Sequence[str]] = "test", **kwargs) -> Union[Performance, MultipleReturn]:
         """Determine performance metrics, the amount of predictions for each label in the test set
         and the values for the confusion matrix for each label in the test set.
 
         Args:
-            split (str, optional): Split to calculate metrics on. Defaults to 'test'.
+            split (Union[str, Sequence[str]], optional): Split(s) to calculate metrics on, or 'all' for all splits.
+                Defaults to 'test'.
 
         Returns:
-            Performance: Performance metrics of your model on the split.
+            Union[Performance, MultipleReturn]: Performance metrics of your model on the split, or for each split if
+                multiple splits are given.
         """
         return self.performance(split=split, **kwargs)
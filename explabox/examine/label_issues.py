@@ -0,0 +1,139 @@
+# Copyright (c) 2022 Marcel Robeer for National Police Lab AI (NPAI).
+#
+# This program is free software; you can redistribute it and/or modify it under the terms of the GNU Lesser General
+# Public License (LGPL) as published by the Free Software Foundation; either version 3 (LGPLv3) of the License, or (at
+# your option) any later version. You may not use this file except in compliance with the license. You may obtain a copy
+# of the license at:
+#
+#     https://www.gnu.org/licenses/lgpl-3.0.en.html
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+
+"""Find likely mislabelled instances with confident learning.
+
+An instance is confidently counted as belonging to label `j` if its predicted probability for `j` is at least the
+average probability of `j` over the instances given label `j` (the per-label threshold). Counting the given label
+against the confidently counted label gives the confident joint; its off-diagonal instances are the label issues.
+All steps operate on (chunks of) the probability matrix, without calling the model.
+"""
+
+from typing import Dict, Optional
+
+import numpy as np
+
+from .metrics import CHUNK_ELEMENTS
+from .slices import indicator_matrix
+
+
+def _chunks(n: int, n_labels: int, chunk_size: Optional[int]):
+    """Slices of rows holding about `CHUNK_ELEMENTS` probabilities each (or `chunk_size` rows)."""
+    if chunk_size is None:
+        chunk_size = max(1, CHUNK_ELEMENTS // max(n_labels, 1))
+    return (slice(start, start + chunk_size) for start in range(0, n, chunk_size))
+
+
+def label_thresholds(proba: np.ndarray, y_true: np.ndarray, chunk_size: Optional[int] = None) -> np.ndarray:
+    """Average predicted probability of each label over the instances given that label.
+
+    Args:
+        proba (np.ndarray): Probability matrix (instances × labels).
+        y_true (np.ndarray): Given label code of each instance (negative codes are skipped).
+        chunk_size (Optional[int], optional): Number of rows processed at once; if None it holds about `CHUNK_ELEMENTS`
+            probabilities at once. Defaults to None.
+
+    Returns:
+        np.ndarray: Threshold of each label (NaN for labels that are not given to any instance).
+    """
+    n_labels = proba.shape[1]
+    sums = np.zeros(n_labels)
+    for rows in _chunks(len(proba), n_labels, chunk_size):
+        sums += (indicator_matrix(y_true[rows], n_labels).T @ proba[rows]).diagonal()
+    counts = np.bincount(y_true[y_true >= 0], minlength=n_labels)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return sums / counts
+
+
+def confident_labels(proba: np.ndarray, thresholds: np.ndarray, chunk_size: Optional[int] = None) -> np.ndarray:
+    """Most probable label among the labels whose threshold each instance meets.
+
+    Args:
+        proba (np.ndarray): Probability matrix (instances × labels).
+        thresholds (np.ndarray): Threshold of each label.
+        chunk_size (Optional[int], optional): Number of rows processed at once; if None it holds about `CHUNK_ELEMENTS`
+            probabilities at once. Defaults to None.
+
+    Returns:
+        np.ndarray: Confidently counted label code of each instance, or -1 if it meets no threshold.
+    """
+    n_labels = proba.shape[1]
+    labels = np.full(len(proba), -1, dtype=np.int64)
+    for rows in _chunks(len(proba), n_labels, chunk_size):
+        above = proba[rows] >= thresholds  # NaN thresholds are never met
+        labels[rows] = np.where(above.any(axis=1), np.argmax(np.where(above, proba[rows], -np.inf), axis=1), -1)
+    return labels
+
+
+def calibrate_joint(confident_joint: np.ndarray, label_counts: np.ndarray) -> np.ndarray:
+    """Estimate the joint distribution of given and true labels from the confident joint.
+
+    Each row is rescaled to the number of instances given that label, after which the matrix is normalized to sum to 1.
+
+    Args:
+        confident_joint (np.ndarray): Confident joint (rows are given labels, columns are confidently counted labels).
+        label_counts (np.ndarray): Number of instances given each label.
+
+    Returns:
+        np.ndarray: Estimated joint distribution.
+    """
+    row_sums = confident_joint.sum(axis=1, keepdims=True)
+    calibrated = np.divide(
+        confident_joint * label_counts[:, np.newaxis],
+        row_sums,
+        out=np.zeros(confident_joint.shape),
+        where=row_sums > 0,
+    )
+    total = calibrated.sum()
+    return calibrated / total if total > 0 else calibrated
+
+
+def find_label_issues(proba: np.ndarray, y_true: np.ndarray, chunk_size: Optional[int] = None) -> Dict[str, np.ndarray]:
+    """Find instances whose given label is likely wrong, ranked from least to most self-confident.
+
+    Args:
+        proba (np.ndarray): Probability matrix (instances × labels).
+        y_true (np.ndarray): Given label code of each instance (negative codes are skipped).
+        chunk_size (Optional[int], optional): Number of rows processed at once; if None it holds about `CHUNK_ELEMENTS`
+            probabilities at once. Defaults to None.
+
+    Returns:
+        Dict[str, np.ndarray]: Indices of the label issues (`issues`), their suggested label codes (`suggested`), the
+            probability of their given label (`self_confidence`), the per-label `thresholds`, the `confident_joint`, the
+            estimated `joint` distribution of given and true labels and the estimated number of label issues
+            (`n_estimated`).
+    """
+    proba, y_true = np.asarray(proba), np.asarray(y_true, dtype=np.int64)
+    n_labels = proba.shape[1]
+    valid = y_true >= 0
+
+    thresholds = label_thresholds(proba, y_true, chunk_size=chunk_size)
+    confident = confident_labels(proba, thresholds, chunk_size=chunk_size)
+    counted = valid & (confident >= 0)
+    confident_joint = np.bincount(
+        y_true[counted] * n_labels + confident[counted], minlength=n_labels * n_labels
+    ).reshape(n_labels, n_labels)
+    joint = calibrate_joint(confident_joint, np.bincount(y_true[valid], minlength=n_labels))
+
+    issues = np.flatnonzero(counted & (confident != y_true))
+    self_confidence = proba[issues, y_true[issues]]
+    order = np.argsort(self_confidence, kind="stable")
+    return {
+        "issues": issues[order],
+        "suggested": confident[issues[order]],
+        "self_confidence": self_confidence[order],
+        "thresholds": thresholds,
+        "confident_joint": confident_joint,
+        "joint": joint,
+        "n_estimated": int(round(valid.sum() * (joint.sum() - np.trace(joint)))),
+    }
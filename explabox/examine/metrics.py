@@ -0,0 +1,504 @@
+# Copyright (c) 2022 Marcel Robeer for National Police Lab AI (NPAI).
+#
+# This program is free software; you can redistribute it and/or modify it under the terms of the GNU Lesser General
+# Public License (LGPL) as published by the Free Software Foundation; either version 3 (LGPLv3) of the License, or (at
+# your option) any later version. You may not use this file except in compliance with the license. You may obtain a copy
+# of the license at:
+#
+#     https://www.gnu.org/licenses/lgpl-3.0.en.html
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+
+"""Vectorized classification metrics, derived from integer-coded confusion matrices.
+
+All metric functions accept a confusion matrix of shape `(n_labels, n_labels)` (rows are ground-truth labels, columns
+are predicted labels), or a stack of confusion matrices of shape `(..., n_labels, n_labels)`.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, FrozenSet, Iterable, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+from instancelib.typehints import LT
+
+AVERAGES = ["macro", "micro", "weighted"]
+RATE_METRICS = ["accuracy", "precision", "recall", "f1", "wss"]
+CHUNK_ELEMENTS = 2**22
+BOOTSTRAP_BLOCK = 25
+
+
+def encode_labels(labelings: Iterable[FrozenSet[LT]], label_index: Mapping[LT, int]) -> np.ndarray:
+    """Encode labelings (sets of labels) into integer label codes.
+
+    Args:
+        labelings (Iterable[FrozenSet[LT]]): Label set of each instance.
+        label_index (Mapping[LT, int]): Code of each label.
+
+    Returns:
+        np.ndarray: Code for each instance, or -1 if it does not have exactly one known label.
+    """
+    return np.fromiter(
+        (label_index.get(next(iter(labeling)), -1) if len(labeling) == 1 else -1 for labeling in labelings),
+        dtype=np.int64,
+    )
+
+
+def confusion_matrix(y_true: np.ndarray, y_pred: np.ndarray, n_labels: int) -> np.ndarray:
+    """Count the (ground-truth, predicted) label code pairs.
+
+    Args:
+        y_true (np.ndarray): Ground-truth label codes.
+        y_pred (np.ndarray): Predicted label codes.
+        n_labels (int): Number of labels.
+
+    Returns:
+        np.ndarray: Confusion matrix of shape `(n_labels, n_labels)`. Pairs with a negative code are skipped.
+    """
+    y_true, y_pred = np.asarray(y_true, dtype=np.int64), np.asarray(y_pred, dtype=np.int64)
+    valid = (y_true >= 0) & (y_pred >= 0)
+    return np.bincount(y_true[valid] * n_labels + y_pred[valid], minlength=n_labels * n_labels).reshape(
+        n_labels, n_labels
+    )
+
+
+def _divide(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Divide `a` by `b`, defaulting to 0.0 where `b` is zero."""
+    return np.divide(a, b, out=np.zeros(np.broadcast(a, b).shape, dtype=np.float64), where=b != 0)
+
+
+def label_metrics(confusion: np.ndarray) -> Dict[str, np.ndarray]:
+    """One-vs-rest metrics for each label.
+
+    Args:
+        confusion (np.ndarray): Confusion matrix (or a stack of confusion matrices).
+
+    Returns:
+        Dict[str, np.ndarray]: Metric name and its values of shape `(..., n_labels)`.
+    """
+    confusion = np.asarray(confusion)
+    n = confusion.sum(axis=(-2, -1))[..., np.newaxis]
+    tp = np.diagonal(confusion, axis1=-2, axis2=-1)
+    fp = confusion.sum(axis=-2) - tp
+    fn = confusion.sum(axis=-1) - tp
+    tn = n - tp - fp - fn
+
+    precision = _divide(tp, tp + fp)
+    recall = _divide(tp, tp + fn)
+    return {
+        "accuracy": _divide(tp + tn, n),
+        "precision": precision,
+        "recall": recall,
+        "f1": _divide(2 * precision * recall, precision + recall),
+        "true_positives": tp,
+        "false_positives": fp,
+        "true_negatives": tn,
+        "false_negatives": fn,
+        "wss": _divide(tn + fn, n) - (1.0 - recall),
+    }
+
+
+def average_metrics(confusion: np.ndarray) -> Dict[str, np.ndarray]:
+    """Accuracy and macro-, micro- and weighted-averaged precision, recall and F1-score.
+
+    Args:
+        confusion (np.ndarray): Confusion matrix (or a stack of confusion matrices).
+
+    Returns:
+        Dict[str, np.ndarray]: Metric name (e.g. 'accuracy', 'macro_f1', 'weighted_recall') and its value(s).
+    """
+    confusion = np.asarray(confusion)
+    per_label = label_metrics(confusion)
+    tp, fp, fn = per_label["true_positives"], per_label["false_positives"], per_label["false_negatives"]
+    support = tp + fn
+    total = support.sum(axis=-1)
+
+    micro_precision = _divide(tp.sum(axis=-1), (tp + fp).sum(axis=-1))
+    micro_recall = _divide(tp.sum(axis=-1), total)
+
+    res = {"accuracy": _divide(tp.sum(axis=-1), confusion.sum(axis=(-2, -1)))}
+    for metric in ["precision", "recall", "f1"]:
+        res[f"macro_{metric}"] = per_label[metric].mean(axis=-1)
+    res["micro_precision"] = micro_precision
+    res["micro_recall"] = micro_recall
+    res["micro_f1"] = _divide(2 * micro_precision * micro_recall, micro_precision + micro_recall)
+    for metric in ["precision", "recall", "f1"]:
+        res[f"weighted_{metric}"] = _divide((per_label[metric] * support).sum(axis=-1), total)
+    return res
+
+
+def _bootstrap_chunk(
+    args: Tuple[np.ndarray, np.ndarray, Sequence[int], Sequence[np.random.SeedSequence]],
+) -> Dict[str, np.ndarray]:
+    """Label metrics and average metrics of one chunk of bootstrap resamples, resampling each stratum separately.
+
+    The chunk consists of blocks of resamples, each drawn with its own seed.
+    """
+    strata, weights, sizes, seed_sequences = args
+    resamples = np.zeros((sum(sizes),) + strata.shape[1:])
+    stop = 0
+    for size, seed_sequence in zip(sizes, seed_sequences):
+        rng = np.random.default_rng(seed_sequence)
+        start, stop = stop, stop + size
+        block = resamples[start:stop]
+        for confusion, weight in zip(strata, weights):
+            n = int(confusion.sum())
+            if n > 0:
+                block += weight * rng.multinomial(n, confusion.ravel() / n, size=size).reshape(block.shape)
+    per_label = label_metrics(resamples)
+    res = {f"label_{m}": per_label[m] for m in RATE_METRICS}
+    res.update(average_metrics(resamples))
+    return res
+
+
+def bootstrap_metrics(
+    confusion: np.ndarray,
+    n_resamples: int = 1000,
+    alpha: float = 0.05,
+    chunk_size: Optional[int] = None,
+    n_jobs: int = 1,
+    seed: Optional[int] = None,
+    weights: Optional[np.ndarray] = None,
+) -> Tuple[Dict[str, np.ndarray], Dict[str, np.ndarray]]:
+    """Percentile bootstrap confidence intervals for the label metrics and average metrics.
+
+    Resampling the instances with replacement is equivalent to drawing the cells of the confusion matrix from a
+    multinomial distribution, so each resample costs `O(n_labels ** 2)` regardless of the number of instances.
+
+    For a stratified sample, each stratum is resampled separately and its confusion matrix is scaled by its weight
+    (the number of instances each sampled instance represents) before summing the strata.
+
+    Resamples are drawn in blocks of `BOOTSTRAP_BLOCK`, each with a seed spawned from `seed`, so the intervals only
+    depend on the seed and not on `chunk_size` or `n_jobs`.
+
+    Args:
+        confusion (np.ndarray): Confusion matrix, or a confusion matrix per stratum (shape
+            `(n_strata, n_labels, n_labels)`) if `weights` are given.
+        n_resamples (int, optional): Number of bootstrap resamples. Defaults to 1000.
+        alpha (float, optional): Significance level, giving `1 - alpha` confidence intervals. Defaults to 0.05.
+        chunk_size (Optional[int], optional): Maximum number of resamples held in memory at once (in whole blocks, at
+            least one); if None it bounds each chunk to about `CHUNK_ELEMENTS` confusion matrix cells. Defaults to None.
+        n_jobs (int, optional): Number of processes to compute the chunks in; if more than 1, the resamples are split
+            into at least `n_jobs` chunks (if there are that many blocks). Defaults to 1.
+        seed (Optional[int], optional): Seed for reproducibility; if None it takes a random seed. Defaults to None.
+        weights (Optional[np.ndarray], optional): Weight of each stratum; if None `confusion` is a single confusion
+            matrix. Defaults to None.
+
+    Raises:
+        ValueError: Invalid `n_resamples`, `alpha`, `chunk_size` or `weights`.
+
+    Returns:
+        Tuple[Dict[str, np.ndarray], Dict[str, np.ndarray]]: Lower and upper bound of each rate metric per label
+            (shape `(2, n_labels)`) and of each average metric (shape `(2,)`).
+    """
+    if n_resamples < 1:
+        raise ValueError(f"{n_resamples=} should be >= 1!")
+    if not 0.0 < alpha < 1.0:
+        raise ValueError(f"{alpha=} should be between 0 and 1!")
+
+    confusion = np.asarray(confusion, dtype=np.int64)
+    if weights is None:
+        strata, weights = confusion[np.newaxis], np.ones(1)
+    else:
+        strata, weights = confusion, np.asarray(weights, dtype=np.float64)
+        if strata.ndim != 3 or len(weights) != len(strata):
+            raise ValueError(f"Expected a weight for each of the {len(strata)} strata, got {len(weights)}")
+    if chunk_size is None:
+        chunk_size = max(1, CHUNK_ELEMENTS // strata[0].size)
+    if chunk_size < 1:
+        raise ValueError(f"{chunk_size=} should be >= 1!")
+    if strata.sum() == 0:
+        zeros = np.zeros((2, strata.shape[-1]))
+        return {m: zeros for m in RATE_METRICS}, {m: np.zeros(2) for m in average_metrics(strata[0])}
+
+    sizes = [min(BOOTSTRAP_BLOCK, n_resamples - start) for start in range(0, n_resamples, BOOTSTRAP_BLOCK)]
+    seed_sequences = np.random.SeedSequence(seed).spawn(len(sizes))
+    blocks_per_chunk = max(1, chunk_size // BOOTSTRAP_BLOCK)
+    if n_jobs > 1:
+        blocks_per_chunk = min(blocks_per_chunk, int(np.ceil(len(sizes) / n_jobs)))
+    chunks = []
+    for i in range(0, len(sizes), blocks_per_chunk):
+        j = i + blocks_per_chunk
+        chunks.append((strata, weights, sizes[i:j], seed_sequences[i:j]))
+
+    if n_jobs > 1 and len(chunks) > 1:
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            results = list(executor.map(_bootstrap_chunk, chunks))
+    else:
+        results = [_bootstrap_chunk(chunk) for chunk in chunks]
+
+    bounds = {
+        k: np.quantile(np.concatenate([r[k] for r in results]), [alpha / 2, 1.0 - alpha / 2], axis=0)
+        for k in results[0]
+    }
+    per_label = {m: bounds.pop(f"label_{m}") for m in RATE_METRICS}
+    return per_label, bounds
+
+
+def proportional_allocation(stratum_sizes: np.ndarray, n: int, minimum: int = 2) -> np.ndarray:
+    """Number of instances to sample from each stratum, proportional to its size.
+
+    Sizes are rounded with the largest remainder method, so they add up to exactly `n` (at most the number of
+    instances), unless the minimum sizes of the strata already add up to more.
+
+    Args:
+        stratum_sizes (np.ndarray): Number of instances in each stratum.
+        n (int): Total sample size.
+        minimum (int, optional): Minimum sample size of each stratum (if it has that many instances), so that every
+            stratum is represented. Defaults to 2.
+
+    Returns:
+        np.ndarray: Sample size of each stratum.
+    """
+    stratum_sizes = np.asarray(stratum_sizes, dtype=np.int64)
+    total = stratum_sizes.sum()
+    if total == 0:
+        return np.zeros_like(stratum_sizes)
+    n = min(max(int(n), 0), int(total))
+    quota = n * stratum_sizes / total
+    lower = np.minimum(minimum, stratum_sizes)
+    allocation = np.maximum(np.floor(quota).astype(np.int64), lower)
+    remainder = quota - allocation
+
+    # Too few: one more for the strata with the largest remainders (these are below their quota, so below their size)
+    deficit = n - int(allocation.sum())
+    if deficit > 0:
+        allocation[np.argsort(-remainder, kind="stable")[:deficit]] += 1
+    # Too many (because of the minimum): one less for the strata furthest above their quota, down to their minimum
+    for _ in range(-deficit):
+        reducible = np.flatnonzero(allocation > lower)
+        if len(reducible) == 0:
+            break
+        i = reducible[np.argmin(remainder[reducible])]
+        allocation[i] -= 1
+        remainder[i] += 1
+    return allocation
+
+
+def reliability(confidence: np.ndarray, outcome: np.ndarray, n_bins: int = 10) -> Dict[str, np.ndarray]:
+    """Reliability curves and expected/maximum calibration error, with equal-width confidence bins.
+
+    Args:
+        confidence (np.ndarray): Predicted probability of shape `(n_instances, n_curves)`.
+        outcome (np.ndarray): Whether the event happened (e.g. the instance has the label), of the same shape.
+        n_bins (int, optional): Number of bins. Defaults to 10.
+
+    Returns:
+        Dict[str, np.ndarray]: Number of instances, mean confidence and fraction of positives in each bin (shape
+            `(n_curves, n_bins)`) and the expected (ECE) and maximum (MCE) calibration error of each curve.
+    """
+    confidence, outcome = np.asarray(confidence, dtype=np.float64), np.asarray(outcome, dtype=np.float64)
+    n, n_curves = confidence.shape
+    bins = np.clip((confidence * n_bins).astype(np.int64), 0, n_bins - 1)
+    flat = (bins + np.arange(n_curves) * n_bins).ravel()
+
+    def binned_sum(weights=None):
+        return np.bincount(flat, weights=weights, minlength=n_curves * n_bins).reshape(n_curves, n_bins)
+
+    count = binned_sum()
+    mean_confidence = _divide(binned_sum(confidence.ravel()), count)
+    fraction_positive = _divide(binned_sum(outcome.ravel()), count)
+    gap = np.abs(fraction_positive - mean_confidence)
+    return {
+        "count": count,
+        "confidence": mean_confidence,
+        "fraction_positive": fraction_positive,
+        "ece": _divide((count * gap).sum(axis=-1), np.full(n_curves, n)),
+        "mce": np.where(count > 0, gap, 0.0).max(axis=-1),
+    }
+
+
+def calibration(proba: np.ndarray, y_true: np.ndarray, n_bins: int = 10) -> dict:
+    """Calibration of predicted probabilities, one-vs-rest for each label and for the top (predicted) label.
+
+    Args:
+        proba (np.ndarray): Probability matrix of shape `(n_instances, n_labels)`.
+        y_true (np.ndarray): Ground-truth label codes; instances with a negative code are skipped.
+        n_bins (int, optional): Number of equal-width bins. Defaults to 10.
+
+    Returns:
+        dict: Reliability of each label ('labels', including the Brier score of each label), of the top label
+            ('top_label') and the multi-class Brier score ('brier').
+    """
+    y_true = np.asarray(y_true)
+    valid = y_true >= 0
+    proba, y_true = np.asarray(proba, dtype=np.float64)[valid], y_true[valid]
+    outcome = (y_true[:, np.newaxis] == np.arange(proba.shape[1])).astype(np.float64)
+
+    labels = reliability(proba, outcome, n_bins=n_bins)
+    labels["brier"] = ((proba - outcome) ** 2).mean(axis=0) if len(proba) else np.zeros(proba.shape[1])
+
+    top_label = np.argmax(proba, axis=1)
+    top = reliability(
+        proba[np.arange(len(proba)), top_label][:, np.newaxis],
+        (top_label == y_true)[:, np.newaxis],
+        n_bins=n_bins,
+    )
+    brier = float(((proba - outcome) ** 2).sum(axis=1).mean()) if len(proba) else 0.0
+    return {"labels": labels, "top_label": {k: v[0] for k, v in top.items()}, "brier": brier}
+
+
+class ConfusionMatrix:
+    def __init__(self, labels: Sequence[LT], matrix: Optional[np.ndarray] = None, n_skipped: int = 0):
+        """Confusion matrix that can be accumulated over batches of predictions, merged and serialized.
+
+        Examples:
+            Accumulate over batches:
+
+            >>> cm = ConfusionMatrix(labels=['negative', 'positive'])
+            >>> cm.update_labels(['negative', 'positive'], ['positive', 'positive'])
+            >>> cm.update_labels(['positive'], ['positive'])
+
+            Merge shards that were computed separately:
+
+            >>> cm = ConfusionMatrix.from_dict(shard_1) + ConfusionMatrix.from_dict(shard_2)
+
+        Args:
+            labels (Sequence[LT]): Names of labels, in the order of the rows and columns.
+            matrix (Optional[np.ndarray], optional): Initial counts, with ground-truth labels as rows and predicted
+                labels as columns. Defaults to None.
+            n_skipped (int, optional): Number of pairs skipped so far, as they have no single known label.
+                Defaults to 0.
+
+        Raises:
+            ValueError: The matrix should be square with a row and column for each label.
+        """
+        self.labels = list(labels)
+        n_labels = len(self.labels)
+        self.matrix = (
+            np.zeros((n_labels, n_labels), dtype=np.int64) if matrix is None else np.array(matrix, dtype=np.int64)
+        )
+        if self.matrix.shape != (n_labels, n_labels):
+            raise ValueError(f"Matrix should have shape {(n_labels, n_labels)}, but has shape {self.matrix.shape}")
+        self.n_skipped = int(n_skipped)
+
+    @property
+    def n(self) -> int:
+        """Number of (ground-truth, predicted) pairs counted."""
+        return int(self.matrix.sum())
+
+    def update(self, y_true: np.ndarray, y_pred: np.ndarray) -> "ConfusionMatrix":
+        """Count a batch of (ground-truth, predicted) label code pairs, in place.
+
+        Args:
+            y_true (np.ndarray): Ground-truth label codes (indices into `labels`).
+            y_pred (np.ndarray): Predicted label codes (indices into `labels`).
+
+        Returns:
+            ConfusionMatrix: Itself.
+        """
+        y_true, y_pred = np.asarray(y_true), np.asarray(y_pred)
+        self.matrix += confusion_matrix(y_true, y_pred, len(self.labels))
+        self.n_skipped += int(((y_true < 0) | (y_pred < 0)).sum())
+        return self
+
+    def update_labels(self, y_true: Iterable[LT], y_pred: Iterable[LT]) -> "ConfusionMatrix":
+        """Count a batch of (ground-truth, predicted) labels or label sets, in place.
+
+        Args:
+            y_true (Iterable[LT]): Ground-truth labels.
+            y_pred (Iterable[LT]): Predicted labels.
+
+        Returns:
+            ConfusionMatrix: Itself.
+        """
+        label_index = {label: i for i, label in enumerate(self.labels)}
+        return self.update(
+            encode_labels(_as_labelsets(y_true), label_index), encode_labels(_as_labelsets(y_pred), label_index)
+        )
+
+    def merge(self, other: "ConfusionMatrix") -> "ConfusionMatrix":
+        """Combine the counts of two confusion matrices, taking the union of their labels.
+
+        Args:
+            other (ConfusionMatrix): Confusion matrix to merge with.
+
+        Returns:
+            ConfusionMatrix: New confusion matrix with the summed counts.
+        """
+        labels = self.labels + [label for label in other.labels if label not in self.labels]
+        index = {label: i for i, label in enumerate(labels)}
+        merged = ConfusionMatrix(labels, n_skipped=self.n_skipped + other.n_skipped)
+        for cm in [self, other]:
+            positions = np.array([index[label] for label in cm.labels], dtype=np.int64)
+            merged.matrix[np.ix_(positions, positions)] += cm.matrix
+        return merged
+
+    def __add__(self, other: "ConfusionMatrix") -> "ConfusionMatrix":
+        """Merge with another confusion matrix."""
+        return self.merge(other)
+
+    def __radd__(self, other) -> "ConfusionMatrix":
+        """Merge with another confusion matrix, allowing `sum()` over confusion matrices."""
+        return self if other == 0 else self.merge(other)
+
+    def __eq__(self, other) -> bool:
+        """Equal labels, counts and number of skipped pairs."""
+        if not isinstance(other, ConfusionMatrix):
+            return False
+        return self.to_dict() == other.to_dict()
+
+    def __repr__(self) -> str:
+        """Short representation with the labels and number of pairs."""
+        return f"{self.__class__.__name__}(labels={self.labels}, n={self.n}, n_skipped={self.n_skipped})"
+
+    def to_dict(self) -> dict:
+        """Serializable (e.g. JSON) representation."""
+        return {"labels": self.labels, "matrix": self.matrix.tolist(), "n_skipped": self.n_skipped}
+
+    @classmethod
+    def from_dict(cls, config: dict) -> "ConfusionMatrix":
+        """Construct from the representation given by `to_dict()`."""
+        return cls(labels=config["labels"], matrix=config["matrix"], n_skipped=config.get("n_skipped", 0))
+
+
+def _as_labelsets(labels: Iterable[LT]) -> Iterable[FrozenSet[LT]]:
+    """Turn labels into label sets, keeping labels that are already sets."""
+    for label in labels:
+        yield frozenset(label) if isinstance(label, (frozenset, set)) else frozenset([label])
+
+
+def disagreement(y_preds: np.ndarray) -> np.ndarray:
+    """Fraction of instances on which each pair of models predicts a different label.
+
+    Args:
+        y_preds (np.ndarray): Predicted label codes of shape `(n_models, n_instances)`.
+
+    Returns:
+        np.ndarray: Symmetric disagreement matrix of shape `(n_models, n_models)`.
+    """
+    y_preds = np.asarray(y_preds)
+    if y_preds.shape[1] == 0:
+        return np.zeros((len(y_preds), len(y_preds)))
+    return np.stack([(y_preds != y_pred).mean(axis=1) for y_pred in y_preds])
+
+
+def mcnemar(correct: np.ndarray, exact_below: int = 25) -> Tuple[np.ndarray, np.ndarray]:
+    """Test each pair of models for equal error rates on the same instances, with the McNemar test.
+
+    Uses the exact binomial test if there are fewer than `exact_below` discordant pairs, and the chi-squared test with
+    continuity correction otherwise.
+
+    Args:
+        correct (np.ndarray): Whether each model classifies each instance correctly, of shape `(n_models, n_instances)`.
+        exact_below (int, optional): Minimum number of discordant pairs to use the chi-squared test. Defaults to 25.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: Number of instances only the row model classifies correctly, and the two-sided
+            p-value, each of shape `(n_models, n_models)`.
+    """
+    from scipy.stats import binom, chi2
+
+    correct = np.asarray(correct, dtype=np.float64)
+    only_row = (correct @ (1.0 - correct).T).round().astype(np.int64)
+    b, c = only_row, only_row.T
+    discordant = b + c
+    with np.errstate(divide="ignore", invalid="ignore"):
+        statistic = np.where(discordant > 0, (np.abs(b - c) - 1.0).clip(min=0.0) ** 2 / discordant, 0.0)
+    p_value = np.where(
+        discordant < exact_below,
+        np.minimum(1.0, 2.0 * binom.cdf(np.minimum(b, c), discordant, 0.5)),
+        chi2.sf(statistic, 1),
+    )
+    return only_row, np.where(discordant > 0, p_value, 1.0)
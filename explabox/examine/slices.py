@@ -0,0 +1,180 @@
+# Copyright (c) 2022 Marcel Robeer for National Police Lab AI (NPAI).
+#
+# This program is free software; you can redistribute it and/or modify it under the terms of the GNU Lesser General
+# Public License (LGPL) as published by the Free Software Foundation; either version 3 (LGPLv3) of the License, or (at
+# your option) any later version. You may not use this file except in compliance with the license. You may obtain a copy
+# of the license at:
+#
+#     https://www.gnu.org/licenses/lgpl-3.0.en.html
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+
+"""Discover data slices (subgroups of instances) where a model performs significantly worse.
+
+Each candidate slice is a column in a sparse binary instance×slice matrix, so the size and number of errors of all
+slices follow from a single sparse matrix product with the error vector.
+"""
+
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from scipy import sparse
+from scipy.stats import norm
+
+SliceName = Tuple[str, str]
+
+
+def term_matrix(data: Sequence[str], tokenizer=None) -> Tuple[sparse.csr_matrix, np.ndarray, np.ndarray]:
+    """Sparse instance×term count matrix.
+
+    Args:
+        data (Sequence[str]): Text of each instance.
+        tokenizer (Optional[Callable[[str], List[str]]], optional): Tokenizer; if None it uses the default tokenizer of
+            `text_explainability`. Defaults to None.
+
+    Returns:
+        Tuple[sparse.csr_matrix, np.ndarray, np.ndarray]: Count matrix, terms (one per column) and the number of tokens
+            in each instance.
+    """
+    from ..explain.text.terms import DocumentTermMatrix
+
+    if tokenizer is None:
+        from text_explainability import default_tokenizer as tokenizer
+
+    return DocumentTermMatrix.from_texts(data, lower=False, lowercase=False, tokenizer=tokenizer).count_matrix()
+
+
+def indicator_matrix(codes: np.ndarray, n_values: int) -> sparse.csr_matrix:
+    """One-hot encode integer codes into a sparse instance×value matrix, skipping negative codes."""
+    codes = np.asarray(codes)
+    rows = np.flatnonzero(codes >= 0)
+    return sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.int8), (rows, codes[rows])), shape=(len(codes), n_values), dtype=np.int8
+    )
+
+
+def length_buckets(lengths: np.ndarray, n_buckets: int = 5) -> Tuple[np.ndarray, List[str]]:
+    """Assign each instance to a quantile bucket of its (tokenized) length.
+
+    Args:
+        lengths (np.ndarray): Length of each instance.
+        n_buckets (int, optional): Maximum number of buckets. Defaults to 5.
+
+    Returns:
+        Tuple[np.ndarray, List[str]]: Bucket code of each instance and the name of each bucket.
+    """
+    lengths = np.asarray(lengths)
+    edges = np.unique(np.ceil(np.quantile(lengths, np.linspace(0.0, 1.0, n_buckets + 1))).astype(int))
+    codes = np.searchsorted(edges[1:-1], lengths, side="right")
+    names = [
+        f"{lo}-{hi - 1}" if i < len(edges) - 2 else f"{lo}-{hi}" for i, (lo, hi) in enumerate(zip(edges, edges[1:]))
+    ] or [f"{edges[0]}"]
+    return codes, names
+
+
+def candidate_slices(
+    terms: Optional[Tuple[sparse.csr_matrix, np.ndarray]] = None,
+    lengths: Optional[np.ndarray] = None,
+    labels: Optional[Dict[str, Tuple[np.ndarray, Sequence]]] = None,
+    metadata: Optional[Dict[str, Sequence]] = None,
+    min_size: int = 10,
+    max_terms: Optional[int] = 5000,
+    n_length_buckets: int = 5,
+) -> Tuple[sparse.csc_matrix, List[SliceName]]:
+    """Construct the binary instance×slice matrix of all candidate slices.
+
+    Args:
+        terms (Optional[Tuple[sparse.csr_matrix, np.ndarray]], optional): Instance×term matrix and the terms, giving a
+            slice per term for the instances containing it. Defaults to None.
+        lengths (Optional[np.ndarray], optional): Instance lengths, giving a slice per length bucket. Defaults to None.
+        labels (Optional[Dict[str, Tuple[np.ndarray, Sequence]]], optional): Label codes and label names per kind of
+            label (e.g. ground-truth and predicted label), giving a slice per label. Defaults to None.
+        metadata (Optional[Dict[str, Sequence]], optional): Metadata column values of each instance, giving a slice per
+            unique value. Defaults to None.
+        min_size (int, optional): Minimum number of instances in a slice. Defaults to 10.
+        max_terms (Optional[int], optional): Maximum number of (most frequent) terms. Defaults to 5000.
+        n_length_buckets (int, optional): Maximum number of length buckets. Defaults to 5.
+
+    Returns:
+        Tuple[sparse.csc_matrix, List[SliceName]]: Binary instance×slice matrix and the (feature, value) of each slice.
+    """
+    blocks, names = [], []
+
+    if terms is not None:
+        X, vocabulary = terms
+        X = (X > 0).astype(np.int8).tocsc()
+        df = np.diff(X.indptr)
+        keep = np.flatnonzero(df >= min_size)
+        if max_terms is not None and len(keep) > max_terms:
+            keep = keep[np.argpartition(-df[keep], max_terms - 1)[:max_terms]]
+        keep = np.sort(keep)
+        blocks.append(X[:, keep])
+        names.extend(("term", str(term)) for term in np.asarray(vocabulary)[keep].tolist())
+
+    if lengths is not None:
+        codes, bucket_names = length_buckets(lengths, n_buckets=n_length_buckets)
+        blocks.append(indicator_matrix(codes, len(bucket_names)))
+        names.extend(("length", name) for name in bucket_names)
+
+    for kind, (codes, label_names) in (labels or {}).items():
+        blocks.append(indicator_matrix(codes, len(label_names)))
+        names.extend((kind, str(name)) for name in label_names)
+
+    for column, values in (metadata or {}).items():
+        uniques, codes = np.unique(np.asarray(values, dtype=str), return_inverse=True)
+        blocks.append(indicator_matrix(codes.ravel(), len(uniques)))
+        names.extend((str(column), value) for value in uniques.tolist())
+
+    if not blocks:
+        raise ValueError("Provide at least one kind of candidate slices.")
+
+    S = sparse.hstack(blocks, format="csc")
+    keep = np.flatnonzero(np.diff(S.indptr) >= min_size)
+    return S[:, keep], [names[i] for i in keep.tolist()]
+
+
+def rank_slices(S: sparse.spmatrix, errors: np.ndarray, alpha: float = 0.05) -> Dict[str, np.ndarray]:
+    """Test for each slice whether its error rate is higher than that of the remaining instances.
+
+    Uses a one-sided two-proportion z-test with the Benjamini-Hochberg false discovery rate correction.
+
+    Args:
+        S (sparse.spmatrix): Binary instance×slice matrix.
+        errors (np.ndarray): Whether each instance is wrongly classified.
+        alpha (float, optional): False discovery rate. Defaults to 0.05.
+
+    Returns:
+        Dict[str, np.ndarray]: Size, number of errors, error rate of the slice and of its complement, z-score, p-value,
+            adjusted p-value (q-value) and significance of each slice.
+    """
+    errors = np.asarray(errors, dtype=np.float64)
+    n, n_errors = len(errors), errors.sum()
+    size = np.asarray(S.sum(axis=0), dtype=np.float64).ravel()
+    slice_errors = np.asarray(S.T @ errors, dtype=np.float64).ravel()
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        error_rate = np.where(size > 0, slice_errors / size, 0.0)
+        complement_rate = np.where(n - size > 0, (n_errors - slice_errors) / (n - size), 0.0)
+        pooled = n_errors / n if n > 0 else 0.0
+        se = np.sqrt(pooled * (1.0 - pooled) * (1.0 / size + 1.0 / (n - size)))
+        z = np.where((se > 0) & np.isfinite(se), (error_rate - complement_rate) / se, 0.0)
+    p_value = norm.sf(z)
+
+    # Benjamini-Hochberg adjusted p-values
+    order = np.argsort(p_value)
+    ranked = p_value[order] * len(p_value) / np.arange(1, len(p_value) + 1)
+    q_value = np.empty_like(p_value)
+    q_value[order] = np.minimum.accumulate(ranked[::-1])[::-1].clip(max=1.0)
+
+    return {
+        "size": size.astype(np.int64),
+        "errors": slice_errors.astype(np.int64),
+        "error_rate": error_rate,
+        "complement_error_rate": complement_rate,
+        "z": z,
+        "p_value": p_value,
+        "q_value": q_value,
+        "significant": q_value <= alpha,
+    }
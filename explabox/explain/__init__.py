@@ -13,6 +13,6 @@
 
 """Add explainability to your model/dataset with the Explainer class."""
 
-from .text import Explainer, FeatureList, Instances
+from .text import Explainer, ExplanationCache, FeatureList, Instances
 
-__all__ = ["Explainer", "FeatureList", "Instances"]
+__all__ = ["Explainer", "ExplanationCache", "FeatureList", "Instances"]
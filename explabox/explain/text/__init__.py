@@ -13,6 +13,7 @@
 
 """Add explainability to your text model/dataset."""
 
+from .cache import ExplanationCache
 from .explainer import Explainer, FeatureList, Instances
 
-__all__ = ["Explainer", "FeatureList", "Instances"]
+__all__ = ["Explainer", "ExplanationCache", "FeatureList", "Instances"]
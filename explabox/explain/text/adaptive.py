@@ -0,0 +1,137 @@
+# Copyright (c) 2022 Marcel Robeer for National Police Lab AI (NPAI).
+#
+# This program is free software; you can redistribute it and/or modify it under the terms of the GNU Lesser General
+# Public License (LGPL) as published by the Free Software Foundation; either version 3 (LGPLv3) of the License, or (at
+# your option) any later version. You may not use this file except in compliance with the license. You may obtain a copy
+# of the license at:
+#
+#     https://www.gnu.org/licenses/lgpl-3.0.en.html
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+
+"""Grow the number of perturbed samples of local explanations until their feature attributions converge."""
+
+import time
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+
+def attributions(explanation) -> Optional[List[Dict[Tuple[Hashable, int], float]]]:
+    """Attribution score of each feature for each label, or None if the explanation has no scores.
+
+    Features are keyed by their value and occurrence, so repeated tokens (e.g. two times 'the') are kept apart.
+
+    Args:
+        explanation (FeatureAttribution): Explanation with (raw) scores for its used features.
+
+    Returns:
+        Optional[List[Dict[Tuple[Hashable, int], float]]]: Scores keyed by (feature, occurrence) for each label.
+    """
+    if not hasattr(explanation, "get_raw_scores"):
+        return None
+    raw = np.atleast_2d(np.asarray(explanation.get_raw_scores(), dtype=np.float64))
+    used = explanation.used_features
+    labels = explanation.labels if explanation.labels is not None else [None]
+    res = []
+    for i, label in enumerate(labels):
+        features = used[label] if isinstance(used, dict) else used
+        seen: Dict[Hashable, int] = {}
+        keys = []
+        for feature in features:
+            feature = feature if isinstance(feature, Hashable) else str(feature)
+            keys.append((feature, seen.get(feature, 0)))
+            seen[feature] = seen.get(feature, 0) + 1
+        res.append(dict(zip(keys, raw[i].tolist())))
+    return res
+
+
+def converged(
+    previous: List[Dict[Hashable, float]], current: List[Dict[Hashable, float]], top_k: int = 5, tolerance: float = 0.05
+) -> bool:
+    """Whether the top-k feature ranking of each label is unchanged and no score moved more than the tolerance.
+
+    Args:
+        previous (List[Dict[Hashable, float]]): Attributions of each label in the previous round.
+        current (List[Dict[Hashable, float]]): Attributions of each label in the current round.
+        top_k (int, optional): Number of highest ranked features (by absolute score) that should be the same, in the
+            same order. Defaults to 5.
+        tolerance (float, optional): Maximum change of any score, relative to the largest absolute score.
+            Defaults to 0.05.
+
+    Returns:
+        bool: Whether the attributions converged.
+    """
+    if len(previous) != len(current):
+        return False
+    for before, after in zip(previous, current):
+        features = list(dict.fromkeys([*after, *before]))
+        scores_before = np.array([before.get(feature, 0.0) for feature in features])
+        scores_after = np.array([after.get(feature, 0.0) for feature in features])
+        ranking_before = np.argsort(-np.abs(scores_before), kind="stable")[:top_k]
+        ranking_after = np.argsort(-np.abs(scores_after), kind="stable")[:top_k]
+        scale = max(float(np.abs(scores_after).max(initial=0.0)), np.finfo(np.float64).eps)
+        if not np.array_equal(ranking_before, ranking_after):
+            return False
+        if float(np.abs(scores_after - scores_before).max(initial=0.0)) > tolerance * scale:
+            return False
+    return True
+
+
+def explain_adaptive(
+    explain: Callable[[int], List],
+    min_samples: int = 50,
+    max_samples: int = 2000,
+    time_budget: Optional[float] = None,
+    top_k: int = 5,
+    tolerance: float = 0.05,
+    growth: float = 2.0,
+) -> List:
+    """Explain with a growing number of perturbed samples until the attributions of all explanations converge.
+
+    Each round multiplies the number of samples by `growth`. `explain` is expected to grow the neighbourhoods of the
+    previous round (see `explain.text.perturbation.GrowingNeighbourhood`), so a round only draws and predicts the
+    additional samples and the total number of samples is that of the last round. It stops once two consecutive
+    rounds converge, when the next round would exceed `max_samples`, or when the next round is expected to exceed the
+    `time_budget` (assuming the time spent grows linearly with the total number of samples).
+
+    Args:
+        explain (Callable[[int], List]): Function giving the explanations for a (total) number of samples.
+        min_samples (int, optional): Number of samples in the first round. Defaults to 50.
+        max_samples (int, optional): Maximum total number of samples. Defaults to 2000.
+        time_budget (Optional[float], optional): Maximum number of seconds to spend; if None there is no time limit.
+            Defaults to None.
+        top_k (int, optional): Number of highest ranked features that should be stable. Defaults to 5.
+        tolerance (float, optional): Maximum relative change of scores between rounds. Defaults to 0.05.
+        growth (float, optional): Factor by which the number of samples grows each round. Defaults to 2.0.
+
+    Raises:
+        ValueError: Invalid `min_samples`, `max_samples` or `growth`.
+
+    Returns:
+        List: Explanations of the last round.
+    """
+    if min_samples < 1 or max_samples < min_samples:
+        raise ValueError(f"Expected 1 <= {min_samples=} <= {max_samples=}")
+    if growth <= 1.0:
+        raise ValueError(f"{growth=} should be > 1!")
+
+    start = time.perf_counter()
+    n_samples, previous = min_samples, None
+    while True:
+        explanations = explain(n_samples)
+        current = [attributions(explanation) for explanation in explanations]
+        if all(c is None for c in current):  # no attributions to converge
+            return explanations
+        if previous is not None and all(
+            c is None or converged(p, c, top_k, tolerance) for p, c in zip(previous, current)
+        ):
+            return explanations
+
+        next_samples = int(np.ceil(n_samples * growth))
+        elapsed = time.perf_counter() - start
+        if next_samples > max_samples or time_budget is not None and elapsed * next_samples / n_samples > time_budget:
+            return explanations
+        n_samples, previous = next_samples, current
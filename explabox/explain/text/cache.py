@@ -0,0 +1,402 @@
+# Copyright (c) 2022 Marcel Robeer for National Police Lab AI (NPAI).
+#
+# This program is free software; you can redistribute it and/or modify it under the terms of the GNU Lesser General
+# Public License (LGPL) as published by the Free Software Foundation; either version 3 (LGPLv3) of the License, or (at
+# your option) any later version. You may not use this file except in compliance with the license. You may obtain a copy
+# of the license at:
+#
+#     https://www.gnu.org/licenses/lgpl-3.0.en.html
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+
+"""Persistent cache of explanations on disk, shared between sessions and processes."""
+
+import hashlib
+import os
+import pickle
+import threading
+import time
+import types
+import warnings
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from ...config import CACHE_DIR
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+_MISSING = object()
+
+
+@contextmanager
+def _file_lock(path: Path):
+    """Hold an exclusive lock on a file, blocking until it is acquired (also between processes)."""
+    with open(path, "a+b") as file:
+        if fcntl is not None:
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+        else:
+            file.seek(0)
+            msvcrt.locking(file.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+            else:
+                file.seek(0)
+                msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _unlink(path: Path) -> None:
+    """Remove a file, unless it was removed already or is in use (memory-mapped embeddings on Windows)."""
+    try:
+        path.unlink(missing_ok=True)
+    except PermissionError:
+        pass
+
+
+def _normalize(value) -> Any:
+    """Hashable representation of a value that does not depend on the order of keyword arguments or memory address."""
+    if value is None or isinstance(value, (bool, int, float, str, bytes)):
+        return value
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return ("ndarray", str(value.dtype), value.shape, hashlib.blake2b(value.tobytes(), digest_size=16).hexdigest())
+    if isinstance(value, dict):
+        return ("dict", tuple(sorted(((repr(_normalize(k)), _normalize(v)) for k, v in value.items()))))
+    if isinstance(value, (set, frozenset)):
+        return ("set", tuple(sorted(repr(_normalize(v)) for v in value)))
+    if isinstance(value, (list, tuple)):
+        return tuple(_normalize(v) for v in value)
+    if isinstance(value, type):
+        return ("type", f"{value.__module__}.{value.__qualname__}")
+    if callable(value) and hasattr(value, "__code__"):  # functions and lambdas are identified by their code
+        code = value.__code__
+        body = hashlib.blake2b(code.co_code + repr(code.co_consts).encode(), digest_size=16).hexdigest()
+        return ("function", f"{value.__module__}.{value.__qualname__}", body)
+    if hasattr(value, "to_config"):
+        return (type(value).__qualname__, _normalize(value.to_config()))
+    return (type(value).__qualname__, repr(value))
+
+
+# Attributes that do not change the predictions of a model, such as where instancelib saves it (a random file name)
+_IGNORED_ATTRIBUTES = {"SaveableInnerModel": {"filename", "saved", "storage_location"}}
+
+
+class _UnstableState(Exception):
+    """State of which the content cannot be fingerprinted."""
+
+
+def _hash_state(hashed, value, seen: dict) -> None:
+    """Add the content of a (fitted) object to a hash, leaving out memory addresses and other per-process values.
+
+    Scikit-learn estimators are hashed by their type, parameters and fitted attributes (those ending with an
+    underscore, and nested estimators), other objects by the state they would be pickled with.
+
+    Raises:
+        _UnstableState: The content of a value cannot be hashed.
+    """
+
+    def update(*parts):
+        hashed.update(repr(parts).encode("utf-8"))
+
+    if value is None or isinstance(value, (bool, int, float, complex, str, bytes, np.generic)):
+        update(type(value).__name__, value)
+        return
+    if isinstance(value, (type, types.ModuleType, types.BuiltinFunctionType)):
+        update(type(value).__name__, getattr(value, "__module__", None), getattr(value, "__qualname__", value.__name__))
+        return
+    if id(value) in seen:  # cycles and shared objects
+        update("seen")
+        return
+    seen[id(value)] = value  # keeps temporary values alive, so their id is not reused
+    if isinstance(value, np.ndarray):
+        update("ndarray", str(value.dtype), value.shape)
+        if value.dtype.hasobject:
+            for item in value.ravel():
+                _hash_state(hashed, item, seen)
+        else:
+            hashed.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, dict):
+        update("dict", type(value).__qualname__, len(value))
+        for k, v in sorted(value.items(), key=lambda item: repr(item[0])):
+            _hash_state(hashed, k, seen)
+            _hash_state(hashed, v, seen)
+    elif isinstance(value, (set, frozenset)):
+        update("set", len(value))
+        for item in sorted(value, key=repr):
+            _hash_state(hashed, item, seen)
+    elif isinstance(value, (list, tuple)):
+        update(type(value).__qualname__, len(value))
+        for item in value:
+            _hash_state(hashed, item, seen)
+    elif isinstance(value, types.MethodType):
+        update("method")
+        _hash_state(hashed, value.__func__, seen)
+        _hash_state(hashed, value.__self__, seen)
+    elif isinstance(value, types.FunctionType):  # code, defaults, closure and the globals the function refers to
+        code = value.__code__
+        update("function", value.__module__, value.__qualname__, code.co_code, repr(code.co_consts))
+        _hash_state(hashed, (value.__defaults__, value.__kwdefaults__), seen)
+        _hash_state(
+            hashed, [cell.cell_contents for cell in value.__closure__ or () if cell.cell_contents is not value], seen
+        )
+        _hash_state(
+            hashed, {name: value.__globals__[name] for name in code.co_names if name in value.__globals__}, seen
+        )
+    elif hasattr(value, "get_params") and hasattr(value, "_get_param_names"):  # scikit-learn estimator
+        update("estimator", type(value).__module__, type(value).__qualname__)
+        _hash_state(hashed, value.get_params(deep=False), seen)
+        fitted = {k: v for k, v in vars(value).items() if k.endswith("_") or hasattr(v, "_get_param_names")}
+        _hash_state(hashed, fitted, seen)
+    else:
+        try:
+            reduced = value.__reduce_ex__(4)
+        except Exception as e:
+            raise _UnstableState(type(value).__qualname__) from e
+        if isinstance(reduced, str):  # global object
+            update("global", type(value).__module__, reduced)
+            return
+        constructor, args, *rest = reduced
+        update("object", type(value).__module__, type(value).__qualname__)
+        _hash_state(hashed, constructor, seen)
+        _hash_state(hashed, args, seen)
+        state = rest[0] if rest else None
+        ignored = set().union(*(_IGNORED_ATTRIBUTES.get(cls.__name__, ()) for cls in type(value).__mro__))
+        if ignored and isinstance(state, dict):
+            state = {k: v for k, v in state.items() if k not in ignored}
+        _hash_state(hashed, state, seen)
+        for items in rest[1:3]:
+            if items is not None:
+                _hash_state(hashed, list(items), seen)
+
+
+def digest(*values) -> str:
+    """Hexadecimal digest of (normalized) values."""
+    return hashlib.blake2b(repr(_normalize(values)).encode("utf-8"), digest_size=20).hexdigest()
+
+
+class ExplanationCache:
+    def __init__(
+        self,
+        directory: str = CACHE_DIR,
+        max_size: Optional[int] = 1_000_000_000,
+        max_entries: Optional[int] = None,
+        model_fingerprint: Optional[str] = None,
+    ):
+        """Cache of explanations on disk, keyed by their inputs, method, arguments and model.
+
+        Each explanation is pickled to its own file in `directory`, and the explainer stores the embeddings of splits
+        in its `embeddings` subdirectory. When these files grow beyond `max_size` bytes or `max_entries` files, the
+        least recently used ones are removed when an explanation is stored. Reads and writes hold a lock file, so
+        several processes can share one directory. As explanations are unpickled, only use a trusted directory.
+
+        Examples:
+            Cache the explanations of an explainer, so explaining the same sample again does not call the model:
+
+            >>> explainer = Explainer(data=data, model=model, cache=ExplanationCache('.explabox_cache'))
+            >>> explainer.explain_prediction('I love this so much!')
+            >>> explainer.explain_prediction('I love this so much!')  # read from cache
+
+        Args:
+            directory (str, optional): Directory to store the explanations in. Defaults to CACHE_DIR.
+            max_size (Optional[int], optional): Maximum size of all explanations and embeddings in bytes, or unlimited
+                if None. Defaults to 1,000,000,000.
+            max_entries (Optional[int], optional): Maximum number of explanations and embeddings, or unlimited if
+                None.
+                Defaults to None.
+            model_fingerprint (Optional[str], optional): Fingerprint of the model. If None it is derived from the
+                content of the model (for scikit-learn estimators their parameters and fitted attributes), so it is
+                the same in other processes, or from its type and predictions on a few fixed texts if its content
+                cannot be hashed.
+                Defaults to None.
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_size = max_size
+        self.max_entries = max_entries
+        self.model_fingerprint = model_fingerprint
+        self.hits = 0
+        self.misses = 0
+        self._fingerprints: Dict[int, Tuple[Any, str]] = {}
+        self._lock = threading.Lock()
+
+    def __getstate__(self) -> dict:
+        """State without the thread lock and fingerprints, e.g. to send the cache to another process."""
+        state = self.__dict__.copy()
+        del state["_lock"], state["_fingerprints"]
+        return state
+
+    def __setstate__(self, state: dict):
+        """Restore the state with a new thread lock."""
+        self.__dict__.update(state, _lock=threading.Lock(), _fingerprints={})
+
+    @contextmanager
+    def _locked(self):
+        with self._lock, _file_lock(self.directory / ".lock"):
+            yield
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.pkl"
+
+    def fingerprint(self, model) -> str:
+        """Fingerprint of a model, computed once per model object.
+
+        Args:
+            model (AbstractClassifier): Model to fingerprint.
+
+        Returns:
+            str: Fingerprint.
+        """
+        if self.model_fingerprint is not None:
+            return self.model_fingerprint
+        cached = self._fingerprints.get(id(model))
+        if cached is not None and cached[0] is model:
+            return cached[1]
+        try:
+            hashed = hashlib.blake2b(digest_size=20)
+            _hash_state(hashed, model, {})
+            fingerprint = hashed.hexdigest()
+        except (_UnstableState, RecursionError):  # e.g. native objects, predict a few fixed texts instead
+            from text_explainability import from_string
+
+            probes = [from_string(text) for text in ("", "a", "This is a test.", "Is this a test?!", "0123456789")]
+            proba = np.vstack([np.asarray(matrix) for _, matrix in model.predict_proba_raw(probes)])
+            fingerprint = digest(type(model), np.round(proba, 8))
+        self._fingerprints[id(model)] = (model, fingerprint)
+        return fingerprint
+
+    def key(self, method: str, inputs, params: Optional[dict] = None, model=None) -> str:
+        """Key of an explanation.
+
+        Args:
+            method (str): Name of the explanation method.
+            inputs: Explained input(s), such as the text of a sample or the fingerprint of a split.
+            params (Optional[dict], optional): Arguments of the explanation method, including its seed.
+                Defaults to None.
+            model (Optional[AbstractClassifier], optional): Explained model, if any. Defaults to None.
+
+        Returns:
+            str: Key.
+        """
+        return digest(method, inputs, params or {}, self.fingerprint(model) if model is not None else None)
+
+    def get(self, key: str, default=None):
+        """Explanation stored under a key, marking it as recently used.
+
+        Args:
+            key (str): Key.
+            default (optional): Value if the key is not in the cache. Defaults to None.
+
+        Returns:
+            Explanation or default.
+        """
+        path = self._path(key)
+        with self._locked():
+            try:
+                data = path.read_bytes()
+                os.utime(path, ns=(time.time_ns(), time.time_ns()))
+            except FileNotFoundError:
+                self.misses += 1
+                return default
+        self.hits += 1
+        return pickle.loads(data)
+
+    def put(self, key: str, value) -> None:
+        """Store an explanation under a key, removing the least recently used explanations if the cache is full.
+
+        Args:
+            key (str): Key.
+            value: Explanation.
+        """
+        try:
+            data = pickle.dumps(value)
+        except Exception as e:
+            warnings.warn(f"Unable to cache explanation ({e})")
+            return
+        path = self._path(key)
+        with self._locked():
+            tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            tmp.write_bytes(data)
+            os.replace(tmp, path)
+            self._evict()
+
+    def get_or_compute(self, key: str, compute: Callable[[], Any]):
+        """Explanation stored under a key, or compute (and store) it if it is not in the cache.
+
+        Args:
+            key (str): Key.
+            compute (Callable[[], Any]): Function computing the explanation.
+
+        Returns:
+            Explanation.
+        """
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def _evict(self) -> None:
+        """Remove the least recently used explanations until the cache fits (call while holding the lock)."""
+        if self.max_size is None and self.max_entries is None:
+            return
+        entries = []
+        for path in self._files():
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime_ns, path.name, stat.st_size, path))
+        entries.sort()
+        size = sum(entry[2] for entry in entries)
+        n = len(entries)
+        for _, _, entry_size, path in entries:
+            if (self.max_size is None or size <= self.max_size) and (self.max_entries is None or n <= self.max_entries):
+                break
+            _unlink(path)
+            size, n = size - entry_size, n - 1
+
+    def _files(self) -> List[Path]:
+        """Files of the explanations, and of the embeddings of splits stored by the explainer (see `EmbeddingCache`)."""
+        embeddings = self.directory / "embeddings"
+        return [*self.directory.glob("*.pkl"), *embeddings.glob("*.npy"), *embeddings.glob("*.npz")]
+
+    def clear(self) -> None:
+        """Remove all explanations and embeddings from the cache."""
+        with self._locked():
+            for path in self._files():
+                _unlink(path)
+
+    def __len__(self) -> int:
+        """Number of explanations in the cache."""
+        return sum(1 for _ in self.directory.glob("*.pkl"))
+
+
+def fingerprint_instances(instances, labels=None) -> str:
+    """Fingerprint of the identifiers and data (and optionally labels) of instances, such as a split.
+
+    Args:
+        instances (InstanceProvider): Instances.
+        labels (Optional[LabelProvider], optional): Labels of the instances to include. Defaults to None.
+
+    Returns:
+        str: Fingerprint.
+    """
+    hashed = hashlib.blake2b(digest_size=20)
+    for key in instances.key_list:
+        item = (key, instances[key].data)
+        if labels is not None:
+            item += (sorted(map(str, labels.get_labels(key))),)
+        hashed.update(repr(item).encode("utf-8"))
+    return hashed.hexdigest()
@@ -0,0 +1,211 @@
+# Copyright (c) 2022 Marcel Robeer for National Police Lab AI (NPAI).
+#
+# This program is free software; you can redistribute it and/or modify it under the terms of the GNU Lesser General
+# Public License (LGPL) as published by the Free Software Foundation; either version 3 (LGPLv3) of the License, or (at
+# your option) any later version. You may not use this file except in compliance with the license. You may obtain a copy
+# of the license at:
+#
+#     https://www.gnu.org/licenses/lgpl-3.0.en.html
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+
+"""Embed each split once per embedder, sharing the embeddings between prototype and criticism methods."""
+
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from instancelib.instances.memory import MemoryBucketProvider
+from instancelib.instances.text import MemoryTextInstance
+from instancelib.typehints import KT
+from scipy import sparse
+from text_explainability.data.embedding import CountVectorizer, Embedder, TfidfVectorizer
+
+from .cache import digest, fingerprint_instances
+
+
+def embedder_key(embedder: Union[type, Embedder]) -> Optional[str]:
+    """Key of the configuration of an embedder, or None if its configuration is unknown.
+
+    The configuration is the class of the embedder, the parameters of its (scikit-learn) model or the result of its
+    `to_config()` method, if defined.
+
+    Args:
+        embedder (Union[type, Embedder]): Embedder (class or instance).
+
+    Returns:
+        Optional[str]: Key, the same for embedders that embed identically.
+    """
+    if isinstance(embedder, type):
+        return digest(embedder)
+    if hasattr(embedder, "to_config"):
+        return digest(type(embedder), embedder.to_config())
+    model = getattr(embedder, "model", None)
+    if hasattr(model, "get_params"):  # e.g. scikit-learn vectorizers
+        return digest(type(embedder), model.get_params())
+    return None
+
+
+def _is_bag_of_words(embedder: Union[type, Embedder]) -> bool:
+    """Whether an embedder (class or instance) gives sparse bag-of-words embeddings."""
+    cls = embedder if isinstance(embedder, type) else type(embedder)
+    return issubclass(cls, (CountVectorizer, TfidfVectorizer))
+
+
+class EmbeddedInstances(MemoryBucketProvider):
+    def __init__(self, dataset, keys: Iterable[KT], matrix: Union[np.ndarray, sparse.csr_matrix], rows: Dict[KT, int]):
+        """Instances with their embeddings as the rows of one (sparse or memory-mapped) matrix.
+
+        The vector of an instance is its row of the matrix, and `embedded()` gives the rows of all instances in the
+        bucket, which is the matrix itself (not a copy) if the bucket holds all of its rows.
+
+        Args:
+            dataset (InstanceProvider): Instances, without (or with other) vectors.
+            keys (Iterable[KT]): Keys of the instances in the bucket.
+            matrix (Union[np.ndarray, sparse.csr_matrix]): Embeddings.
+            rows (Dict[KT, int]): Row of the embedding of each key, in the order of the matrix.
+        """
+        super().__init__(dataset, keys)
+        self.matrix = matrix
+        self.rows = rows
+
+    def __getitem__(self, key: KT) -> MemoryTextInstance:
+        """Instance with its row of the matrix as vector."""
+        instance = self.dataset[key]
+        return MemoryTextInstance(key, instance.data, self.matrix[self.rows[key]], instance.representation)
+
+    def __deepcopy__(self, memo) -> "EmbeddedInstances":
+        """Copy of the bucket, sharing the instances and embeddings (e.g. to select the instances of one label)."""
+        return EmbeddedInstances(self.dataset, self._elements, self.matrix, self.rows)
+
+    @property
+    def _bucket(self) -> Iterable[KT]:
+        return (key for key in self.rows if key in self._elements)
+
+    def embedded(self, keys: Optional[Sequence[KT]] = None) -> Union[np.ndarray, sparse.csr_matrix]:
+        """Embeddings of instances, without densifying sparse embeddings or reading memory-mapped ones.
+
+        Args:
+            keys (Optional[Sequence[KT]], optional): Keys of the instances, or None for all instances in the bucket.
+                Defaults to None.
+
+        Returns:
+            Union[np.ndarray, sparse.csr_matrix]: Rows of the matrix for the keys.
+        """
+        keys = list(self) if keys is None else keys
+        index = np.fromiter((self.rows[key] for key in keys), dtype=np.int64, count=len(keys))
+        if len(index) == self.matrix.shape[0] and np.array_equal(index, np.arange(len(index))):
+            return self.matrix
+        return self.matrix[index]
+
+    def bulk_get_vectors(self, keys: Sequence[KT]) -> Tuple[Sequence[KT], Sequence[np.ndarray]]:
+        """Keys and dense vectors of instances, for samplers that stack the vectors themselves."""
+        keys = list(keys)
+        embedded = self.embedded(keys)
+        return keys, list(embedded.toarray() if sparse.issparse(embedded) else np.asarray(embedded))
+
+
+class EmbeddingCache:
+    def __init__(self, directory: Optional[str] = None):
+        """Embeddings of splits, keyed by the embedder configuration and versioned by the fingerprint of the split.
+
+        Bag-of-words embedders (TF-IDF, counts) are kept as sparse matrices and other (dense) embedders as float32
+        arrays. If a directory is given, the embeddings are also stored there, and dense embeddings are memory-mapped
+        from disk. Embedders with an unknown configuration (see `embedder_key()`, e.g. sentence transformers) are only
+        cached in memory, for as long as the same embedder object is used.
+
+        Args:
+            directory (Optional[str], optional): Directory to store embeddings in, or None to keep them in memory.
+                Defaults to None.
+        """
+        self.directory = Path(directory) if directory is not None else None
+        self._embeddings: Dict[tuple, Tuple[str, Any, Any]] = {}
+
+    def __getstate__(self) -> dict:
+        """State without in-memory embeddings, e.g. to send the cache to another process."""
+        return {**self.__dict__, "_embeddings": {}}
+
+    def _path(self, fingerprint: str, key: str, dense: bool) -> Path:
+        return self.directory / f"{digest(fingerprint, key)}.{'npy' if dense else 'npz'}"
+
+    @staticmethod
+    def _compute(embedder: Embedder, texts: list) -> Union[np.ndarray, sparse.csr_matrix]:
+        """Embed texts, as a sparse matrix for bag-of-words embedders or else a dense float32 array."""
+        if _is_bag_of_words(embedder):
+            return sparse.csr_matrix(embedder.model.fit_transform(texts))
+        return np.asarray(embedder.model_fn(texts), dtype=np.float32)
+
+    def _load(self, path: Path) -> Optional[Union[np.ndarray, sparse.csr_matrix]]:
+        try:
+            os.utime(path, ns=(time.time_ns(), time.time_ns()))  # recently used, see `ExplanationCache`
+            return np.load(path, mmap_mode="r") if path.suffix == ".npy" else sparse.load_npz(path).tocsr()
+        except FileNotFoundError:
+            return None
+
+    def _store(self, path: Path, matrix: Union[np.ndarray, sparse.csr_matrix]) -> Union[np.ndarray, sparse.csr_matrix]:
+        """Store a matrix atomically, returning it memory-mapped if it is dense."""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{path.stem}.{os.getpid()}.{threading.get_ident()}.tmp{path.suffix}")
+        if isinstance(matrix, np.ndarray):
+            np.save(tmp, matrix)
+        else:
+            sparse.save_npz(tmp, matrix)
+        os.replace(tmp, path)
+        return self._load(path) if isinstance(matrix, np.ndarray) else matrix
+
+    def matrix(self, split: str, instances, embedder: Union[type, Embedder]) -> Union[np.ndarray, sparse.csr_matrix]:
+        """Embeddings of the instances of a split (in the order of `instances.key_list`), computed once.
+
+        Args:
+            split (str): Name of the split.
+            instances (InstanceProvider): Instances of the split.
+            embedder (Union[type, Embedder]): Embedder (class or instance).
+
+        Returns:
+            Union[np.ndarray, sparse.csr_matrix]: Sparse (bag-of-words) or dense float32 embeddings.
+        """
+        key = embedder_key(embedder)
+        fingerprint = fingerprint_instances(instances)
+        memory_key = (split, key if key is not None else id(embedder))
+        cached = self._embeddings.get(memory_key)
+        if cached is not None and cached[0] == fingerprint and (key is not None or cached[1] is embedder):
+            return cached[2]
+
+        path = (
+            self._path(fingerprint, key, not _is_bag_of_words(embedder))
+            if self.directory is not None and key is not None
+            else None
+        )
+        matrix = self._load(path) if path is not None else None
+        if matrix is None:
+            texts = [instances[k].data for k in instances.key_list]
+            matrix = self._compute(embedder() if isinstance(embedder, type) else embedder, texts)
+            if path is not None:
+                matrix = self._store(path, matrix)
+        self._embeddings[memory_key] = (fingerprint, embedder, matrix)
+        return matrix
+
+    def embed(self, split: str, instances, embedder: Optional[Union[type, Embedder]]) -> MemoryBucketProvider:
+        """Instances of a split with their (cached) embeddings as vectors, leaving the split itself unaltered.
+
+        Instances that all have a vector already are returned as is. The embeddings are not copied: sparse ones stay
+        sparse and dense ones stay memory-mapped (see `EmbeddedInstances`).
+
+        Args:
+            split (str): Name of the split.
+            instances (InstanceProvider): Instances of the split.
+            embedder (Optional[Union[type, Embedder]]): Embedder (class or instance).
+
+        Returns:
+            MemoryBucketProvider: Instances, with their embeddings as vector.
+        """
+        if embedder is None or all(instances[k].vector is not None for k in instances):
+            return instances
+        matrix = self.matrix(split, instances, embedder)
+        keys = instances.key_list
+        return EmbeddedInstances(instances, keys, matrix, {key: i for i, key in enumerate(keys)})
@@ -0,0 +1,278 @@
+# Copyright (c) 2022 Marcel Robeer for National Police Lab AI (NPAI).
+#
+# This program is free software; you can redistribute it and/or modify it under the terms of the GNU Lesser General
+# Public License (LGPL) as published by the Free Software Foundation; either version 3 (LGPLv3) of the License, or (at
+# your option) any later version. You may not use this file except in compliance with the license. You may obtain a copy
+# of the license at:
+#
+#     https://www.gnu.org/licenses/lgpl-3.0.en.html
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+
+"""Exact (closed-form) feature attribution for scikit-learn linear models and tree ensembles on text vectorizers."""
+
+import math
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Local explanation methods that are replaced by exact attribution if the model supports it
+ATTRIBUTION_METHODS = ("LIME", "BayLIME", "KernelSHAP")
+
+
+def _steps(model) -> Optional[Tuple[object, object, object]]:
+    """Vectorizer, text-to-features transform and final estimator of a supported scikit-learn model, else None."""
+    from sklearn.feature_extraction.text import CountVectorizer, TfidfTransformer
+    from sklearn.pipeline import Pipeline
+
+    from .pooling import PooledClassifier
+
+    if isinstance(model, PooledClassifier):
+        model = model.model
+    pipeline = getattr(model, "innermodel", None)
+    if not isinstance(pipeline, Pipeline) or len(pipeline.steps) < 2:
+        return None
+    vectorizer, transformers, estimator = pipeline.steps[0][1], pipeline.steps[1:-1], pipeline.steps[-1][1]
+    if not isinstance(vectorizer, CountVectorizer) or vectorizer.analyzer != "word":
+        return None
+    if any(not isinstance(step, (TfidfTransformer, str, type(None))) for _, step in transformers):
+        return None  # other transformers may change which feature is which
+    if not hasattr(vectorizer, "vocabulary_") or _kind(estimator) is None:
+        return None
+    return vectorizer, Pipeline(pipeline.steps[:-1]), estimator
+
+
+def _kind(estimator) -> Optional[str]:
+    """Kind of closed-form attribution for an estimator: 'linear', 'tree' or None if unsupported."""
+    from sklearn.ensemble import ExtraTreesClassifier, GradientBoostingClassifier, RandomForestClassifier
+    from sklearn.tree import DecisionTreeClassifier
+
+    if isinstance(estimator, (DecisionTreeClassifier, RandomForestClassifier, ExtraTreesClassifier)):
+        return "tree" if estimator.n_outputs_ == 1 else None
+    if isinstance(estimator, GradientBoostingClassifier):
+        return "tree"
+    if hasattr(estimator, "coef_") and hasattr(estimator, "intercept_") and hasattr(estimator, "decision_function"):
+        return "linear"
+    return None
+
+
+def supports(model) -> bool:
+    """Whether exact attribution is available for a model.
+
+    That is a fitted scikit-learn pipeline starting with a word-level `CountVectorizer` or `TfidfVectorizer`
+    (optionally followed by a `TfidfTransformer`) and ending in a linear classifier (with `coef_` and
+    `decision_function()`), a decision tree, random forest, extra trees or gradient boosting classifier.
+
+    Args:
+        model (AbstractClassifier): Model (e.g. `instancelib.SkLearnDataClassifier`).
+
+    Returns:
+        bool: Whether the model is supported.
+    """
+    return _steps(model) is not None
+
+
+@lru_cache(maxsize=None)
+def _shapley_weights(a: int, b: int) -> Tuple[float, float]:
+    """Shapley weight of a feature in the set of size `a` taking the instance value and of size `b` the reference."""
+    total = math.factorial(a + b)
+    positive = math.factorial(a - 1) * math.factorial(b) / total if a > 0 else 0.0
+    negative = math.factorial(a) * math.factorial(b - 1) / total if b > 0 else 0.0
+    return positive, negative
+
+
+def tree_shap(tree, x: Dict[int, float], values: np.ndarray) -> Dict[int, np.ndarray]:
+    """Exact Shapley values of the features of an instance for a tree, relative to a reference of all zeros.
+
+    Follows each path on which the instance and reference split differently, keeping track of which features take
+    the value of the instance and which the value of the reference. The leaf value is then divided over these
+    features in closed form. The time taken is linear in the number of visited nodes times their depth.
+
+    Args:
+        tree (sklearn.tree._tree.Tree): Fitted tree (`estimator.tree_`).
+        x (Dict[int, float]): Non-zero feature values of the instance.
+        values (np.ndarray): Output of each node (n_nodes x n_outputs).
+
+    Returns:
+        Dict[int, np.ndarray]: Shapley values of each feature (n_outputs) with a non-zero attribution.
+    """
+    left, right, feature, threshold = tree.children_left, tree.children_right, tree.feature, tree.threshold
+    phi: Dict[int, np.ndarray] = {}
+
+    def recurse(node: int, x_features: List[int], reference_features: List[int]):
+        if left[node] == right[node]:  # leaf
+            positive, negative = _shapley_weights(len(x_features), len(reference_features))
+            for f in x_features:
+                phi[f] = phi.get(f, 0.0) + positive * values[node]
+            for f in reference_features:
+                phi[f] = phi.get(f, 0.0) - negative * values[node]
+            return
+        f = feature[node]
+        # trees compare features as float32
+        x_child = left[node] if np.float32(x.get(f, 0.0)) <= threshold[node] else right[node]
+        reference_child = left[node] if 0.0 <= threshold[node] else right[node]
+        if x_child == reference_child or f in x_features:
+            recurse(x_child, x_features, reference_features)
+        elif f in reference_features:
+            recurse(reference_child, x_features, reference_features)
+        else:
+            recurse(x_child, x_features + [f], reference_features)
+            recurse(reference_child, x_features, reference_features + [f])
+
+    recurse(0, [], [])
+    return phi
+
+
+def _tree_values(estimator) -> List[Tuple[object, np.ndarray]]:
+    """Each tree of an estimator and the output of its nodes, such that the outputs of the trees sum to the output."""
+    from sklearn.ensemble import GradientBoostingClassifier
+
+    if isinstance(estimator, GradientBoostingClassifier):
+        return [
+            (tree.tree_, tree.tree_.value[:, 0, 0:1] * estimator.learning_rate * np.eye(len(stage))[k])
+            for stage in estimator.estimators_
+            for k, tree in enumerate(stage)
+        ]
+    trees = getattr(estimator, "estimators_", [estimator])
+    res = []
+    for tree in trees:
+        value = tree.tree_.value[:, 0, :]
+        res.append((tree.tree_, value / value.sum(axis=1, keepdims=True) / len(trees)))
+    return res
+
+
+def feature_attributions(model, text: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Exact attribution of each (vectorizer) feature of a text, relative to the empty text.
+
+    For linear models the attribution is the coefficient times the feature value, in the space of the decision
+    function. For tree ensembles it is the Shapley value, in the space of the class probabilities (or the decision
+    function for gradient boosting). In both cases the attributions sum to the output minus the output for the
+    empty text (the base score).
+
+    Args:
+        model (AbstractClassifier): Supported model (see `supports()`).
+        text (str): Text to explain.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: Indices of the features in the text, their attributions
+            (n_classes x n_features) and the base score of each class (columns as in `predict_proba()`).
+    """
+    from sklearn.ensemble import GradientBoostingClassifier
+
+    _, transform, estimator = _steps(model)
+    x = transform.transform([text]).tocsr()
+    reference = transform.transform([""])
+    indices, data = x.indices, x.data
+
+    if _kind(estimator) == "linear":
+        coef = np.atleast_2d(estimator.coef_)[:, indices] * data
+        base = np.atleast_1d(estimator.decision_function(reference)[0])
+    else:
+        trees = _tree_values(estimator)
+        coef = np.zeros((trees[0][1].shape[1], len(indices)))
+        position = {f: j for j, f in enumerate(indices.tolist())}
+        for tree, tree_values in trees:
+            for f, phi in tree_shap(tree, dict(zip(indices.tolist(), data.tolist())), tree_values).items():
+                coef[:, position[f]] += phi
+        base = (
+            np.atleast_1d(estimator.decision_function(reference)[0])
+            if isinstance(estimator, GradientBoostingClassifier)
+            else estimator.predict_proba(reference)[0]
+        )
+    if coef.shape[0] == 1 and len(estimator.classes_) == 2:  # binary decision function is that of the second class
+        coef, base = np.vstack([-coef, coef]), np.array([-base[0], base[0]])
+    return indices, coef, base
+
+
+def token_features(vectorizer, tokens: Sequence[str]) -> Dict[int, List[Tuple[int, ...]]]:
+    """Token positions of each occurrence of each (n-gram) feature of a vectorizer.
+
+    Each token is analyzed on its own (preprocessing, token pattern and stop words of the vectorizer), after which
+    n-grams are formed over the remaining tokens, as the vectorizer does.
+
+    Args:
+        vectorizer (CountVectorizer): Fitted vectorizer with a word analyzer.
+        tokens (Sequence[str]): Tokens of a text.
+
+    Returns:
+        Dict[int, List[Tuple[int, ...]]]: Positions of the tokens of each occurrence, for each feature index.
+    """
+    preprocess, tokenize = vectorizer.build_preprocessor(), vectorizer.build_tokenizer()
+    stop_words = vectorizer.get_stop_words() or frozenset()
+    words = [
+        (i, word) for i, token in enumerate(tokens) for word in tokenize(preprocess(token)) if word not in stop_words
+    ]
+    min_n, max_n = vectorizer.ngram_range
+    occurrences: Dict[int, List[Tuple[int, ...]]] = {}
+    for n in range(min_n, max_n + 1):
+        for gram in zip(*(words[k:] for k in range(n))):  # each window of n words
+            index = vectorizer.vocabulary_.get(" ".join(word for _, word in gram))
+            if index is not None:
+                occurrences.setdefault(index, []).append(tuple(dict.fromkeys(i for i, _ in gram)))
+    return occurrences
+
+
+class ExactAttribution:
+    def __init__(self, env=None, labelset: Optional[Sequence[str]] = None, seed: int = 0):
+        """Exact feature attribution for supported scikit-learn models, instead of sampling (e.g. LIME, KernelSHAP).
+
+        The attribution of each feature of the vectorizer (see `feature_attributions()`) is divided equally over its
+        occurrences in the text, and the attribution of each occurrence equally over its tokens. Features that do not
+        occur in the tokens of the text (e.g. because the vectorizer tokenizes differently) are left out.
+
+        Args:
+            env (optional): Unused, for the same interface as local explanation methods. Defaults to None.
+            labelset (Optional[Sequence[str]], optional): Names of the labels. Defaults to None.
+            seed (int, optional): Unused, as the attribution is deterministic. Defaults to 0.
+        """
+        self.labelset = list(labelset) if labelset is not None else None
+        self.seed = seed
+
+    def __call__(self, sample, model, labels: Optional[Sequence] = None, **kwargs):
+        """Calculate the exact feature attribution of each token of a sample.
+
+        Args:
+            sample (TextInstance): Instance to explain.
+            model (AbstractClassifier): Supported model (see `supports()`).
+            labels (Optional[Sequence], optional): Labels to explain; if None those of the labelset. Defaults to None.
+            **kwargs: Arguments of sampling methods (e.g. `n_samples`), which are ignored.
+
+        Returns:
+            FeatureAttribution: Attribution of each token, with `method` 'linear_contributions' or 'tree_shap'.
+        """
+        from instancelib.instances.text import TextInstanceProvider
+        from text_explainability import from_string
+        from text_explainability.generation.return_types import FeatureAttribution
+
+        instance = from_string(sample.data)
+        tokens = list(instance.tokenized)
+        vectorizer, _, estimator = _steps(model)
+        indices, coef, base = feature_attributions(model, sample.data)
+
+        token_scores = np.zeros((coef.shape[0], len(tokens)))
+        occurrences = token_features(vectorizer, tokens)
+        for j, index in enumerate(indices.tolist()):
+            for positions in occurrences.get(index, []):
+                share = coef[:, j] / len(occurrences[index]) / len(positions)
+                token_scores[:, list(positions)] += share[:, None]
+
+        labelset = self.labelset if self.labelset is not None else [str(c) for c in estimator.classes_]
+        labels = labelset if labels is None else list(labels)
+        columns = [model.get_label_column_index(label) for label in labels]
+        proba = np.asarray(next(iter(model.predict_proba_raw([instance])))[1])[0]
+        return FeatureAttribution(
+            provider=TextInstanceProvider([instance]),
+            original_id=instance.identifier,
+            scores=token_scores[columns],
+            base_score=base[columns],
+            used_features=np.arange(len(tokens)),
+            labels=[labelset.index(label) for label in labels],
+            labelset=labelset,
+            original_scores=proba[columns].tolist(),
+            type="local_explanation",
+            method="linear_contributions" if _kind(estimator) == "linear" else "tree_shap",
+            callargs={"sample": sample.data, "labels": labels},
+        )
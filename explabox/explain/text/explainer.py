@@ -13,9 +13,14 @@
 
 """Main Explainer class."""
 
+import os
 import warnings
-from typing import List, Optional, Union
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import nullcontext
+from itertools import islice
+from typing import Callable, Dict, List, Optional, Sequence, Union
 
+import srsly
 from genbase import Readable, translate_list
 from instancelib import AbstractClassifier, Environment
 from text_explainability.data.embedding import Embedder, TfidfVectorizer
@@ -23,8 +28,161 @@ from text_explainability.generation.return_types import FeatureList, Instances
 
 from ...ingestibles import Ingestible
 from ...mixins import IngestiblesMixin
-from ...ui.notebook import restyle
+from ...ui.notebook import replace_renderer, restyle
 from ...utils import MultipleReturn
+from .adaptive import explain_adaptive
+from .cache import ExplanationCache, fingerprint_instances
+from .embeddings import EmbeddingCache, embedder_key
+from .exact import ATTRIBUTION_METHODS, ExactAttribution
+from .exact import supports as exact_supports
+from .featurization import featurized
+from .hierarchical import SEGMENT_LEVELS, explain_hierarchical
+from .neighbourhood import SharedNeighbourhood
+from .parallel import run_parallel, unit_seeds
+from .perturbation import GrowingNeighbourhood, perturb_with_masks
+from .perturbation import supports as masks_supports
+from .pooling import PooledClassifier
+from .terms import DocumentTermMatrix
+
+
+def _local_explanation_classes(methods: List[str], kwargs: dict) -> list:
+    """Local explanation classes for the names of methods, warning about (and skipping) unknown methods.
+
+    Args:
+        methods (List[str]): Names of methods.
+        kwargs (dict): Keyword arguments passed to the methods, to which defaults required by the methods are added.
+
+    Raises:
+        ValueError: `foil_fn` is required for contrastive explanation.
+
+    Returns:
+        list: Classes of known methods.
+    """
+    classes = []
+    for method in [str.lower(m) for m in methods]:
+        cls = None
+        if method in ["lime"]:
+            from text_explainability.local_explanation import LIME
+
+            cls = LIME
+        elif method in ["baylime"]:
+            from text_explainability.local_explanation import BayLIME
+
+            cls = BayLIME
+        elif method in ["anchor", "anchors"]:
+            from text_explainability.local_explanation import Anchor
+
+            cls = Anchor
+        elif method in ["shap", "shapley", "kernelshap", "kernel_shap"]:
+            from text_explainability.local_explanation import KernelSHAP
+
+            cls = KernelSHAP
+        elif method in ["local_tree", "tree"]:
+            from text_explainability.local_explanation import LocalTree
+
+            cls = LocalTree
+        elif method in ["local_rules", "rules"]:
+            from text_explainability.local_explanation import LocalRules
+
+            if "foil_fn" not in kwargs:
+                warnings.warn("No `foil_fn` provided for local rules, defaulting to class 0.")
+                kwargs["foil_fn"] = 0
+
+            cls = LocalRules
+        elif method in [
+            "foil",
+            "foiltree",
+            "foil_tree",
+            "contrastive",
+            "contrastive_explanation",
+        ]:
+            from text_explainability.local_explanation import FoilTree
+
+            if "foil_fn" not in kwargs:
+                raise ValueError("`foil_fn` is required for contrastive explanation.")
+
+            cls = FoilTree
+        if cls is not None:
+            classes.append(cls)
+        else:
+            warnings.warn(f'Unknown method "{method}". Skipping to next one')
+    return classes
+
+
+def _exact_classes(classes: list, model, exact: Optional[bool]) -> list:
+    """Replace sampling-based feature attribution classes (e.g. LIME, KernelSHAP) by `ExactAttribution` if asked to.
+
+    Args:
+        classes (list): Local explanation classes.
+        model (AbstractClassifier): Model to explain.
+        exact (Optional[bool]): Whether to replace them always (True, raising if the model is unsupported), if the
+            model is supported (None) or never (False).
+
+    Raises:
+        ValueError: Exact attribution is required but not available for the model.
+
+    Returns:
+        list: Classes, with at most one `ExactAttribution` in the place of the first replaced class.
+    """
+    if exact is False:
+        return classes
+    if not exact_supports(model):
+        if exact:
+            raise ValueError(
+                "Exact attribution requires a scikit-learn pipeline of a word-level text vectorizer and a linear or "
+                "tree-based classifier."
+            )
+        return classes
+    replaced = [cls.__name__ for cls in classes if cls.__name__ in ATTRIBUTION_METHODS]
+    if len(replaced) > 1:
+        warnings.warn(
+            f'Methods {", ".join(replaced)} are all replaced by one exact feature attribution; pass `exact=False` to '
+            "explain with each of them"
+        )
+    res = []
+    for cls in classes:
+        cls = ExactAttribution if cls.__name__ in ATTRIBUTION_METHODS else cls
+        if cls not in res:
+            res.append(cls)
+    return res
+
+
+def _adaptive_settings(adaptive: bool, max_samples: int, time_budget: Optional[float], kwargs: dict) -> Optional[dict]:
+    """Settings for `explain_adaptive()` if adaptive, taking `top_k` and `tolerance` out of the keyword arguments."""
+    if not adaptive:
+        return None
+    if "n_samples" not in kwargs:
+        kwargs["n_samples"] = 50
+    return {
+        "max_samples": max_samples,
+        "time_budget": time_budget,
+        "top_k": kwargs.pop("top_k", 5),
+        "tolerance": kwargs.pop("tolerance", 0.05),
+    }
+
+
+def _hierarchical_settings(
+    hierarchical: Union[bool, str], top_segments: int, shared_neighbourhood: bool
+) -> Optional[dict]:
+    """Settings for `explain_hierarchical()` if hierarchical, where True explains per sentence first.
+
+    Raises:
+        ValueError: Unknown segment level, `top_segments` < 1 or combined with a shared neighbourhood.
+    """
+    if hierarchical is False or hierarchical is None:
+        return None
+    level = "sentences" if hierarchical is True else hierarchical
+    if level not in SEGMENT_LEVELS:
+        raise ValueError(f'Unknown segment level "{level}", choose from {list(SEGMENT_LEVELS)}.')
+    if top_segments < 1:
+        raise ValueError(f"{top_segments=} should be >= 1!")
+    if shared_neighbourhood:
+        raise ValueError("Hierarchical explanations cannot share a neighbourhood between methods.")
+    return {"level": level, "top_segments": top_segments}
+
+
+# Arguments of `token_frequency()` and `token_information()` that are not passed to `CountVectorizer`
+GLOBAL_EXPLANATION_KWARGS = frozenset(["explain_model", "labelwise", "k", "filter_words", "lower"])
 
 
 class Explainer(Readable, IngestiblesMixin):
@@ -33,6 +191,7 @@ class Explainer(Readable, IngestiblesMixin):
         data: Optional[Environment] = None,
         model: Optional[AbstractClassifier] = None,
         ingestibles: Optional[Ingestible] = None,
+        cache: Optional[Union[str, ExplanationCache]] = None,
         **kwargs,
     ):
         """The Explainer creates explanations corresponding to a model and dataset (with ground-truth labels).
@@ -61,30 +220,105 @@ class Explainer(Readable, IngestiblesMixin):
 
             >>> explainer.prototypes(n=5, splits='train')
 
+            Store explanations on disk, so they are only computed once across sessions:
+
+            >>> explainer = Explainer(data=data, model=model, cache='.explabox_cache')
+
         Args:
             data (Optional[Environment], optional): Data for ingestibles. Defaults to None.
             model (Optional[AbstractClassifier], optional): Model for ingestibles. Defaults to None.
             ingestibles (Optional[Ingestible], optional): Ingestible. Defaults to None.
+            cache (Optional[Union[str, ExplanationCache]], optional): Cache (or its directory) to store explanations
+                in and return them from, keyed by their inputs, method, arguments (including seed) and model. If None
+                explanations are not cached. Embeddings of splits are cached in memory regardless, and also stored in
+                its directory if given. Defaults to None.
         """
         if ingestibles is None:
             ingestibles = Ingestible(data=data, model=model)
         self.ingestibles = ingestibles
+        self.cache = ExplanationCache(cache) if isinstance(cache, (str, os.PathLike)) else cache
+        self._embeddings = EmbeddingCache(self.cache.directory / "embeddings" if self.cache is not None else None)
         self.check_requirements(["data", "model"])
 
+    def __cached(self, method: str, inputs, params: dict, compute: Callable, model=None):
+        """Explanation from the cache, or computed (and cached) if it is not in the cache or there is no cache."""
+        if self.cache is None:
+            return compute()
+        return self.cache.get_or_compute(self.cache.key(method, inputs, params, model=model), compute)
+
     @restyle
     def explain_prediction(
         self,
         sample: Union[int, str],
         *args,
         methods: Union[str, List[str]] = ["lime"],
+        shared_neighbourhood: bool = False,
+        adaptive: bool = False,
+        max_samples: int = 2000,
+        time_budget: Optional[float] = None,
+        exact: Optional[bool] = False,
+        hierarchical: Union[bool, str] = False,
+        top_segments: int = 3,
+        n_jobs: int = 1,
+        backend: str = "threads",
         **kwargs,
     ) -> Optional[MultipleReturn]:
         """Explain specific sample locally.
 
+        Methods that leave tokens out of the sample ('lime', 'shap', 'baylime', 'tree', 'rules', 'foil_tree') generate
+        their neighbourhood as one boolean mask matrix (see `explain.text.perturbation`). If the model is a scikit-learn
+        pipeline starting with a text vectorizer, the perturbed samples are featurized from their tokens and only the
+        rest of the pipeline is called (see `explain.text.featurization`).
+
+        Examples:
+            Explain with LIME, KernelSHAP and BayLIME, generating and predicting one perturbed neighbourhood for all:
+
+            >>> explainer.explain_prediction('I love this so much!', methods=['lime', 'kernel_shap', 'baylime'],
+            ...                              shared_neighbourhood=True)
+
+            Explain with LIME, doubling the number of samples (starting at 50) until the top-5 features and their
+            scores are stable, using at most 5000 samples or 2 seconds:
+
+            >>> explainer.explain_prediction('I love this so much!', methods='lime', adaptive=True, n_samples=50,
+            ...                              max_samples=5000, time_budget=2.0)
+
+            Explain a scikit-learn pipeline of a `TfidfVectorizer` and `LogisticRegression` with the exact contribution
+            (coefficient times feature value) of each token, instead of sampling with LIME:
+
+            >>> explainer.explain_prediction('I love this so much!', methods='lime', exact=True)
+
+            Explain a long document with KernelSHAP per paragraph, and then per token in the top-2 paragraphs:
+
+            >>> explainer.explain_prediction(document, methods='shap', hierarchical='paragraphs', top_segments=2)
+
         Args:
             sample: Identifier of sample in dataset (int) or input (str).
             methods: List of methods to get explanations from. Choose from 'lime', 'shap', 'baylime',
                 'tree', 'rules', 'foil_tree'.
+            shared_neighbourhood: Whether 'lime', 'shap' and 'baylime' fit their surrogate models (each with their own
+                weighting) on one shared neighbourhood, a random design drawn with the seed of the first of them,
+                instead of each generating and predicting their own. Defaults to False.
+            adaptive: Whether to start at `n_samples` and keep doubling the number of samples until the top-k (`top_k`,
+                default 5) features and their scores (up to a relative `tolerance`, default 0.05) no longer change.
+                Each round only draws and predicts the additional samples, and refits on all samples so far (methods
+                then run in threads). Defaults to False.
+            max_samples: Maximum total number of samples when adaptive. Defaults to 2000.
+            time_budget: Maximum number of seconds to spend when adaptive; if None there is no time limit.
+                Defaults to None.
+            exact: Whether to replace 'lime', 'shap' and 'baylime' by exact feature attribution (coefficient times
+                feature value for linear models, TreeSHAP for tree ensembles), relative to the empty text. If True they
+                must be replaced, if None they are replaced if the model is a supported scikit-learn pipeline (see
+                `explain.text.exact.supports()`) and if False they are never replaced. All requested methods are
+                replaced by one explanation (with a warning if there are several). Defaults to False.
+            hierarchical: Whether 'lime', 'shap' and 'baylime' first explain per segment ('sentences' or
+                'paragraphs', True for sentences) and then per token inside the `top_segments` most important
+                segments, returning both explanations (see `explain.text.hierarchical`). Other methods explain per
+                token as usual. Defaults to False.
+            top_segments: Number of segments explained per token when hierarchical. Defaults to 3.
+            n_jobs: Number of methods run at the same time (unless they share a neighbourhood); -1 uses all CPUs. The
+                seed of each method is spawned from `seed` (default 0), so results do not depend on `n_jobs`.
+                Defaults to 1.
+            backend: Run methods on 'threads' or 'processes'. Defaults to 'threads'.
             *args: Positional arguments passed to local explanation technique.
             **kwargs: Keyword arguments passed to local explanation technique.
 
@@ -94,78 +328,257 @@ class Explainer(Readable, IngestiblesMixin):
         if isinstance(methods, str):
             methods = [methods]
         if isinstance(sample, int):
-            test, train = self.ingestibles.get_named_split("test"), self.ingestibles.get_named_split("train")
-            if test is not None and sample in test:
-                sample = test[sample]
-            elif train is not None and sample in train:
-                sample = train[sample]
-            else:
-                raise Exception(f"Unknown instance identifier {sample}.")
+            sample = self.__get_instance(sample)
         elif isinstance(sample, str):
             from text_explainability import from_string
 
             sample = from_string(sample)
 
+        adaptive = _adaptive_settings(adaptive, max_samples, time_budget, kwargs)
+        hierarchical = _hierarchical_settings(hierarchical, top_segments, shared_neighbourhood)
         if "labels" not in kwargs:
             kwargs["labels"] = self.labelset
         if "n_samples" not in kwargs:
             kwargs["n_samples"] = 200
 
-        res = []
-        for method in [str.lower(m) for m in methods]:
-            cls = None
-            if method in ["lime"]:
-                from text_explainability.local_explanation import LIME
-
-                cls = LIME
-            elif method in ["baylime"]:
-                from text_explainability.local_explanation import BayLIME
-
-                cls = BayLIME
-            elif method in ["anchor", "anchors"]:
-                from text_explainability.local_explanation import Anchor
-
-                cls = Anchor
-            elif method in ["shap", "shapley", "kernelshap", "kernel_shap"]:
-                from text_explainability.local_explanation import KernelSHAP
-
-                cls = KernelSHAP
-            elif method in ["local_tree", "tree"]:
-                from text_explainability.local_explanation import LocalTree
-
-                cls = LocalTree
-            elif method in ["local_rules", "rules"]:
-                from text_explainability.local_explanation import LocalRules
-
-                if "foil_fn" not in kwargs:
-                    warnings.warn("No `foil_fn` provided for local rules, defaulting to class 0.")
-                    kwargs["foil_fn"] = 0
-
-                cls = LocalRules
-            elif method in [
-                "foil",
-                "foiltree",
-                "foil_tree",
-                "contrastive",
-                "contrastive_explanation",
-            ]:
-                from text_explainability.local_explanation import FoilTree
-
-                if "foil_fn" not in kwargs:
-                    raise ValueError("`foil_fn` is required for contrastive explanation.")
-
-                cls = FoilTree
-            if cls is not None:
-                res.append(cls(env=None, labelset=self.labelset)(sample, self.model, **kwargs))
-            else:
-                warnings.warn(f'Unknown method "{method}". Skipping to next one')
-        if len(res) == 0:
+        classes = _exact_classes(_local_explanation_classes(methods, kwargs), self.model, exact)
+        if len(classes) == 0:
+            raise Exception("No valid methods provided.")
+        return MultipleReturn(
+            *self.__explain_sample(
+                sample,
+                featurized(self.model),
+                classes,
+                shared_neighbourhood,
+                kwargs,
+                adaptive=adaptive,
+                hierarchical=hierarchical,
+                n_jobs=n_jobs,
+                backend=backend,
+            )
+        )
+
+    def _explain_method(self, sample, model, cls, seed: int, kwargs: dict, neighbourhood=None, growing=None):
+        """Explain a sample with one local explanation class, seeded with `seed`."""
+        method = cls(env=None, labelset=self.labelset, seed=seed)
+        if masks_supports(method):
+            method = perturb_with_masks(method, growing=growing)
+        if neighbourhood is not None and neighbourhood.is_shareable(method):
+            method = neighbourhood.share(method)
+        return method(sample, model, **kwargs)
+
+    def _explain_hierarchical(
+        self, sample, model, cls, seed: int, kwargs: dict, hierarchical: dict, growing=None
+    ) -> list:
+        """Explain a sample with one local explanation class per segment and then per token in the top segments.
+
+        Classes that do not attribute scores to tokens they leave out are explained per token as usual.
+        """
+        if cls.__name__ not in ATTRIBUTION_METHODS or not masks_supports(cls):
+            return [self._explain_method(sample, model, cls, seed, kwargs, growing=growing)]
+
+        def explain(part, document, columns, detokenizer, n_samples):
+            method = cls(env=None, labelset=self.labelset, seed=seed)
+            method.augmenter.detokenizer = detokenizer
+            return perturb_with_masks(method, document=document, columns=columns, growing=growing)(
+                part, model, **dict(kwargs, n_samples=n_samples)
+            )
+
+        return explain_hierarchical(explain, sample.data, n_samples=kwargs["n_samples"], **hierarchical)
+
+    def __explain_sample(
+        self,
+        sample,
+        model,
+        classes: list,
+        shared_neighbourhood: bool,
+        kwargs: dict,
+        adaptive: Optional[dict] = None,
+        hierarchical: Optional[dict] = None,
+        n_jobs: int = 1,
+        backend: str = "threads",
+    ) -> list:
+        """Explain a sample with each local explanation class, optionally shared, adaptive or hierarchical."""
+        seeds = unit_seeds(kwargs.get("seed", 0), [cls.__name__ for cls in classes])
+        if shared_neighbourhood:  # the neighbourhood is generated with the seed of the first method that shares it
+            shared = [seed for cls, seed in zip(classes, seeds) if SharedNeighbourhood.is_shareable(cls)]
+            seeds = [shared[0] if SharedNeighbourhood.is_shareable(cls) else seed for cls, seed in zip(classes, seeds)]
+        method_kwargs = {key: value for key, value in kwargs.items() if key != "seed"}
+        # Adaptive rounds grow the neighbourhoods of the previous round, which are kept in this process
+        growing = [GrowingNeighbourhood() if adaptive is not None else None for _ in classes]
+        if adaptive is not None:
+            backend = "threads"
+
+        def explain(n_samples: int) -> list:
+            units = [
+                (sample, model, cls, seed, dict(method_kwargs, n_samples=n_samples))
+                for cls, seed in zip(classes, seeds)
+            ]
+            if shared_neighbourhood:  # methods fit on one neighbourhood, so they are not independent
+                neighbourhood = SharedNeighbourhood()
+                return [
+                    self._explain_method(*unit, neighbourhood=neighbourhood, growing=grown)
+                    for unit, grown in zip(units, growing)
+                ]
+            if hierarchical is not None:
+                units = [(*unit, hierarchical, grown) for unit, grown in zip(units, growing)]
+                explanations = run_parallel(self._explain_hierarchical, units, n_jobs=n_jobs, backend=backend)
+                return [explanation for explained in explanations for explanation in explained]
+            units = [(*unit, None, grown) for unit, grown in zip(units, growing)]
+            return run_parallel(self._explain_method, units, n_jobs=n_jobs, backend=backend)
+
+        def compute() -> list:
+            if adaptive is None:
+                return explain(kwargs["n_samples"])
+            return explain_adaptive(explain, min_samples=kwargs["n_samples"], **adaptive)
+
+        params = dict(kwargs, shared_neighbourhood=shared_neighbourhood, adaptive=adaptive, hierarchical=hierarchical)
+        return self.__cached([cls.__name__ for cls in classes], sample.data, params, compute, model=self.model)
+
+    def __get_instance(self, key: int):
+        """Instance with identifier `key` in the test or train split."""
+        test, train = self.ingestibles.get_named_split("test"), self.ingestibles.get_named_split("train")
+        if test is not None and key in test:
+            return test[key]
+        elif train is not None and key in train:
+            return train[key]
+        raise Exception(f"Unknown instance identifier {key}.")
+
+    def explain_predictions(
+        self,
+        samples: Union[str, Sequence[Union[int, str]]] = "test",
+        *args,
+        methods: Union[str, List[str]] = ["lime"],
+        shared_neighbourhood: bool = False,
+        adaptive: bool = False,
+        max_samples: int = 2000,
+        time_budget: Optional[float] = None,
+        exact: Optional[bool] = False,
+        path: Optional[str] = None,
+        n_concurrent: int = 32,
+        max_batch_size: int = 10_000,
+        **kwargs,
+    ) -> Union[Dict[Union[int, str], MultipleReturn], str]:
+        """Explain many samples locally, pooling the model calls of all explanations into large batches.
+
+        Up to `n_concurrent` samples are explained at the same time. Whenever all of them are waiting for predictions of
+        their perturbed neighbourhoods, these are concatenated and predicted with a single model call (of at most
+        `max_batch_size` instances), after which the predictions are split back to each sample.
+
+        Examples:
+            Explain all instances in the test set with LIME, writing each explanation to a file as soon as it is done:
+
+            >>> explainer.explain_predictions('test', methods=['lime'], path='explanations.jsonl')
+
+            Explain two instances by their identifier and a text:
+
+            >>> explainer.explain_predictions([0, 1, 'I love this so much!'], methods=['lime', 'kernel_shap'])
+
+        Args:
+            samples (Union[str, Sequence[Union[int, str]]], optional): Name of a split to explain all instances of, or
+                identifiers of samples in the dataset (int) and inputs (str). Defaults to 'test'.
+            methods (Union[str, List[str]], optional): List of methods to get explanations from. Choose from 'lime',
+                'shap', 'baylime', 'tree', 'rules', 'foil_tree'. Defaults to ['lime'].
+            shared_neighbourhood (bool, optional): Whether 'lime', 'shap' and 'baylime' share one neighbourhood per
+                sample. Defaults to False.
+            adaptive (bool, optional): Whether to adaptively choose the number of samples for each sample (see
+                `explain_prediction()`). Defaults to False.
+            max_samples (int, optional): Maximum total number of samples when adaptive. Defaults to 2000.
+            time_budget (Optional[float], optional): Maximum number of seconds to spend per sample when adaptive.
+                Defaults to None.
+            exact (Optional[bool], optional): Whether to replace 'lime', 'shap' and 'baylime' by exact feature
+                attribution (see `explain_prediction()`). Defaults to False.
+            path (Optional[str], optional): Path of a JSON lines file to stream the explanations to, one line with the
+                sample and the configuration of its explanations per sample. Defaults to None.
+            n_concurrent (int, optional): Number of samples explained concurrently. Defaults to 32.
+            max_batch_size (int, optional): Maximum number of instances in one model call. Defaults to 10,000.
+            *args: Positional arguments passed to local explanation technique.
+            **kwargs: Keyword arguments passed to local explanation technique.
+
+        Raises:
+            Exception: No valid methods provided.
+
+        Returns:
+            Union[Dict[Union[int, str], MultipleReturn], str]: Explanations for each sample (in the order of `samples`),
+                or the path if the explanations are streamed to a file.
+        """
+        from text_explainability import from_string
+
+        if isinstance(methods, str):
+            methods = [methods]
+        if isinstance(samples, str):
+            named_split = self.ingestibles.get_named_split(samples, validate=True)
+            samples = [(key, named_split[key].data) for key in named_split.key_list]
+        else:
+            samples = [
+                (sample, sample if isinstance(sample, str) else self.__get_instance(sample).data) for sample in samples
+            ]
+
+        adaptive = _adaptive_settings(adaptive, max_samples, time_budget, kwargs)
+        if "labels" not in kwargs:
+            kwargs["labels"] = self.labelset
+        if "n_samples" not in kwargs:
+            kwargs["n_samples"] = 200
+        classes = _exact_classes(_local_explanation_classes(methods, kwargs), self.model, exact)
+        if len(classes) == 0:
             raise Exception("No valid methods provided.")
-        return MultipleReturn(*res)
+
+        model = PooledClassifier(featurized(self.model), max_batch_size=max_batch_size)
+
+        def explain(key, data) -> MultipleReturn:
+            with model.worker():
+                # A new instance, as local explanation methods alter the instance they explain
+                sample = from_string(data)
+                explanations = self.__explain_sample(
+                    sample, model, classes, shared_neighbourhood, kwargs, adaptive=adaptive
+                )
+                return MultipleReturn(*[replace_renderer(explanation) for explanation in explanations])
+
+        explanations, todo = {}, iter(samples)
+        with ThreadPoolExecutor(max_workers=n_concurrent) as executor, (
+            open(path, "w", encoding="utf-8") if path is not None else nullcontext()
+        ) as file:
+            running = {executor.submit(explain, *sample): sample[0] for sample in islice(todo, 2 * n_concurrent)}
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    key = running.pop(future)
+                    if file is not None:
+                        config = [explanation.to_config() for explanation in future.result()]
+                        file.write(srsly.json_dumps({"sample": key, "explanations": config}) + "\n")
+                        file.flush()
+                    else:
+                        explanations[key] = future.result()
+                running.update({executor.submit(explain, *sample): sample[0] for sample in islice(todo, len(done))})
+
+        if path is not None:
+            return path
+        return {key: explanations[key] for key, _ in samples}
 
     def __return_explanations(self, explanations):
         return MultipleReturn(*explanations) if len(explanations) > 1 else explanations[0]
 
+    def _explain_split(self, method: str, split: str, seed: int, params: dict):
+        """Explain a split with `TokenFrequency` or `TokenInformation`, unless the explanation is cached."""
+        import text_explainability
+
+        from . import terms
+
+        instances = self.ingestibles.get_named_split(split, validate=True)
+        count_vectorizer_kwargs = {key: value for key, value in params.items() if key not in GLOBAL_EXPLANATION_KWARGS}
+
+        def compute():
+            if DocumentTermMatrix.supports(count_vectorizer_kwargs):
+                matrix = terms.document_terms(instances, lower=params["lower"], **count_vectorizer_kwargs)
+                explanation = getattr(terms, method)(instances, matrix, seed=seed)
+            else:  # e.g. `min_df` or `max_features` depend on the instances selected
+                explanation = getattr(text_explainability, method)(instances, seed=seed)
+            return explanation(model=self.model, labelprovider=self.labels, **params)
+
+        return self.__cached(
+            method, fingerprint_instances(instances, self.labels), dict(params, seed=seed), compute, model=self.model
+        )
+
     @restyle
     def token_frequency(
         self,
@@ -176,6 +589,8 @@ class Explainer(Readable, IngestiblesMixin):
         filter_words: List[str] = translate_list("stopwords"),
         lower: bool = True,
         seed: int = 0,
+        n_jobs: int = 1,
+        backend: str = "threads",
         **count_vectorizer_kwargs,
     ) -> Union[FeatureList, MultipleReturn]:
         """Show the top-k number of tokens for each ground-truth or predicted label.
@@ -188,30 +603,27 @@ class Explainer(Readable, IngestiblesMixin):
             k (Optional[int], optional): Limit to the top-k words per label, or all words if None. Defaults to 25.
             filter_words (List[str], optional): Words to filter out from top-k. Defaults to ['a', 'an', 'the'].
             lower (bool, optional): Whether to make all tokens lowercase. Defaults to True.
-            seed (int, optional). Seed for reproducibility. Defaults to 0.
+            seed (int, optional). Seed for reproducibility, from which the seed of each split is spawned. Defaults to 0.
+            n_jobs (int, optional): Number of splits explained at the same time; -1 uses all CPUs. Defaults to 1.
+            backend (str, optional): Run splits on 'threads' or 'processes'. Defaults to 'threads'.
             **count_vectorizer_kwargs: Optional arguments passed to `CountVectorizer`/`FastCountVectorizer`.
 
         Returns:
             Union[FeatureList, MultipleReturn]: Each label with corresponding top words and their frequency
         """
-        from text_explainability import TokenFrequency
-
         if isinstance(splits, str):
             splits = [splits]
 
-        explanations = [
-            TokenFrequency(self.ingestibles.get_named_split(split, validate=True), seed=seed)(
-                model=self.model,
-                labelprovider=self.labels,
-                explain_model=explain_model,
-                labelwise=labelwise,
-                k=k,
-                lower=lower,
-                filter_words=filter_words,
-                **count_vectorizer_kwargs,
-            )
-            for split in splits
-        ]
+        params = dict(
+            explain_model=explain_model,
+            labelwise=labelwise,
+            k=k,
+            lower=lower,
+            filter_words=filter_words,
+            **count_vectorizer_kwargs,
+        )
+        units = [("TokenFrequency", split, s, params) for split, s in zip(splits, unit_seeds(seed, splits))]
+        explanations = run_parallel(self._explain_split, units, n_jobs=n_jobs, backend=backend)
 
         return self.__return_explanations(explanations)
 
@@ -224,6 +636,8 @@ class Explainer(Readable, IngestiblesMixin):
         filter_words: List[str] = translate_list("stopwords"),
         lower: bool = True,
         seed: int = 0,
+        n_jobs: int = 1,
+        backend: str = "threads",
         **count_vectorizer_kwargs,
     ) -> Union[FeatureList, MultipleReturn]:
         """Show the top-k token mutual information for a dataset or model.
@@ -236,33 +650,63 @@ class Explainer(Readable, IngestiblesMixin):
             k (Optional[int], optional): Limit to the top-k words per label, or all words if None. Defaults to 25.
             filter_words (List[str], optional): Words to filter out from top-k. Defaults to ['a', 'an', 'the'].
             lower (bool, optional): Whether to make all tokens lowercase. Defaults to True.
-            seed (int, optional). Seed for reproducibility. Defaults to 0.
+            seed (int, optional). Seed for reproducibility, from which the seed of each split is spawned. Defaults to 0.
+            n_jobs (int, optional): Number of splits explained at the same time; -1 uses all CPUs. Defaults to 1.
+            backend (str, optional): Run splits on 'threads' or 'processes'. Defaults to 'threads'.
             **count_vectorizer_kwargs: Optional arguments passed to `CountVectorizer`/`FastCountVectorizer`.
 
         Returns:
             Union[FeatureList, MultipleReturn]: k labels, sorted based on their mutual information with
                 the output (predictive model labels or ground-truth labels)
         """
-        from text_explainability import TokenInformation
-
         if isinstance(splits, str):
             splits = [splits]
 
-        explanations = [
-            TokenInformation(self.ingestibles.get_named_split(split, validate=True), seed=seed)(
-                model=self.model,
-                labelprovider=self.labels,
-                explain_model=explain_model,
-                k=k,
-                filter_words=filter_words,
-                lower=lower,
-                **count_vectorizer_kwargs,
-            )
-            for split in splits
-        ]
+        params = dict(
+            explain_model=explain_model, k=k, filter_words=filter_words, lower=lower, **count_vectorizer_kwargs
+        )
+        units = [("TokenInformation", split, s, params) for split, s in zip(splits, unit_seeds(seed, splits))]
+        explanations = run_parallel(self._explain_split, units, n_jobs=n_jobs, backend=backend)
 
         return self.__return_explanations(explanations)
 
+    def _prototypes(
+        self,
+        method: str,
+        split: str,
+        seed: int,
+        n: int,
+        embedder: Optional[Embedder],
+        labelwise: bool,
+        approximate: Optional[dict] = None,
+    ):
+        """Select prototypes of a split with (labelwise, approximate) MMDCritic or KMedoids, unless they are cached."""
+        import text_explainability
+
+        from . import prototypes
+
+        cls = getattr(text_explainability, f"Labelwise{method}" if labelwise else method)
+        instances = self.ingestibles.get_named_split(split, validate=True)
+        kwargs = {"labels": self.labels} if labelwise else {}
+        if method == "KMedoids" or approximate is not None:
+            kwargs["seed"] = seed
+        if approximate is not None:
+            approximations = {
+                "MMDCritic": (prototypes.ApproximateMMDCritic, prototypes.LabelwiseApproximateMMDCritic),
+                "KMedoids": (prototypes.FastKMedoids, prototypes.LabelwiseFastKMedoids),
+            }
+            cls = approximations[method][labelwise]
+            kwargs.update(approximate)
+
+        return self.__cached(
+            cls.__name__,
+            fingerprint_instances(instances, self.labels if labelwise else None),
+            dict(n=n, embedder=embedder_key(embedder) or embedder, **kwargs),
+            lambda: cls(
+                instances=self._embeddings.embed(split, instances, embedder), embedder=embedder, **kwargs
+            ).prototypes(n=n),
+        )
+
     @restyle
     def prototypes(
         self,
@@ -272,16 +716,42 @@ class Explainer(Readable, IngestiblesMixin):
         embedder: Optional[Embedder] = TfidfVectorizer,
         labelwise: bool = False,
         seed: int = 0,
+        approximate: bool = False,
+        n_components: int = 500,
+        n_init: int = 5,
+        time_budget: Optional[float] = None,
+        n_jobs: int = 1,
+        backend: str = "threads",
     ) -> Union[Instances, MultipleReturn]:
         """Select n prototypes (representative samples) for the given split(s).
 
+        Examples:
+            Select prototypes of a large split with MMD-critic on a rank-500 approximation of its kernel, with the
+            relative error of the approximation in the meta information:
+
+            >>> prototypes = explainer.prototypes(splits='train', approximate=True, n_components=500)
+            >>> prototypes.meta['approximation']
+
+            Select prototypes of a large split with k-medoids on 10 samples (CLARA), spending at most a minute:
+
+            >>> explainer.prototypes(method='kmedoids', splits='train', approximate=True, n_init=10, time_budget=60)
+
         Args:
             method (str, optional): Method(s) to apply. Choose from ['mmdcritic', 'kmedoids']. Defaults to 'mmdcritic'.
             n (int, optional): Number of prototypes to generate. Defaults to 5.
             splits (Union[str, List[str]], optional): Name(s) of split(s). Defaults to "test".
             embedder (Optional[Embedder], optional): Embedder used. Defaults to TfidfVectorizer.
             labelwise (bool, optional): Select for each label. Defaults to False.
-            seed (int, optional): Seed for reproducibility. Defaults to 0.
+            seed (int, optional): Seed for reproducibility, from which the seed of each split and method is spawned.
+                Defaults to 0.
+            approximate (bool, optional): Run 'mmdcritic' on a Nyström approximation of the kernel and 'kmedoids' on
+                samples of the split (CLARA), keeping memory linear in the size of the split. Defaults to False.
+            n_components (int, optional): Rank of the approximation of 'mmdcritic' if `approximate`. Defaults to 500.
+            n_init (int, optional): Number of samples (restarts) of 'kmedoids' if `approximate`. Defaults to 5.
+            time_budget (Optional[float], optional): Maximum number of seconds 'kmedoids' spends on each split (or
+                label) if `approximate`; if None there is no time limit. Defaults to None.
+            n_jobs (int, optional): Number of splits and methods run at the same time; -1 uses all CPUs. Defaults to 1.
+            backend (str, optional): Run splits and methods on 'threads' or 'processes'. Defaults to 'threads'.
 
         Raises:
             ValueError: Unknown method selected.
@@ -293,31 +763,64 @@ class Explainer(Readable, IngestiblesMixin):
             method = [method]
         method = [str.lower(m) for m in method]
 
-        from text_explainability import KMedoids, LabelwiseKMedoids, LabelwiseMMDCritic, MMDCritic
-
-        methods = {
-            "mmdcritic": (MMDCritic, LabelwiseMMDCritic),
-            "kmedoids": (KMedoids, LabelwiseKMedoids),
-        }
+        methods = {"mmdcritic": "MMDCritic", "kmedoids": "KMedoids"}
+        for m in method:
+            if m not in methods:
+                raise ValueError(f'Unknown method "{m}", choose from {list(methods.keys())}')
 
         if isinstance(splits, str):
             splits = [splits]
 
-        def inner(m, split):
-            if m not in methods:
-                raise ValueError(f'Unknown method "{m}", choose from {list(methods.keys())}')
-            instances = self.ingestibles.get_named_split(split, validate=True)
-            if labelwise:
-                return methods[m][1](instances=instances, labels=self.labels, embedder=embedder).prototypes(n=n)
-            return methods[m][0](instances=instances, embedder=embedder).prototypes(n=n)
-
-        explanations = []
-        for split in splits:
-            for m in method:
-                explanations.append(inner(m, split))
+        names = [(split, m) for split in splits for m in method]
+        approximations = {
+            "MMDCritic": dict(n_components=n_components),
+            "KMedoids": dict(n_init=n_init, time_budget=time_budget),
+        }
+        units = [
+            (methods[m], split, s, n, embedder, labelwise, approximations[methods[m]] if approximate else None)
+            for (split, m), s in zip(names, unit_seeds(seed, names))
+        ]
+        explanations = run_parallel(self._prototypes, units, n_jobs=n_jobs, backend=backend)
 
         return self.__return_explanations(explanations)
 
+    def _prototypes_criticisms(
+        self,
+        split: str,
+        n_prototypes: int,
+        n_criticisms: int,
+        embedder: Optional[Embedder],
+        labelwise: bool,
+        approximate: Optional[dict],
+        kwargs,
+    ):
+        """Select prototypes and criticisms of a split with (labelwise, approximate) MMDCritic, unless cached."""
+        from text_explainability import LabelwiseMMDCritic, MMDCritic
+
+        from .prototypes import ApproximateMMDCritic, LabelwiseApproximateMMDCritic
+
+        instances = self.ingestibles.get_named_split(split, validate=True)
+        init_kwargs = {"labels": self.labels} if labelwise else {}
+        if approximate is not None:
+            cls = LabelwiseApproximateMMDCritic if labelwise else ApproximateMMDCritic
+            init_kwargs.update(approximate)
+        else:
+            cls = LabelwiseMMDCritic if labelwise else MMDCritic
+        return self.__cached(
+            cls.__name__,
+            fingerprint_instances(instances, self.labels if labelwise else None),
+            dict(
+                n_prototypes=n_prototypes,
+                n_criticisms=n_criticisms,
+                embedder=embedder_key(embedder) or embedder,
+                **init_kwargs,
+                **kwargs,
+            ),
+            lambda: cls(instances=self._embeddings.embed(split, instances, embedder), embedder=embedder, **init_kwargs)(
+                n_prototypes=n_prototypes, n_criticisms=n_criticisms, **kwargs
+            ),
+        )
+
     @restyle
     def prototypes_criticisms(
         self,
@@ -326,6 +829,11 @@ class Explainer(Readable, IngestiblesMixin):
         splits: Union[str, List[str]] = "test",
         embedder: Optional[Embedder] = TfidfVectorizer,
         labelwise: bool = False,
+        approximate: bool = False,
+        n_components: int = 500,
+        seed: int = 0,
+        n_jobs: int = 1,
+        backend: str = "threads",
         **kwargs,
     ) -> Union[Instances, MultipleReturn]:
         """Select n prototypes (representative samples) and n criticisms (outliers) for the given split(s).
@@ -336,22 +844,37 @@ class Explainer(Readable, IngestiblesMixin):
             splits (Union[str, List[str]], optional): Name(s) of split(s). Defaults to "test".
             embedder (Optional[Embedder], optional): Embedder used. Defaults to TfidfVectorizer.
             labelwise (bool, optional): Select for each label. Defaults to False.
+            approximate (bool, optional): Select on a Nyström approximation of the kernel, keeping time and memory
+                linear in the size of the split. Its relative error is in the meta information. Defaults to False.
+            n_components (int, optional): Rank of the approximation if `approximate`. Defaults to 500.
+            seed (int, optional): Seed for the approximation, from which the seed of each split is spawned.
+                Defaults to 0.
+            n_jobs (int, optional): Number of splits run at the same time; -1 uses all CPUs. Defaults to 1.
+            backend (str, optional): Run splits on 'threads' or 'processes'. Defaults to 'threads'.
+            **kwargs: Arguments passed to the selection of criticisms (e.g. `regularizer`).
 
         Returns:
             Union[Instances, MultipleReturn]: Prototypes for each methods and split.
         """
-        from text_explainability import LabelwiseMMDCritic, MMDCritic
-
         if isinstance(splits, str):
             splits = [splits]
 
-        def inner(split):
-            instances = self.ingestibles.get_named_split(split, validate=True)
-            m = (
-                LabelwiseMMDCritic(instances=instances, labels=self.labels, embedder=embedder)
-                if labelwise
-                else MMDCritic(instances=instances, embedder=embedder)
+        units = [
+            (
+                (
+                    split,
+                    n_prototypes,
+                    n_criticisms,
+                    embedder,
+                    labelwise,
+                    dict(n_components=n_components, seed=s),
+                    kwargs,
+                )
+                if approximate
+                else (split, n_prototypes, n_criticisms, embedder, labelwise, None, kwargs)
             )
-            return m(n_prototypes=n_prototypes, n_criticisms=n_criticisms, **kwargs)
-
-        return self.__return_explanations([inner(split) for split in splits])
+            for split, s in zip(splits, unit_seeds(seed, splits))
+        ]
+        return self.__return_explanations(
+            run_parallel(self._prototypes_criticisms, units, n_jobs=n_jobs, backend=backend)
+        )
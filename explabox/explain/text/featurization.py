@@ -0,0 +1,310 @@
+# Copyright (c) 2022 Marcel Robeer for National Police Lab AI (NPAI).
+#
+# This program is free software; you can redistribute it and/or modify it under the terms of the GNU Lesser General
+# Public License (LGPL) as published by the Free Software Foundation; either version 3 (LGPLv3) of the License, or (at
+# your option) any later version. You may not use this file except in compliance with the license. You may obtain a copy
+# of the license at:
+#
+#     https://www.gnu.org/licenses/lgpl-3.0.en.html
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+
+"""Featurize perturbed texts from their tokens for scikit-learn text pipelines, without re-tokenizing strings."""
+
+from itertools import chain, compress, repeat
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from scipy import sparse
+
+# Token patterns that only match runs of word characters. Detokenizers only join tokens without whitespace next to
+# punctuation, so the words of these patterns never span two tokens and the words of a text are those of its tokens
+WORD_PATTERNS = frozenset(
+    prefix + pattern for prefix in ("", "(?u)") for pattern in (r"\b\w\w+\b", r"\b\w+\b", r"\w\w+", r"\w+")
+)
+
+
+def _pipeline(model) -> Optional[object]:
+    """Fitted scikit-learn pipeline of a supported model (starting with a word-level text vectorizer), else None."""
+    from sklearn.feature_extraction.text import CountVectorizer
+    from sklearn.pipeline import Pipeline
+
+    pipeline = getattr(model, "innermodel", None)
+    if not isinstance(pipeline, Pipeline) or len(pipeline.steps) < 2:
+        return None
+    vectorizer = pipeline.steps[0][1]
+    if not isinstance(vectorizer, CountVectorizer) or vectorizer.analyzer != "word":
+        return None
+    if vectorizer.preprocessor is not None or vectorizer.tokenizer is not None:
+        return None
+    if vectorizer.token_pattern not in WORD_PATTERNS:
+        return None
+    return pipeline if hasattr(vectorizer, "vocabulary_") else None
+
+
+class _NGrams(dict):
+    """Feature index of each n-gram (tuple of words), looked up in the vocabulary once and -1 if it is unknown."""
+
+    def __init__(self, vocabulary: Dict[str, int]):
+        super().__init__()
+        self.vocabulary = vocabulary
+
+    def __missing__(self, gram: Tuple[str, ...]) -> int:
+        index = self[gram] = self.vocabulary.get(" ".join(gram), -1)
+        return index
+
+
+def supports(model) -> bool:
+    """Whether perturbed texts can be featurized from their tokens for a model.
+
+    That is a fitted scikit-learn pipeline starting with a word-level `CountVectorizer` or `TfidfVectorizer`, followed
+    by any other steps (e.g. a `TfidfTransformer` and a classifier). The vectorizer should have the default
+    preprocessor and tokenizer, and a token pattern of word characters (see `WORD_PATTERNS`, e.g. the default one), so
+    that its words never span two tokens. Other patterns (e.g. of all non-whitespace characters) can form words that
+    differ from those of the tokens once tokens are left out.
+
+    Args:
+        model (AbstractClassifier): Model (e.g. `instancelib.SkLearnDataClassifier`).
+
+    Returns:
+        bool: Whether the model is supported.
+    """
+    return _pipeline(model) is not None
+
+
+def featurized(model):
+    """The model as a `FeaturizedClassifier` if it is supported (see `supports()`), else the model itself."""
+    return FeaturizedClassifier(model) if supports(model) else model
+
+
+class TokenFeaturizer:
+    def __init__(self, vectorizer):
+        """Features of a fitted word-level text vectorizer, computed from tokens instead of from a string.
+
+        Each distinct token is analyzed once (preprocessing, token pattern and stop words of the vectorizer) and then
+        remembered, so featurizing a perturbed text only combines the words of its tokens into (n-gram) counts. Counts
+        are weighted as in `TfidfVectorizer` if the vectorizer is one.
+
+        Args:
+            vectorizer (CountVectorizer): Fitted vectorizer with a word analyzer.
+        """
+        from sklearn.feature_extraction.text import TfidfVectorizer
+
+        self.vectorizer = vectorizer
+        self.tfidf = isinstance(vectorizer, TfidfVectorizer)
+        self._preprocess, self._tokenize = vectorizer.build_preprocessor(), vectorizer.build_tokenizer()
+        self._stop_words = vectorizer.get_stop_words() or frozenset()
+        self._words: Dict[str, Tuple[str, ...]] = {}
+        self._unigrams: Dict[str, Tuple[int, ...]] = {}
+        self._ngrams = _NGrams(vectorizer.vocabulary_)
+
+    def words(self, token: str) -> Tuple[str, ...]:
+        """Words of a token after analysis by the vectorizer, before forming n-grams."""
+        words = self._words.get(token)
+        if words is None:
+            words = tuple(w for w in self._tokenize(self._preprocess(token)) if w not in self._stop_words)
+            self._words[token] = words
+        return words
+
+    def unigrams(self, token: str) -> Tuple[int, ...]:
+        """Feature indices of the words of a token."""
+        indices = self._unigrams.get(token)
+        if indices is None:
+            vocabulary = self.vectorizer.vocabulary_
+            indices = tuple(vocabulary[w] for w in self.words(token) if w in vocabulary)
+            self._unigrams[token] = indices
+        return indices
+
+    def transform(self, tokenized: Sequence[Sequence[str]]) -> sparse.csr_matrix:
+        """Features of tokenized texts, equal to those of the vectorizer for their (detokenized) strings.
+
+        Args:
+            tokenized (Sequence[Sequence[str]]): Tokens of each text.
+
+        Returns:
+            sparse.csr_matrix: Feature matrix (n_texts x n_features).
+        """
+        vectorizer, vocabulary = self.vectorizer, self.vectorizer.vocabulary_
+        min_n, max_n = vectorizer.ngram_range
+        indices: List[int] = []  # feature of each (n-gram) word, -1 if unknown
+        lengths = []
+        for tokens in tokenized:
+            start = len(indices)
+            if min_n == max_n == 1:
+                indices.extend(chain.from_iterable(map(self.unigrams, tokens)))
+            else:
+                words = list(chain.from_iterable(map(self.words, tokens)))
+                for n in range(min_n, max_n + 1):
+                    if n == 1:
+                        indices.extend(map(vocabulary.get, words, repeat(-1)))
+                    else:  # each window of n words
+                        indices.extend(map(self._ngrams.__getitem__, zip(*(words[k:] for k in range(n)))))
+            lengths.append(len(indices) - start)
+        columns = np.asarray(indices, dtype=np.int64)
+        rows = np.repeat(np.arange(len(lengths)), lengths)
+        found = columns >= 0
+        X = sparse.csr_matrix(
+            (np.ones(int(found.sum()), dtype=vectorizer.dtype), (rows[found], columns[found])),
+            shape=(len(lengths), len(vocabulary)),
+        )  # duplicates are summed into counts
+        return self._weigh(X)
+
+    def transform_masks(self, tokens: Sequence[str], keep: np.ndarray) -> sparse.csr_matrix:
+        """Features of perturbations of tokens, given as a boolean mask matrix of the tokens each perturbation keeps.
+
+        Without n-grams, the counts are the product of the mask matrix and the counts of each token. With n-grams, the
+        tokens of each perturbation are featurized with `transform()`, as leaving out tokens forms new n-grams.
+
+        Args:
+            tokens (Sequence[str]): Tokens of a text.
+            keep (np.ndarray): Boolean mask matrix (n_perturbations x n_tokens), True where a token is kept.
+
+        Returns:
+            sparse.csr_matrix: Feature matrix (n_perturbations x n_features).
+        """
+        vectorizer = self.vectorizer
+        if vectorizer.ngram_range != (1, 1):
+            return self.transform([list(compress(tokens, row)) for row in keep.tolist()])
+        columns = [self.unigrams(token) for token in tokens]
+        counts = sparse.csr_matrix(
+            (
+                np.ones(sum(map(len, columns)), dtype=vectorizer.dtype),
+                np.fromiter(chain.from_iterable(columns), dtype=np.int64),
+                np.cumsum([0, *map(len, columns)]),
+            ),
+            shape=(len(tokens), len(vectorizer.vocabulary_)),
+        )  # counts of each token
+        return self._weigh(sparse.csr_matrix(keep, dtype=vectorizer.dtype) @ counts)
+
+    def _weigh(self, X: sparse.csr_matrix) -> sparse.csr_matrix:
+        """Weigh counts as the vectorizer does (binary and/or TF-IDF)."""
+        vectorizer = self.vectorizer
+        if vectorizer.binary:
+            X.data.fill(1)
+        if self.tfidf:  # as `TfidfTransformer.transform()`
+            if vectorizer.sublinear_tf:
+                np.log(X.data, X.data)
+                X.data += 1
+            if vectorizer.use_idf:
+                X.data *= vectorizer.idf_[X.indices]
+            if vectorizer.norm is not None:
+                from sklearn.preprocessing import normalize
+
+                X = normalize(X, norm=vectorizer.norm, copy=False)
+        return X
+
+
+class FeaturizedClassifier:
+    def __init__(self, model):
+        """Classifier that featurizes perturbed texts from their tokens, and only calls the rest of the pipeline.
+
+        Local explanation methods (e.g. LIME, KernelSHAP, Anchor, local trees and rules) perturb the tokens of a text
+        and rebuild each perturbation as a string, which the vectorizer of a scikit-learn pipeline then tokenizes
+        again. Instead, the tokens of each perturbation (`instance.tokenized`) are turned into one sparse feature
+        matrix (see `TokenFeaturizer`), which is passed to the steps after the vectorizer.
+
+        Only vectorizers whose words never span two tokens are supported (see `supports()`), so the features of the
+        tokens of a perturbation are those of its text. As a check that the tokens belong to the texts, the first
+        instance of each call is also featurized by the vectorizer itself. If its features differ or some instances
+        have no tokens, the call is passed on to the wrapped model instead. Other attributes are taken from the
+        wrapped model.
+
+        Examples:
+            Explain a pipeline of a `TfidfVectorizer` and `LogisticRegression` without re-tokenizing each
+            perturbation:
+
+            >>> LIME()(sample, FeaturizedClassifier(model), n_samples=1000)
+
+        Args:
+            model (AbstractClassifier): Model with a supported scikit-learn pipeline (see `supports()`).
+
+        Raises:
+            ValueError: The model is not supported.
+        """
+        pipeline = _pipeline(model)
+        if pipeline is None:
+            raise ValueError(
+                "Featurizing from tokens requires a scikit-learn pipeline starting with a text vectorizer."
+            )
+        self.model = model
+        self.featurizer = TokenFeaturizer(pipeline.steps[0][1])
+        self.estimator = pipeline[1:]
+        self.n_featurized = 0
+        self.n_passed = 0
+
+    def __getattr__(self, name):
+        """Take other attributes from the wrapped model."""
+        if name == "model":  # not set yet, e.g. while unpickling
+            raise AttributeError(name)
+        return getattr(self.model, name)
+
+    def to_config(self) -> dict:
+        """Configuration of the wrapped model."""
+        return {"model": self.model}
+
+    def _featurize(self, instances: list) -> Optional[sparse.csr_matrix]:
+        """Features of the instances from their tokens, or None if not all have tokens or the check fails."""
+        tokenized = [getattr(instance, "tokenized", None) for instance in instances]
+        if not tokenized or any(tokens is None for tokens in tokenized):
+            return None
+        X = self.featurizer.transform(tokenized)
+        return X if self._matches(X[0], instances[0].data) else None
+
+    def _matches(self, features: sparse.csr_matrix, text: str) -> bool:
+        """Whether features from tokens equal the features of the vectorizer for the text."""
+        difference = abs(features - self.featurizer.vectorizer.transform([text]))
+        return difference.nnz == 0 or difference.max() <= 1e-9
+
+    def featurize_masks(self, sample, keep: np.ndarray) -> Optional[sparse.csr_matrix]:
+        """Features of perturbations of a tokenized sample, given as a mask matrix of the tokens they keep.
+
+        Args:
+            sample (TextInstance): Tokenized sample.
+            keep (np.ndarray): Boolean mask matrix (n_perturbations x n_tokens), True where a token is kept.
+
+        Returns:
+            Optional[sparse.csr_matrix]: Feature matrix (n_perturbations x n_features), or None if the features of the
+                sample from its tokens differ from those of the vectorizer.
+        """
+        tokens = list(sample.tokenized)
+        if not self._matches(self.featurizer.transform([tokens]), sample.data):
+            return None
+        return self.featurizer.transform_masks(tokens, keep)
+
+    def predict_proba_features(self, X: sparse.csr_matrix) -> np.ndarray:
+        """Probabilities of a feature matrix, predicted by the steps of the pipeline after the vectorizer."""
+        self.n_featurized += X.shape[0]
+        return self.estimator.predict_proba(X)
+
+    def predict_proba_masks(self, sample, keep: np.ndarray) -> Optional[np.ndarray]:
+        """Probabilities of perturbations of a tokenized sample, given as a mask matrix of the tokens they keep.
+
+        Args:
+            sample (TextInstance): Tokenized sample.
+            keep (np.ndarray): Boolean mask matrix (n_perturbations x n_tokens), True where a token is kept.
+
+        Returns:
+            Optional[np.ndarray]: Probability matrix (n_perturbations x n_labels), or None if the features of the
+                sample from its tokens differ from those of the vectorizer.
+        """
+        X = self.featurize_masks(sample, keep)
+        return None if X is None else self.predict_proba_features(X)
+
+    def predict_proba_raw(self, instances, batch_size: int = 200) -> Iterator[Tuple[Sequence, np.ndarray]]:
+        """Probabilities of the instances, featurized from their tokens if possible.
+
+        Args:
+            instances (InstanceInput): Instances to predict.
+            batch_size (int, optional): Batch size if passed on to the wrapped model. Defaults to 200.
+
+        Returns:
+            Iterator[Tuple[Sequence, np.ndarray]]: Identifiers and probability matrix of the instances, as one batch.
+        """
+        instances = list(instances.values()) if hasattr(instances, "values") else list(instances)
+        X = self._featurize(instances)
+        if X is None:
+            self.n_passed += len(instances)
+            return self.model.predict_proba_raw(instances, batch_size=batch_size)
+        return iter([([instance.identifier for instance in instances], self.predict_proba_features(X))])
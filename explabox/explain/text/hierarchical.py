@@ -0,0 +1,184 @@
+# Copyright (c) 2022 Marcel Robeer for National Police Lab AI (NPAI).
+#
+# This program is free software; you can redistribute it and/or modify it under the terms of the GNU Lesser General
+# Public License (LGPL) as published by the Free Software Foundation; either version 3 (LGPLv3) of the License, or (at
+# your option) any later version. You may not use this file except in compliance with the license. You may obtain a copy
+# of the license at:
+#
+#     https://www.gnu.org/licenses/lgpl-3.0.en.html
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+
+"""Explain long documents hierarchically: per segment (sentence or paragraph), then per token in the top segments."""
+
+import re
+from typing import Callable, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Segment levels, with the pattern of the boundaries between segments and the separator to join them
+SEGMENT_LEVELS = {
+    "sentences": (re.compile(r"(?<=[.!?])\s+|(?<=[.!?][\"')\]])\s+|\n\s*\n"), " "),
+    "paragraphs": (re.compile(r"\n\s*\n"), "\n\n"),
+}
+
+
+def split_segments(text: str, level: str = "sentences") -> List[str]:
+    """Split a text into sentences (after '.', '!' or '?' and at blank lines) or paragraphs (at blank lines).
+
+    Args:
+        text (str): Text to split.
+        level (str, optional): Segment level, 'sentences' or 'paragraphs'. Defaults to 'sentences'.
+
+    Raises:
+        ValueError: Unknown segment level.
+
+    Returns:
+        List[str]: Non-empty segments, without surrounding whitespace.
+    """
+    if level not in SEGMENT_LEVELS:
+        raise ValueError(f'Unknown segment level "{level}", choose from {list(SEGMENT_LEVELS)}.')
+    boundaries, _ = SEGMENT_LEVELS[level]
+    return [segment.strip() for segment in boundaries.split(text) if segment.strip()]
+
+
+class Segmentation:
+    def __init__(self, text: str, level: str = "sentences"):
+        """A document split into segments, tokenized with each segment as one token or into its words.
+
+        Segments are separated by a separator token (a space for sentences, a blank line for paragraphs), which is
+        never perturbed, so the text of a perturbed document keeps its segments apart.
+
+        Args:
+            text (str): Document.
+            level (str, optional): Segment level, 'sentences' or 'paragraphs'. Defaults to 'sentences'.
+        """
+        self.text = text
+        self.segments = split_segments(text, level) or [text]
+        self.separator = SEGMENT_LEVELS[level][1]
+
+    def detokenize(self, tokens: Iterable[str]) -> str:
+        """Text of the (kept) tokens of a document, detokenizing the tokens of each segment separately."""
+        from text_explainability import default_detokenizer
+
+        segments: List[List[str]] = [[]]
+        for token in tokens:
+            if token == self.separator:
+                segments.append([])
+            else:
+                segments[-1].append(token)
+        return self.separator.join(default_detokenizer(segment) for segment in segments if segment)
+
+    def tokenize(self, refine: Optional[Sequence[int]] = None) -> Tuple[object, object, np.ndarray]:
+        """Sample of the perturbed tokens, the tokenized document and the positions of the sample's tokens in it.
+
+        Args:
+            refine (Optional[Sequence[int]], optional): Segments tokenized into words, of which the words are
+                perturbed. If None, all segments are perturbed as a whole. Defaults to None.
+
+        Returns:
+            Tuple[TextInstance, TextInstance, np.ndarray]: Sample, document and positions.
+        """
+        from instancelib.instances.text import MemoryTextInstance
+        from text_explainability import default_tokenizer
+
+        tokens: List[str] = []
+        columns: List[int] = []
+        for i, segment in enumerate(self.segments):
+            if i > 0:
+                tokens.append(self.separator)
+            words = default_tokenizer(segment) if refine is not None and i in refine else [segment]
+            if refine is None or i in refine:
+                columns.extend(range(len(tokens), len(tokens) + len(words)))
+            tokens.extend(words)
+        document = MemoryTextInstance(hash(self.text), self.text, None, tokenized=tokens)
+        sample = MemoryTextInstance(hash(self.text), self.text, None, tokenized=[tokens[c] for c in columns])
+        return sample, document, np.asarray(columns, dtype=int)
+
+
+def feature_importance(explanation, n_features: int) -> np.ndarray:
+    """Largest absolute attribution score of each feature over all labels (zero for features that are not used).
+
+    Args:
+        explanation (FeatureAttribution): Explanation with (raw) scores for its used features.
+        n_features (int): Number of features of the explained sample.
+
+    Returns:
+        np.ndarray: Importance of each feature.
+    """
+    raw = np.atleast_2d(np.asarray(explanation.get_raw_scores(), dtype=np.float64))
+    used = explanation._used_features  # indices, whereas `used_features` gives the tokens
+    labels = explanation.labels if explanation.labels is not None else [None]
+    importance = np.zeros(n_features)
+    for i, label in enumerate(labels):
+        features = np.asarray(used[label] if isinstance(used, dict) else used, dtype=int)
+        np.maximum.at(importance, features, np.abs(raw[i]))
+    return importance
+
+
+def stage_samples(n_samples: int, n_features: int, n_words: Optional[int] = None) -> int:
+    """Number of samples of a stage of a hierarchical explanation, given the number of samples of a whole explanation.
+
+    A stage draws no more samples than the `2 ** n_features` distinct perturbations of its features. If the number of
+    words `n_words` of the document is given, the features are words and the number of samples is proportional to their
+    share of the document, with at least two samples per feature.
+
+    Args:
+        n_samples (int): Number of samples of a whole explanation.
+        n_features (int): Number of features (segments or words) of the stage.
+        n_words (Optional[int], optional): Number of words of the document. Defaults to None.
+
+    Returns:
+        int: Number of samples, at most `n_samples`.
+    """
+    n = n_samples
+    if n_words is not None:
+        n = max(int(np.ceil(n_samples * n_features / max(n_words, 1))), 2 * n_features)
+    return int(min(n_samples, n, 2 ** min(n_features, 62)))
+
+
+def explain_hierarchical(
+    explain: Callable[[object, object, np.ndarray, Callable[[Iterable[str]], str], int], object],
+    text: str,
+    level: str = "sentences",
+    top_segments: int = 3,
+    n_samples: int = 1000,
+) -> List:
+    """Explain a document per segment, then per token inside the `top_segments` most important segments.
+
+    The first explanation perturbs whole segments, so its number of features is the number of segments instead of the
+    number of tokens. The second one only perturbs the tokens of the top segments (by absolute score for any label),
+    keeping the other segments of the document as they are. Each explanation draws a number of samples that fits its
+    number of features (see `stage_samples()`), instead of `n_samples` each.
+
+    Args:
+        explain (Callable[[TextInstance, TextInstance, np.ndarray, Callable[[Iterable[str]], str], int], object]):
+            Function giving the explanation of a sample, given the sample, its document, the positions of its tokens
+            in the document, the detokenizer of the document and the number of samples.
+        text (str): Document to explain.
+        level (str, optional): Segment level, 'sentences' or 'paragraphs'. Defaults to 'sentences'.
+        top_segments (int, optional): Number of segments to explain per token. Defaults to 3.
+        n_samples (int, optional): Number of samples of an explanation of the whole document per token.
+            Defaults to 1000.
+
+    Raises:
+        ValueError: Unknown segment level or `top_segments` < 1.
+
+    Returns:
+        List: Explanation per segment and explanation per token of the top segments.
+    """
+    if top_segments < 1:
+        raise ValueError(f"{top_segments=} should be >= 1!")
+    segmentation = Segmentation(text, level)
+    n_segments = len(segmentation.segments)
+    segments = explain(*segmentation.tokenize(), segmentation.detokenize, stage_samples(n_samples, n_segments))
+    importance = feature_importance(segments, n_segments)
+    refine = np.sort(np.argsort(-importance, kind="stable")[:top_segments]).tolist()
+    sample, document, columns = segmentation.tokenize(refine)
+    n_words = len(segmentation.tokenize(range(n_segments))[2])
+    tokens = explain(
+        sample, document, columns, segmentation.detokenize, stage_samples(n_samples, len(columns), n_words)
+    )
+    return [segments, tokens]
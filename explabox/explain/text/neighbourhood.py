@@ -0,0 +1,105 @@
+# Copyright (c) 2022 Marcel Robeer for National Police Lab AI (NPAI).
+#
+# This program is free software; you can redistribute it and/or modify it under the terms of the GNU Lesser General
+# Public License (LGPL) as published by the Free Software Foundation; either version 3 (LGPLv3) of the License, or (at
+# your option) any later version. You may not use this file except in compliance with the license. You may obtain a copy
+# of the license at:
+#
+#     https://www.gnu.org/licenses/lgpl-3.0.en.html
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+
+"""Share one perturbed neighbourhood (and its predictions) between local explanation methods."""
+
+from typing import Optional, Tuple
+
+import numpy as np
+
+SHAREABLE_METHODS = ("LIME", "BayLIME", "KernelSHAP")
+
+
+class SharedNeighbourhood:
+    def __init__(self):
+        """One perturbation design and its predictions, generated once and reused by several surrogate methods.
+
+        The design is a random neighbourhood (as used by LIME) that starts with the original instance and ends with
+        the background instance (all tokens left out, as used by KernelSHAP). Each method fits its surrogate on this
+        design with its own weighting: LIME and BayLIME weigh by the similarity to the original instance and
+        KernelSHAP by the Shapley kernel. Methods that do not ask for the background instance (e.g. LIME) get the
+        design without it, which is the design they draw themselves (if a random perturbation left out all tokens, it
+        was moved to the end as the background instance, and is moved back).
+
+        The first method generates the design with its number of samples and seed, so all methods sharing it should
+        ask for the same number of samples and use the same seed. Instead of its own (sequential) sample, KernelSHAP
+        is fitted on the random design, which gives the same scores if the number of samples covers all
+        perturbations of the sample.
+
+        Examples:
+            Explain with LIME and KernelSHAP, predicting the neighbourhood once:
+
+            >>> neighbourhood = SharedNeighbourhood()
+            >>> lime, shap = neighbourhood.share(LIME(seed=0)), neighbourhood.share(KernelSHAP(seed=0))
+            >>> lime(sample, model, n_samples=200), shap(sample, model, n_samples=200)
+        """
+        self.n_generated = 0
+        self._neighbourhood: Optional[tuple] = None
+        self._settings: Optional[tuple] = None
+
+    @staticmethod
+    def is_shareable(method) -> bool:
+        """Whether a local explanation method (class or instance) can be fitted on the shared neighbourhood."""
+        cls = method if isinstance(method, type) else type(method)
+        return any(c.__name__ in SHAREABLE_METHODS for c in cls.__mro__)
+
+    def share(self, method):
+        """Let a local explanation method generate its neighbourhood from (and add it to) the shared neighbourhood.
+
+        Calling the method raises a ValueError if it asks for another number of samples or seed than the method that
+        generated the shared neighbourhood.
+
+        Args:
+            method (LocalExplanation): Instance of a local explanation method, which is altered in place.
+
+        Returns:
+            LocalExplanation: The method.
+        """
+        augment_sample = method.augment_sample
+
+        def shared_augment_sample(sample, model, *args, n_samples: int = 50, seed: Optional[int] = None, **kwargs):
+            background = kwargs.get("add_background_instance", False)
+            settings = (n_samples, getattr(getattr(method, "augmenter", None), "seed", None) if seed is None else seed)
+            if self._neighbourhood is None:
+                self.n_generated += 1
+                kwargs.update(sequential=False, contiguous=False, add_background_instance=True, predict=True)
+                self._neighbourhood = augment_sample(sample, model, n_samples=n_samples, seed=seed, **kwargs)
+                self._settings = settings
+            elif settings != self._settings:
+                raise ValueError(
+                    f"Methods sharing a neighbourhood should use the same number of samples and seed, but "
+                    f"{type(method).__name__} asks for (n_samples, seed) = {settings} instead of {self._settings}."
+                )
+            neighbourhood = self._copy(self._neighbourhood)
+            if not background:
+                return self._without_background(neighbourhood)
+            return neighbourhood
+
+        method.augment_sample = shared_augment_sample
+        return method
+
+    @staticmethod
+    def _without_background(neighbourhood: tuple) -> Tuple:
+        """The neighbourhood without its background instance, as a method would draw it without one."""
+        from .perturbation import NeighbourhoodProvider
+
+        provider, original_id, perturbed, y, y_orig = neighbourhood
+        if isinstance(provider, NeighbourhoodProvider):  # keep a random perturbation leaving out all tokens
+            without, rows = provider.neighbourhood.without_background()
+            return NeighbourhoodProvider(without), original_id, perturbed[rows], y[rows], y_orig
+        return provider, original_id, perturbed[:-1], y[:-1], y_orig
+
+    @staticmethod
+    def _copy(neighbourhood: tuple) -> Tuple:
+        """Copy the arrays of the neighbourhood, as methods may alter them in place."""
+        return tuple(np.array(v, copy=True) if isinstance(v, np.ndarray) else v for v in neighbourhood)
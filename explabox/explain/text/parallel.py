@@ -0,0 +1,69 @@
+# Copyright (c) 2022 Marcel Robeer for National Police Lab AI (NPAI).
+#
+# This program is free software; you can redistribute it and/or modify it under the terms of the GNU Lesser General
+# Public License (LGPL) as published by the Free Software Foundation; either version 3 (LGPLv3) of the License, or (at
+# your option) any later version. You may not use this file except in compliance with the license. You may obtain a copy
+# of the license at:
+#
+#     https://www.gnu.org/licenses/lgpl-3.0.en.html
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+
+"""Run independent explanation units (methods, splits) in parallel, with a seed for each unit."""
+
+import os
+import zlib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Hashable, List, Optional, Sequence
+
+import numpy as np
+
+BACKENDS = ("threads", "processes")
+
+
+def unit_seeds(seed: Optional[int], units: Sequence[Hashable]) -> List[int]:
+    """Seed for each unit, spawned from `seed` with the name of the unit as spawn key.
+
+    As the seed of a unit only depends on `seed` and its name, it does not change with the order or number of units,
+    nor with whether they are run serially or in parallel.
+
+    Args:
+        seed (Optional[int]): Seed to spawn from; if None fresh entropy is drawn (once, for all units).
+        units (Sequence[Hashable]): Names of the units, e.g. split names or (split, method) tuples.
+
+    Returns:
+        List[int]: Seed of each unit.
+    """
+    entropy = np.random.SeedSequence(seed).entropy
+    return [
+        int(np.random.SeedSequence(entropy, spawn_key=(zlib.crc32(repr(unit).encode("utf-8")),)).generate_state(1)[0])
+        for unit in units
+    ]
+
+
+def run_parallel(function: Callable, units: Sequence[tuple], n_jobs: int = 1, backend: str = "threads") -> list:
+    """Apply a function to the arguments of each unit, on a pool of `n_jobs` threads or processes.
+
+    Args:
+        function (Callable): Function to apply (picklable if `backend` is 'processes').
+        units (Sequence[tuple]): Positional arguments of each unit.
+        n_jobs (int, optional): Number of units run at the same time; -1 uses all CPUs. Defaults to 1.
+        backend (str, optional): Pool to run the units on, 'threads' or 'processes'. Defaults to 'threads'.
+
+    Raises:
+        ValueError: Unknown backend.
+
+    Returns:
+        list: Result of each unit, in the order of `units`.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f'Unknown backend "{backend}", choose from {list(BACKENDS)}')
+    if n_jobs < 0:
+        n_jobs = os.cpu_count() or 1
+    if n_jobs <= 1 or len(units) <= 1:
+        return [function(*unit) for unit in units]
+    executor = ThreadPoolExecutor if backend == "threads" else ProcessPoolExecutor
+    with executor(max_workers=min(n_jobs, len(units))) as pool:
+        return list(pool.map(function, *zip(*units)))
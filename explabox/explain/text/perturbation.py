@@ -0,0 +1,518 @@
+# Copyright (c) 2022 Marcel Robeer for National Police Lab AI (NPAI).
+#
+# This program is free software; you can redistribute it and/or modify it under the terms of the GNU Lesser General
+# Public License (LGPL) as published by the Free Software Foundation; either version 3 (LGPLv3) of the License, or (at
+# your option) any later version. You may not use this file except in compliance with the license. You may obtain a copy
+# of the license at:
+#
+#     https://www.gnu.org/licenses/lgpl-3.0.en.html
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+
+"""Perturb a tokenized sample in bulk, with the whole neighbourhood as a boolean mask matrix of left-out tokens."""
+
+import itertools
+import math
+from itertools import compress
+from typing import Callable, Dict, Hashable, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Local explanation methods that fit their surrogate on a neighbourhood generated by `augment_sample()`
+MASKABLE_METHODS = ("LIME", "BayLIME", "KernelSHAP", "LocalTree", "LocalRules", "FoilTree")
+
+
+def leave_out_masks(
+    n_tokens: int,
+    n_samples: int = 50,
+    sequential: bool = True,
+    contiguous: bool = False,
+    min_changes: int = 1,
+    max_changes: int = 10000,
+    add_background_instance: bool = False,
+    seed: int = 0,
+) -> np.ndarray:
+    """Which tokens each perturbation leaves out, drawn as `text_explainability`'s `LeaveOut.perturb()` does.
+
+    The rows are the left-out tokens that `LeaveOut.perturb()` yields with the same seed (duplicates included), but no
+    perturbed token lists or strings are built. Unlike that of `LeaveOut`, which keeps all tokens (and is then dropped
+    by `augment_sample()` as a copy of the sample), the background instance leaves out all tokens.
+
+    Args:
+        n_tokens (int): Number of tokens of the sample.
+        n_samples (int, optional): Number of perturbations. Defaults to 50.
+        sequential (bool, optional): Whether to leave out all combinations of one token, then of two tokens, etc.,
+            filling up the remainder randomly. Defaults to True.
+        contiguous (bool, optional): Whether to leave out contiguous stretches of tokens. Defaults to False.
+        min_changes (int, optional): Minimum number of tokens left out. Defaults to 1.
+        max_changes (int, optional): Maximum number of tokens left out. Defaults to 10000.
+        add_background_instance (bool, optional): Whether to end with a perturbation leaving out all tokens.
+            Defaults to False.
+        seed (int, optional): Seed for reproducibility. Defaults to 0.
+
+    Returns:
+        np.ndarray: Boolean mask matrix (n_perturbations x n_tokens), True where a token is left out.
+    """
+    min_changes = min(max(min_changes, 1), n_tokens)
+    max_changes = min(n_tokens, max_changes)
+    rand = np.random.RandomState(seed)
+    if contiguous:  # (T+1)(B-A+1) + A(A-1)/2 - B(B+1)/2
+        n_sizes = max_changes - min_changes + 1
+        required = (n_tokens + 1) * n_sizes + (min_changes * (min_changes - 1) - max_changes * (max_changes + 1)) // 2
+    else:
+        required = sum(math.comb(n_tokens, i) for i in range(min_changes, max_changes + 1))
+
+    left_out: List[Iterable[int]] = []
+    if sequential or n_samples >= required:
+        for size in range(min_changes, max_changes + 1):
+            if contiguous:  # n-grams of length size, up to n_samples
+                n_contiguous = n_tokens - size
+                if n_contiguous > n_samples:
+                    starts = rand.choice(n_tokens - size + 1, size=n_samples, replace=False)
+                    left_out.extend(range(start, start + size) for start in starts)
+                    break
+                n_samples -= n_contiguous
+                left_out.extend(range(start, start + size) for start in range(n_tokens - size + 1))
+            else:  # all combinations of length size, up to n_samples
+                n_choose_k = math.comb(n_tokens, size)
+                if n_choose_k > n_samples:
+                    left_out.extend(rand.choice(n_tokens, size, replace=False) for _ in range(n_samples))
+                    break
+                n_samples -= n_choose_k
+                left_out.extend(itertools.combinations(range(n_tokens), size))
+    else:
+        for size in rand.randint(min_changes, max_changes + 1, n_samples):
+            if contiguous:
+                start = rand.choice(max_changes - size + 1, replace=False)
+                left_out.append(range(start, start + size))
+            else:
+                left_out.append(rand.choice(n_tokens, size, replace=False))
+
+    masks = np.zeros((len(left_out) + int(add_background_instance), n_tokens), dtype=bool)
+    rows = np.repeat(np.arange(len(left_out)), [len(tokens) for tokens in left_out])
+    masks[rows, np.fromiter(itertools.chain.from_iterable(left_out), dtype=np.int64, count=len(rows))] = True
+    if add_background_instance:
+        masks[-1] = True
+    return masks
+
+
+class MaskNeighbourhood:
+    def __init__(
+        self,
+        sample,
+        masks: np.ndarray,
+        detokenizer: Optional[Callable[[Iterable[str]], str]] = None,
+        document=None,
+        columns: Optional[Sequence[int]] = None,
+        drawn_background: Optional[int] = None,
+    ):
+        """Perturbed versions of a tokenized sample, as a boolean mask matrix of the tokens that are left out.
+
+        The perturbed texts (and instances) are only built, all at once, when they are needed, e.g. when the model
+        requires strings or when the neighbourhood of an explanation is inspected. The neighbourhood is read-only, so
+        copying it returns the neighbourhood itself.
+
+        The tokens of the sample may be part of a larger document (e.g. the top segments of a hierarchical
+        explanation), in which case each perturbation keeps all other tokens of the document and is predicted as a
+        whole document.
+
+        Args:
+            sample (TextInstance): Tokenized sample.
+            masks (np.ndarray): Boolean mask matrix (n_perturbations x n_tokens), True where a token is left out.
+            detokenizer (Optional[Callable[[Iterable[str]], str]], optional): Mapping from tokens to a string. If None,
+                `text_explainability`'s default detokenizer is used. Defaults to None.
+            document (Optional[TextInstance], optional): Tokenized document the sample is part of. If None, it is the
+                sample itself. Defaults to None.
+            columns (Optional[Sequence[int]], optional): Position of each token of the sample in the tokens of the
+                document, required if a document is given. Defaults to None.
+            drawn_background (Optional[int], optional): If the last perturbation is a background instance (leaving out
+                all tokens) that was also drawn at random, the row it was drawn at. Defaults to None.
+        """
+        if detokenizer is None:
+            from text_explainability import default_detokenizer as detokenizer
+        self.sample = sample
+        self.document = sample if document is None else document
+        self.tokens = list(self.document.tokenized)
+        self.columns = np.arange(len(self.tokens)) if columns is None else np.asarray(columns, dtype=int)
+        self.masks = masks
+        self.detokenizer = detokenizer
+        self.drawn_background = drawn_background
+        self._instances: Optional[list] = None
+
+    def _document_masks(self) -> np.ndarray:
+        """Mask matrix of the tokens of the document that are left out."""
+        if self.document is self.sample:
+            return self.masks
+        masks = np.zeros((self.masks.shape[0], len(self.tokens)), dtype=bool)
+        masks[:, self.columns] = self.masks
+        return masks
+
+    @property
+    def keep(self) -> np.ndarray:
+        """Boolean mask matrix of the tokens of the document that are kept, starting with the document itself."""
+        return np.vstack([np.ones((1, len(self.tokens)), dtype=bool), ~self._document_masks()])
+
+    def tokenized(self) -> List[List[str]]:
+        """Tokens of (the document of) each perturbation."""
+        return [list(compress(self.tokens, row)) for row in (~self._document_masks()).tolist()]
+
+    def texts(self) -> List[str]:
+        """Text of each perturbation."""
+        return [instance.data for instance in self.instances()]
+
+    def instances(self) -> list:
+        """Instance of each perturbation, identified by its row in `perturbed()` (built once)."""
+        if self._instances is None:
+            from instancelib.instances.text import MemoryTextInstance
+
+            self._instances = [
+                MemoryTextInstance(
+                    i, self.detokenizer(tokens), None, tokenized=tokens, map_to_original=mask.astype(int)
+                )
+                for i, (tokens, mask) in enumerate(zip(self.tokenized(), self.masks), start=1)
+            ]
+        return self._instances
+
+    def perturbed(self) -> np.ndarray:
+        """Mask matrix of the sample (all ones, as in `text_explainability`) and its perturbations."""
+        return np.vstack([np.ones((1, self.masks.shape[1]), dtype=bool), self.masks])
+
+    def without_background(self) -> Tuple["MaskNeighbourhood", np.ndarray]:
+        """Neighbourhood without its last perturbation (the background instance), as drawn without it.
+
+        If the background instance was also drawn at random, it is kept in the row it was drawn at instead.
+
+        Returns:
+            Tuple[MaskNeighbourhood, np.ndarray]: Neighbourhood and the rows of `perturbed()` it consists of.
+        """
+        rows = np.arange(len(self) - 1)
+        if self.drawn_background is not None:
+            rows = np.insert(rows, self.drawn_background, len(self) - 1)
+        document = None if self.document is self.sample else self.document
+        neighbourhood = MaskNeighbourhood(
+            self.sample, self.masks[rows], detokenizer=self.detokenizer, document=document, columns=self.columns
+        )
+        return neighbourhood, np.r_[0, rows + 1]
+
+    def predict_proba(self, model, batch_size: int = 200, include_document: bool = True) -> np.ndarray:
+        """Probabilities of the sample and its perturbations.
+
+        Models that can predict from a mask matrix (with a `predict_proba_masks()` method, such as
+        `explain.text.featurization.FeaturizedClassifier`) are not given any strings. If the sample is part of a
+        document, the document is predicted as the detokenized text of all its tokens, as its perturbations are.
+
+        Args:
+            model (AbstractClassifier): Model to predict with.
+            batch_size (int, optional): Batch size of the model. Defaults to 200.
+            include_document (bool, optional): Whether to predict the sample (or its document) as the first row.
+                Defaults to True.
+
+        Returns:
+            np.ndarray: Probability matrix ((1 +) n_perturbations x n_labels).
+        """
+        document = self.document
+        if document is not self.sample:  # the text of its tokens, as the perturbations are those of their tokens
+            from instancelib.instances.text import MemoryTextInstance
+
+            document = MemoryTextInstance(
+                document.identifier, self.detokenizer(self.tokens), None, tokenized=self.tokens
+            )
+        predict_masks = getattr(model, "predict_proba_masks", None)
+        if predict_masks is not None:
+            proba = predict_masks(document, self.keep if include_document else ~self._document_masks())
+            if proba is not None:
+                return np.asarray(proba)
+        instances = [document, *self.instances()] if include_document else self.instances()
+        batches = model.predict_proba_raw(instances, batch_size=batch_size)
+        return np.vstack([np.asarray(matrix) for _, matrix in batches])
+
+    def __len__(self) -> int:
+        """Number of perturbations."""
+        return self.masks.shape[0]
+
+    def __iter__(self) -> Iterator:
+        """Iterate over the instances of the perturbations."""
+        return iter(self.instances())
+
+    def __deepcopy__(self, memo) -> "MaskNeighbourhood":
+        """The neighbourhood itself, as it is read-only."""
+        return self
+
+
+class NeighbourhoodProvider:
+    def __init__(self, neighbourhood: MaskNeighbourhood):
+        """Read-only provider of a sample and its perturbations, as used by explanations to refer to their data.
+
+        Args:
+            neighbourhood (MaskNeighbourhood): Neighbourhood of the sample.
+        """
+        self.neighbourhood = neighbourhood
+
+    def __getitem__(self, key):
+        """Sample or perturbation with identifier `key`."""
+        if key == self.neighbourhood.sample.identifier:
+            return self.neighbourhood.sample
+        if isinstance(key, (int, np.integer)) and 1 <= key <= len(self.neighbourhood):
+            return self.neighbourhood.instances()[key - 1]
+        raise KeyError(key)
+
+    def __contains__(self, key) -> bool:
+        """Whether the sample or a perturbation has identifier `key`."""
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def __len__(self) -> int:
+        """Number of instances, the sample and its perturbations."""
+        return 1 + len(self.neighbourhood)
+
+    def __iter__(self) -> Iterator:
+        """Iterate over the identifiers, starting with the sample."""
+        return iter(self.key_list)
+
+    @property
+    def key_list(self) -> list:
+        """Identifiers, starting with the sample."""
+        return [self.neighbourhood.sample.identifier, *range(1, len(self.neighbourhood) + 1)]
+
+    def keys(self) -> list:
+        """Identifiers, starting with the sample."""
+        return self.key_list
+
+    def values(self) -> list:
+        """Instances, starting with the sample."""
+        return [self.neighbourhood.sample, *self.neighbourhood.instances()]
+
+    def get_all(self) -> Iterator:
+        """Iterate over the instances, starting with the sample."""
+        return iter(self.values())
+
+    def get_children(self, parent) -> Sequence:
+        """Perturbations of the sample (or a copy of it), or nothing for other instances."""
+        return self.neighbourhood if parent.identifier == self.neighbourhood.sample.identifier else []
+
+
+class GrowingNeighbourhood:
+    def __init__(self):
+        """Perturbations and predictions of neighbourhoods that grow over calls, e.g. rounds of adaptive explanations.
+
+        A method perturbed with `perturb_with_masks(method, growing=...)` that asks for more samples than in its
+        previous call (for the same sample, settings and seed) only draws the additional perturbations, randomly with a
+        seed spawned from its seed and the number of samples drawn before, and only predicts those that are new. Its
+        surrogate model is then fitted on all perturbations so far. Asking for fewer samples, or for another sample or
+        other settings, starts a new neighbourhood.
+
+        Examples:
+            Explain with LIME for 50 and then 100 samples, predicting 100 perturbations in total:
+
+            >>> growing = GrowingNeighbourhood()
+            >>> perturb_with_masks(LIME(), growing=growing)(sample, model, n_samples=50)
+            >>> perturb_with_masks(LIME(), growing=growing)(sample, model, n_samples=100)
+        """
+        self.n_predicted = 0
+        self._states: Dict[Hashable, dict] = {}
+
+    def state(self, key: Hashable, n_samples: int) -> Optional[dict]:
+        """Neighbourhood drawn before for `key`, if it has at most `n_samples` samples."""
+        state = self._states.get(key)
+        return state if state is not None and state["n_samples"] <= n_samples else None
+
+    def update(self, key: Hashable, state: dict) -> None:
+        """Keep the (grown) neighbourhood of `key`."""
+        self._states[key] = state
+
+
+def _unique_rows(
+    masks: np.ndarray,
+    seen: Optional[np.ndarray] = None,
+    codes: Optional[np.ndarray] = None,
+    columns: Optional[Sequence[int]] = None,
+) -> np.ndarray:
+    """Rows of a mask matrix without duplicates (also of the `seen` rows), in the order they were drawn.
+
+    Args:
+        masks (np.ndarray): Boolean mask matrix (n_perturbations x n_tokens), True where a token is left out.
+        seen (Optional[np.ndarray], optional): Mask matrix of perturbations drawn before. Defaults to None.
+        codes (Optional[np.ndarray], optional): Integer code of each token of the document (equal for equal tokens).
+            If given, rows are duplicates if they keep the same sequence of tokens (so their texts are the same),
+            otherwise if they leave out the same tokens. Defaults to None.
+        columns (Optional[Sequence[int]], optional): Position of each column of `masks` in the tokens of the document.
+            If None, the columns are the tokens of the document. Defaults to None.
+
+    Returns:
+        np.ndarray: Rows of `masks` that are not a duplicate of an earlier row.
+    """
+    n_seen = 0 if seen is None else len(seen)
+    rows = masks if n_seen == 0 else np.vstack([seen, masks])
+    if codes is None:
+        _, first = np.unique(rows, axis=0, return_index=True)
+    else:
+        keep = np.ones((len(rows), len(codes)), dtype=bool)
+        keep[:, slice(None) if columns is None else np.asarray(columns, dtype=int)] = ~rows
+        first_of: Dict[bytes, int] = {}
+        for i, row in enumerate(keep):
+            first_of.setdefault(codes[row].tobytes(), i)
+        first = np.fromiter(first_of.values(), dtype=np.int64, count=len(first_of))
+    return masks[np.sort(first[first >= n_seen]) - n_seen]
+
+
+def supports(method) -> bool:
+    """Whether a local explanation method (class or instance) can generate its neighbourhood as a mask matrix.
+
+    That is a method fitting its surrogate on the output of `augment_sample()` (see `MASKABLE_METHODS`), which leaves
+    tokens out (the default `LeaveOut` augmenter of `text_explainability`) if it is an instance.
+    """
+    from text_explainability.data.augmentation import LeaveOut
+
+    cls = method if isinstance(method, type) else type(method)
+    if not any(c.__name__ in MASKABLE_METHODS for c in cls.__mro__):
+        return False
+    return isinstance(method, type) or type(getattr(method, "augmenter", None)) is LeaveOut
+
+
+def perturb_with_masks(
+    method, document=None, columns: Optional[Sequence[int]] = None, growing: Optional[GrowingNeighbourhood] = None
+):
+    """Let a local explanation method generate and predict its neighbourhood as a mask matrix.
+
+    Its `augment_sample()` is replaced by one that draws the same left-out tokens as its augmenter (see
+    `leave_out_masks()`), but keeps them as a boolean mask matrix: the sample is the first row and each perturbation a
+    next row, in the order they were drawn, with the predictions of the model in the same order. As in
+    `augment_sample()`, perturbations that keep the same sequence of tokens (and thus have the same text) as an earlier
+    one are dropped, and the background instance (leaving out all tokens) is only the last row. The surrogate model of
+    the method is fitted directly on this mask matrix.
+
+    Examples:
+        Explain with a local tree, without building the perturbed instances one by one:
+
+        >>> tree = perturb_with_masks(LocalTree())
+        >>> tree(sample, model, n_samples=1000)
+
+    Args:
+        method (LocalExplanation): Instance of a local explanation method (see `supports()`), which is altered in
+            place.
+        document (Optional[TextInstance], optional): Tokenized document the samples are part of, whose other tokens
+            are kept in each perturbation (see `MaskNeighbourhood`). Defaults to None.
+        columns (Optional[Sequence[int]], optional): Position of each token of the samples in the tokens of the
+            document. Defaults to None.
+        growing (Optional[GrowingNeighbourhood], optional): Neighbourhoods of earlier calls to grow, instead of
+            drawing and predicting each neighbourhood anew. Defaults to None.
+
+    Returns:
+        LocalExplanation: The method.
+    """
+    from text_explainability.decorators import text_instance
+
+    @text_instance(tokenize=True)
+    def augment_sample(
+        sample,
+        model,
+        sequential: bool = False,
+        contiguous: bool = False,
+        n_samples: int = 50,
+        add_background_instance: bool = False,
+        predict: bool = True,
+        avoid_proba: bool = False,
+        seed: Optional[int] = None,
+        min_changes: int = 1,
+        max_changes: int = 10000,
+        **kwargs,
+    ):
+        sample.identifier = hash(sample.data)
+        sample.map_to_original = np.ones(len(sample.tokenized), dtype=int)
+        n_tokens = len(sample.tokenized)
+        seed = method.augmenter.seed if seed is None else seed
+        settings = dict(contiguous=contiguous, min_changes=min_changes, max_changes=max_changes)
+
+        # Perturbations are duplicates if they keep the same tokens of the document, as in `augment_sample()` (where
+        # they have the same text); if all tokens of the sample differ, that is if they leave out the same tokens
+        codes = None
+        if len(set(sample.tokenized)) < n_tokens:
+            tokens = list(sample.tokenized if document is None else document.tokenized)
+            codes = np.unique(np.asarray(tokens, dtype=str), return_inverse=True)[1]
+
+        def neighbourhood_of(masks: np.ndarray, drawn_background: Optional[int] = None) -> MaskNeighbourhood:
+            return MaskNeighbourhood(
+                sample,
+                masks,
+                detokenizer=method.augmenter.detokenizer,
+                document=document,
+                columns=columns,
+                drawn_background=drawn_background,
+            )
+
+        key = (
+            sample.data,
+            None if document is None else document.data,
+            None if columns is None else tuple(columns),
+            sequential,
+            contiguous,
+            min_changes,
+            max_changes,
+            seed,
+        )
+        state = growing.state(key, n_samples) if growing is not None and predict else None
+        if state is None:
+            drawn = leave_out_masks(n_tokens, n_samples=n_samples, sequential=sequential, seed=seed, **settings)
+            state = {"n_samples": 0, "masks": drawn[:0], "y": None, "y_document": None, "y_background": None}
+        else:  # only draw the additional samples, randomly
+            spawned = int(np.random.SeedSequence([seed, state["n_samples"]]).generate_state(1)[0])
+            n_extra = n_samples - state["n_samples"]
+            drawn = leave_out_masks(n_tokens, n_samples=n_extra, sequential=False, seed=spawned, **settings)
+        new = _unique_rows(drawn, seen=state["masks"], codes=codes, columns=columns)
+
+        def with_background(masks: np.ndarray) -> Tuple[np.ndarray, Optional[int]]:
+            """Masks ending with the background instance instead of a random one leaving out all tokens (if any)."""
+            if not add_background_instance:
+                return masks, None
+            removed = masks.all(axis=1)
+            drawn_background = int(np.argmax(removed)) if removed.any() else None
+            return np.vstack([masks[~removed], np.ones((1, n_tokens), dtype=bool)]), drawn_background
+
+        if not predict:
+            neighbourhood = neighbourhood_of(*with_background(new))
+            return NeighbourhoodProvider(neighbourhood), sample.identifier, neighbourhood.perturbed()
+
+        # Predict the new perturbations (and the sample and background instance, if not predicted or drawn before)
+        drawn_all = np.vstack([state["masks"], new]).all(axis=1).any()
+        predict_background = add_background_instance and state["y_background"] is None and not drawn_all
+        to_predict = np.vstack([new, np.ones((int(predict_background), n_tokens), dtype=bool)])
+        include_document = state["y_document"] is None
+        if include_document or len(to_predict):
+            y_new = neighbourhood_of(to_predict).predict_proba(model, include_document=include_document)
+            y_new = y_new.reshape(len(to_predict) + int(include_document), -1)
+        else:  # all additional samples were drawn before
+            y_new = state["y_document"][:0]
+        if growing is not None:
+            growing.n_predicted += len(y_new)
+        if include_document:
+            state["y_document"], y_new = y_new[:1], y_new[1:]
+        if predict_background:
+            state["y_background"], y_new = y_new[-1:], y_new[:-1]
+        state.update(
+            n_samples=n_samples,
+            masks=np.vstack([state["masks"], new]),
+            y=y_new if state["y"] is None else np.vstack([state["y"], y_new]),
+        )
+        if growing is not None:
+            growing.update(key, state)
+
+        masks, drawn_background = with_background(state["masks"])
+        y = [state["y_document"], state["y"]]
+        if add_background_instance:  # predicted as drawn at random, or else on its own
+            removed = state["masks"].all(axis=1)
+            y[1:] = [state["y"][~removed], state["y"][removed] if removed.any() else state["y_background"]]
+        neighbourhood = neighbourhood_of(masks, drawn_background)
+        provider, perturbed = NeighbourhoodProvider(neighbourhood), neighbourhood.perturbed()
+        y = np.vstack(y).squeeze()
+        y_orig = y[0]
+        if avoid_proba:
+            y = np.argmax(y, axis=1)
+        return provider, sample.identifier, perturbed, y, y_orig
+
+    method.augment_sample = augment_sample
+    return method
@@ -0,0 +1,187 @@
+# Copyright (c) 2022 Marcel Robeer for National Police Lab AI (NPAI).
+#
+# This program is free software; you can redistribute it and/or modify it under the terms of the GNU Lesser General
+# Public License (LGPL) as published by the Free Software Foundation; either version 3 (LGPLv3) of the License, or (at
+# your option) any later version. You may not use this file except in compliance with the license. You may obtain a copy
+# of the license at:
+#
+#     https://www.gnu.org/licenses/lgpl-3.0.en.html
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+
+"""Pool the model calls of concurrently running explanations into large batches."""
+
+import threading
+from contextlib import contextmanager
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from instancelib import AbstractClassifier
+from scipy import sparse
+
+
+class _Batch:
+    __slots__ = ("instances", "features", "n_features", "n_requests", "proba", "proba_features", "error", "done")
+
+    def __init__(self):
+        """Requests pooled into one model call per kind of request, and the (shared) results of those calls."""
+        self.instances: list = []
+        self.features: List[sparse.csr_matrix] = []
+        self.n_features = 0
+        self.n_requests = 0
+        self.proba: Optional[np.ndarray] = None
+        self.proba_features: Optional[np.ndarray] = None
+        self.error: Optional[BaseException] = None
+        self.done = False
+
+
+class PooledClassifier:
+    def __init__(self, model: AbstractClassifier, max_batch_size: int = 10_000, batch_size: int = 200):
+        """Classifier that pools the probability requests of concurrent workers into one call of the wrapped model.
+
+        Each worker (e.g. a thread explaining one sample) blocks on its request until all active workers are blocked
+        or `max_batch_size` instances are pending. The pending instances are then predicted at once, and each worker
+        gets back the rows of its own instances. If the wrapped model featurizes mask neighbourhoods (such as
+        `explain.text.featurization.FeaturizedClassifier`), each worker featurizes its own masks and their feature
+        matrices are predicted at once as well. Other attributes are taken from the wrapped model.
+
+        Examples:
+            Explain samples in threads, pooling all neighbourhood predictions:
+
+            >>> pooled = PooledClassifier(model)
+            >>> def explain(sample):
+            ...     with pooled.worker():
+            ...         return LIME()(sample, pooled)
+
+        Args:
+            model (AbstractClassifier): Model to pool the calls of.
+            max_batch_size (int, optional): Maximum number of pending instances before they are predicted, even if some
+                workers are still running. Defaults to 10,000.
+            batch_size (int, optional): Batch size passed to the wrapped model. Defaults to 200.
+        """
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.batch_size = batch_size
+        self.n_calls = 0
+        self._condition = threading.Condition()
+        self._active = 0
+        self._blocked = 0
+        self._batch = _Batch()
+
+    def __getattr__(self, name):
+        """Take other attributes from the wrapped model."""
+        return getattr(self.model, name)
+
+    def to_config(self) -> dict:
+        """Configuration of the wrapped model."""
+        return {"model": self.model}
+
+    @contextmanager
+    def worker(self):
+        """Register the current thread as a worker for the duration of the context."""
+        with self._condition:
+            self._active += 1
+        try:
+            yield self
+        finally:
+            with self._condition:
+                self._active -= 1
+                batch = self._take_if_ready()
+            if batch is not None:
+                self._predict(batch)
+
+    def _take_if_ready(self) -> Optional[_Batch]:
+        """Take the pending batch if all active workers are blocked or it is full (call while holding the lock)."""
+        n_pending = len(self._batch.instances) + self._batch.n_features
+        if self._batch.n_requests and (self._blocked >= self._active or n_pending >= self.max_batch_size):
+            batch, self._batch = self._batch, _Batch()
+            return batch
+        return None
+
+    def _predict(self, batch: _Batch) -> None:
+        """Predict a batch with one call of the wrapped model per kind of request and wake up its workers."""
+        n_calls = 0
+        try:
+            if batch.instances:
+                batches = self.model.predict_proba_raw(batch.instances, batch_size=self.batch_size)
+                batch.proba = np.vstack([np.asarray(matrix) for _, matrix in batches])
+                n_calls += 1
+            if batch.features:
+                X = sparse.vstack(batch.features, format="csr")
+                batch.proba_features = np.asarray(self.model.predict_proba_features(X))
+                n_calls += 1
+        except BaseException as e:  # raised in every worker of the batch
+            batch.error = e
+        with self._condition:
+            self.n_calls += n_calls
+            self._blocked -= batch.n_requests
+            batch.done = True
+            self._condition.notify_all()
+
+    def _request(
+        self, instances: Optional[list] = None, features: Optional[sparse.csr_matrix] = None
+    ) -> Tuple[_Batch, int]:
+        """Add instances or a feature matrix to the pending batch and wait until it is predicted.
+
+        Returns:
+            Tuple[_Batch, int]: Predicted batch and the index of the first row of the request in its results.
+        """
+        with self._condition:
+            batch = self._batch
+            if features is None:
+                start = len(batch.instances)
+                batch.instances.extend(instances)
+            else:
+                start = batch.n_features
+                batch.features.append(features)
+                batch.n_features += features.shape[0]
+            batch.n_requests += 1
+            self._blocked += 1
+            ready = self._take_if_ready()  # the pending batch, which includes this request
+        if ready is not None:
+            self._predict(ready)
+        with self._condition:
+            while not batch.done:
+                self._condition.wait()
+        if batch.error is not None:
+            raise batch.error
+        return batch, start
+
+    def predict_proba_raw(self, instances, batch_size: int = 200) -> Iterator[Tuple[Sequence, np.ndarray]]:
+        """Probabilities of the instances, predicted together with the pending requests of other workers.
+
+        Args:
+            instances (InstanceInput): Instances to predict.
+            batch_size (int, optional): Ignored, the wrapped model is called with `self.batch_size`. Defaults to 200.
+
+        Returns:
+            Iterator[Tuple[Sequence, np.ndarray]]: Identifiers and probability matrix of the instances, as one batch.
+        """
+        instances = list(instances.values()) if hasattr(instances, "values") else list(instances)
+        batch, start = self._request(instances=instances)
+        end = start + len(instances)
+        return iter([([instance.identifier for instance in instances], batch.proba[start:end])])
+
+    def predict_proba_masks(self, sample, keep: np.ndarray) -> Optional[np.ndarray]:
+        """Probabilities of perturbations of a tokenized sample, given as a mask matrix of the tokens they keep.
+
+        The masks are featurized by the wrapped model in the calling worker, and predicted together with the pending
+        feature matrices of other workers.
+
+        Args:
+            sample (TextInstance): Tokenized sample.
+            keep (np.ndarray): Boolean mask matrix (n_perturbations x n_tokens), True where a token is kept.
+
+        Returns:
+            Optional[np.ndarray]: Probability matrix (n_perturbations x n_labels), or None if the wrapped model cannot
+                featurize the masks (the perturbations are then predicted from their texts).
+        """
+        featurize_masks = getattr(self.model, "featurize_masks", None)
+        X = featurize_masks(sample, keep) if featurize_masks is not None else None
+        if X is None:
+            return None
+        batch, start = self._request(features=X)
+        end = start + X.shape[0]
+        return batch.proba_features[start:end]
@@ -0,0 +1,510 @@
+# Copyright (c) 2022 Marcel Robeer for National Police Lab AI (NPAI).
+#
+# This program is free software; you can redistribute it and/or modify it under the terms of the GNU Lesser General
+# Public License (LGPL) as published by the Free Software Foundation; either version 3 (LGPLv3) of the License, or (at
+# your option) any later version. You may not use this file except in compliance with the license. You may obtain a copy
+# of the license at:
+#
+#     https://www.gnu.org/licenses/lgpl-3.0.en.html
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+
+"""Scalable prototypes: MMD-critic on a low-rank (Nyström) kernel approximation, and k-medoids on samples (CLARA)."""
+
+import time
+from typing import Callable, Dict, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from genbase.decorator import add_callargs
+from instancelib.instances.memory import MemoryBucketProvider
+from instancelib.labels.base import LabelProvider
+from scipy import sparse
+from sklearn.metrics.pairwise import pairwise_distances, rbf_kernel
+from text_explainability.data.embedding import Embedder, TfidfVectorizer
+from text_explainability.data.sampling import KMedoids as _KMedoids
+from text_explainability.data.sampling import LabelwiseMMDCritic as _LabelwiseMMDCritic
+from text_explainability.data.sampling import LabelwisePrototypeSampler
+from text_explainability.data.sampling import MMDCritic as _MMDCritic
+from text_explainability.generation.return_types import Instances
+from text_explainability.global_explanation import PrototypeCriticismWrapper, PrototypeWrapper
+
+from .embeddings import EmbeddedInstances
+
+
+def nystroem_features(
+    X: np.ndarray, n_components: int = 500, gamma: Optional[float] = None, seed: int = 0, chunk_size: int = 4096
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Features whose inner products approximate the RBF kernel, using the Nyström method.
+
+    The kernel between all instances and `n_components` landmarks (uniformly sampled instances) is evaluated in chunks
+    of `chunk_size` instances, so memory grows linearly with the number of instances instead of quadratically.
+
+    Args:
+        X (Union[np.ndarray, sparse.csr_matrix]): Embedded instances (n x d), dense or sparse.
+        n_components (int, optional): Number of landmarks, the rank of the approximation. Defaults to 500.
+        gamma (Optional[float], optional): RBF kernel coefficient; if None 1 / d. Defaults to None.
+        seed (int, optional): Seed for selecting the landmarks. Defaults to 0.
+        chunk_size (int, optional): Number of instances to evaluate the kernel for at the same time. Defaults to 4096.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: Features (n x min(n_components, n)), and the indices of the landmarks.
+    """
+    if gamma is None:
+        gamma = 1.0 / X.shape[1]
+    n = X.shape[0]
+    landmarks = np.sort(np.random.default_rng(seed).choice(n, size=min(n_components, n), replace=False))
+    X_landmarks = X[landmarks]
+    U, S, V = np.linalg.svd(rbf_kernel(X_landmarks, gamma=gamma))
+    normalization = np.dot(U / np.sqrt(np.maximum(S, 1e-12)), V).T
+    features = np.empty((n, len(landmarks)), dtype=np.float64)
+    for start in range(0, n, chunk_size):
+        chunk = slice(start, start + chunk_size)
+        features[chunk] = rbf_kernel(X[chunk], X_landmarks, gamma=gamma)
+    return features @ normalization, landmarks
+
+
+def approximation_error(
+    X: np.ndarray, features: np.ndarray, gamma: Optional[float] = None, n_samples: int = 500, seed: int = 0
+) -> float:
+    """Relative error (Frobenius norm) of the approximated kernel on a random sample of instances.
+
+    Args:
+        X (Union[np.ndarray, sparse.csr_matrix]): Embedded instances (n x d), dense or sparse.
+        features (np.ndarray): Features approximating the kernel (n x m).
+        gamma (Optional[float], optional): RBF kernel coefficient; if None 1 / d. Defaults to None.
+        n_samples (int, optional): Number of instances to compare the exact and approximated kernel for.
+            Defaults to 500.
+        seed (int, optional): Seed for sampling the instances. Defaults to 0.
+
+    Returns:
+        float: ||K - K'|| / ||K|| for the exact kernel K and approximated kernel K' of the sampled instances.
+    """
+    if gamma is None:
+        gamma = 1.0 / X.shape[1]
+    sample = np.random.default_rng(seed).choice(X.shape[0], size=min(n_samples, X.shape[0]), replace=False)
+    exact = rbf_kernel(X[sample], gamma=gamma)
+    return float(np.linalg.norm(exact - features[sample] @ features[sample].T) / np.linalg.norm(exact))
+
+
+class _SparseEmbeddedMixin:
+    @property
+    def embedded(self) -> Union[np.ndarray, sparse.csr_matrix]:
+        """Embedded instances, without densifying sparse or reading memory-mapped embeddings.
+
+        The cached matrix of `EmbeddedInstances` is used as is, and sparse vectors are stacked into a CSR matrix.
+        """
+        if isinstance(self.instances, EmbeddedInstances):
+            return self.instances.embedded()
+        vectors = self.instances.bulk_get_vectors(list(self.instances))[-1]
+        if any(sparse.issparse(vector) for vector in vectors):
+            return sparse.vstack(vectors, format="csr")
+        return np.stack(vectors)
+
+
+class NystroemMMDCritic(_SparseEmbeddedMixin, _MMDCritic):
+    def __init__(
+        self,
+        instances: MemoryBucketProvider,
+        embedder: Embedder = TfidfVectorizer,
+        n_components: int = 500,
+        seed: int = 0,
+        chunk_size: int = 4096,
+        n_error_samples: int = 500,
+    ):
+        """Select prototypes and criticisms with MMD-critic, on a Nyström approximation of the RBF kernel.
+
+        Instead of the n x n kernel, only n x `n_components` features are kept whose inner products approximate it,
+        and the greedy selection is done on these features. Time and memory thus grow linearly with the number of
+        instances. With `n_components` >= n the kernel is exact (up to rounding). The relative error of the
+        approximation, estimated on a sample of `n_error_samples` instances, is reported in `approximation`.
+
+        Args:
+            instances (MemoryBucketProvider): Instances to select from (e.g. training set, all instance from class 0).
+            embedder (Embedder, optional): Method to embed instances (if the `.vector` property is not yet set).
+                Defaults to TfidfVectorizer.
+            n_components (int, optional): Rank of the approximation. Defaults to 500.
+            seed (int, optional): Seed for selecting the landmarks and the instances to estimate the error on.
+                Defaults to 0.
+            chunk_size (int, optional): Number of instances to evaluate the kernel for at the same time.
+                Defaults to 4096.
+            n_error_samples (int, optional): Number of instances to estimate the approximation error on.
+                Defaults to 500.
+        """
+        self.n_components = n_components
+        self.seed = seed
+        self.chunk_size = chunk_size
+        self.n_error_samples = n_error_samples
+        super().__init__(instances, embedder=embedder, kernel=rbf_kernel)
+
+    def _calculate_kernel(self):
+        """Calculate the features `features` approximating the kernel, its column totals `colsum` and diagonal."""
+        embedded = self.embedded
+        gamma = 1.0 / embedded.shape[1]
+        self.features, _ = nystroem_features(embedded, self.n_components, gamma, self.seed, self.chunk_size)
+        self.colsum = self.features @ self.features.mean(axis=0)
+        self.diagonal = np.einsum("ij,ij->i", self.features, self.features)
+        self.approximation = {
+            "method": "nystroem",
+            "n_components": self.features.shape[1],
+            "relative_error": approximation_error(embedded, self.features, gamma, self.n_error_samples, self.seed),
+        }
+
+    def to_config(self):
+        """Configuration, including the approximation of the kernel."""
+        return {**super().to_config(), "n_components": self.n_components, "approximation": self.approximation}
+
+    def prototypes(self, n: int = 5) -> Sequence:
+        """Greedily select the `n` most representative instances as prototypes, in the same way as MMDCritic.
+
+        Args:
+            n (int, optional): Number of prototypes to select. Defaults to 5.
+
+        Raises:
+            ValueError: Cannot select more instances than the total number of instances.
+
+        Returns:
+            Sequence[DataPoint]: List of prototype instances.
+        """
+        if n > len(self.instances):
+            raise ValueError(f"Cannot select more than all instances ({len(self.instances)}.")
+
+        is_candidate = np.ones(len(self.instances), dtype=bool)
+        selected_sum = np.zeros(self.features.shape[1])
+        selected = []
+        for i in range(n):
+            # sum of the kernel between the selected instances and each instance, without forming the kernel
+            s1 = 2 * self.colsum - (2 * (self.features @ selected_sum) + np.abs(self.diagonal)) / (i + 1)
+            best = int(np.flatnonzero(is_candidate)[np.argmax(s1[is_candidate])])
+            is_candidate[best] = False
+            selected_sum += self.features[best]
+            selected.append(best)
+
+        self._prototypes = self._select_from_provider(selected)
+        return self._prototypes
+
+    def criticisms(self, n: int = 5, regularizer: Optional[str] = None) -> Sequence:
+        """Greedily select `n` criticisms, the instances least represented by the prototypes, like MMDCritic.
+
+        Args:
+            n (int, optional): Number of criticisms to select. Defaults to 5.
+            regularizer (Optional[str], optional): Regularization method. Choose from [None, 'logdet', 'iterative'].
+                Defaults to None.
+
+        Raises:
+            Exception: `NystroemMMDCritic.prototypes()` must first be run before being able to determine the criticisms.
+            ValueError: Unknown regularizer or requested more criticisms than there are samples left.
+
+        Returns:
+            Sequence[DataPoint]: List of criticism instances.
+        """
+        if self._prototypes is None:
+            raise Exception("Calculating criticisms requires prototypes. Run `NystroemMMDCritic.prototypes()` first.")
+        regularizers = {None, "logdet", "iterative"}
+        if regularizer not in regularizers:
+            raise ValueError(f"Unknown {regularizer=}. Choose from {regularizers}.")
+        n_left = len(self.instances) - len(self._prototypes)
+        if n > n_left:
+            raise ValueError(f"Cannot select more than instances excluding prototypes ({n_left})")
+
+        id_map = {instance: i for i, instance in enumerate(self.instances)}
+        prototypes = [id_map[p.identifier] for p in self._prototypes]
+        is_candidate = np.ones(len(self.instances), dtype=bool)
+        is_candidate[prototypes] = False
+        reference_sum, n_reference = self.features[prototypes].sum(axis=0), len(prototypes)
+
+        selected, inverse_of_prev_selected = [], None
+        for _ in range(n):
+            s1 = np.abs(self.colsum - self.features @ reference_sum / n_reference)
+            if regularizer == "logdet":
+                diag = self.diagonal + 1
+                with np.errstate(divide="ignore"):
+                    if inverse_of_prev_selected is not None:
+                        temp = self.features[selected] @ self.features.T
+                        regcolsum = np.sum((inverse_of_prev_selected @ temp) * temp, axis=0)
+                        s1 += np.log(np.abs(diag - regcolsum))
+                    else:
+                        s1 -= np.log(np.abs(diag))
+
+            best = int(np.flatnonzero(is_candidate)[np.argmax(s1[is_candidate])])
+            is_candidate[best] = False
+            selected.append(best)
+
+            if regularizer == "iterative":
+                reference_sum, n_reference = reference_sum + self.features[best], n_reference + 1
+            if regularizer == "logdet":
+                inverse_of_prev_selected = np.linalg.pinv(self.features[selected] @ self.features[selected].T)
+
+        self._criticisms = self._select_from_provider(selected)
+        return self._criticisms
+
+
+class LabelwiseNystroemMMDCritic(_LabelwiseMMDCritic):
+    def __init__(
+        self,
+        instances: MemoryBucketProvider,
+        labels: Union[Sequence[str], Sequence[int], LabelProvider],
+        embedder: Embedder = TfidfVectorizer,
+        **kwargs,
+    ):
+        """Select prototypes and criticisms for each label with `NystroemMMDCritic`.
+
+        Args:
+            instances (MemoryBucketProvider): Instances to select from (e.g. training set, all instance from class 0).
+            labels (Union[Sequence[str], Sequence[int], LabelProvider]): Ground-truth or predicted labels, providing
+                the groups (e.g. classes) in which to subdivide the instances.
+            embedder (Embedder, optional): Method to embed instances (if the `.vector` property is not yet set).
+                Defaults to TfidfVectorizer.
+            **kwargs: Arguments passed to `NystroemMMDCritic` (e.g. `n_components`, `seed`).
+        """
+        super(_LabelwiseMMDCritic, self).__init__(
+            NystroemMMDCritic, instances=instances, labels=labels, embedder=embedder, **kwargs
+        )
+
+    @property
+    def approximation(self) -> Dict[str, dict]:
+        """Approximation of the kernel (including its relative error) for each label."""
+        return {label: sampler.approximation for label, sampler in self._samplers.items()}
+
+
+class _ApproximationWrapper(PrototypeCriticismWrapper):
+    """Wrapper that reports the kernel approximation of its sampler in the meta information of its return types."""
+
+    def _instances(self, instances: dict, subtype: str, callargs) -> Instances:
+        return Instances(
+            instances=instances,
+            type=self.type,
+            subtype=subtype,
+            method=self.method,
+            callargs=callargs,
+            labelwise=self.labelwise,
+            approximation=self.prototype_sampler.approximation,
+        )
+
+    @add_callargs
+    def __call__(self, *args, **kwargs) -> Instances:
+        callargs = kwargs.pop("__callargs__", None)
+        return self._instances(self.prototype_sampler(*args, **kwargs), self.subtype, callargs)
+
+    @add_callargs
+    def prototypes(self, *args, **kwargs) -> Instances:
+        callargs = kwargs.pop("__callargs__", None)
+        return self._instances(
+            {"prototypes": self.prototype_sampler.prototypes(*args, **kwargs)}, "prototypes", callargs
+        )
+
+    @add_callargs
+    def criticisms(self, *args, **kwargs) -> Instances:
+        callargs = kwargs.pop("__callargs__", None)
+        return self._instances(
+            {"criticisms": self.prototype_sampler.criticisms(*args, **kwargs)}, "criticisms", callargs
+        )
+
+
+class ApproximateMMDCritic(_ApproximationWrapper):
+    def __init__(self, *args, **kwargs):
+        """MMD-critic on a Nyström approximation of the kernel, reporting the approximation in its meta information.
+
+        Args:
+            *args: Arguments passed to `NystroemMMDCritic`.
+            **kwargs: Keyword arguments passed to `NystroemMMDCritic`.
+        """
+        super().__init__(NystroemMMDCritic, *args, method="mmdcritic", subtype="prototypes_&_criticisms", **kwargs)
+
+
+class LabelwiseApproximateMMDCritic(_ApproximationWrapper):
+    def __init__(self, *args, **kwargs):
+        """Labelwise MMD-critic on a Nyström approximation of the kernel of each label.
+
+        Args:
+            *args: Arguments passed to `LabelwiseNystroemMMDCritic`.
+            **kwargs: Keyword arguments passed to `LabelwiseNystroemMMDCritic`.
+        """
+        super().__init__(
+            LabelwiseNystroemMMDCritic, *args, method="mmdcritic", subtype="prototypes_&_criticisms", **kwargs
+        )
+        self.labelwise = True
+
+
+def _nearest_two(distances: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Index of the nearest medoid, and the distance to the nearest and second nearest medoid of each instance."""
+    if distances.shape[0] == 1:
+        return np.zeros(distances.shape[1], dtype=int), distances[0], np.full(distances.shape[1], np.inf)
+    order = np.argpartition(distances, 1, axis=0)[:2]
+    columns = np.arange(distances.shape[1])
+    return order[0], distances[order[0], columns], distances[order[1], columns]
+
+
+def faster_pam(
+    distances: np.ndarray, k: int, seed: int = 0, max_iter: int = 100, deadline: Optional[float] = None
+) -> Tuple[np.ndarray, float]:
+    """Select `k` medoids from a distance matrix with eager swaps, in the style of FasterPAM.
+
+    Starts from `k` random medoids. Each candidate is then considered in turn, and swapped with the medoid whose
+    removal decreases the total deviation most, as soon as that is an improvement. A pass over all candidates costs
+    O(n^2) instead of the O(k n^2) of PAM. Stops after a pass without swaps, `max_iter` passes or the `deadline`.
+
+    Args:
+        distances (np.ndarray): Symmetric distances between the instances (n x n).
+        k (int): Number of medoids.
+        seed (int, optional): Seed for the initial medoids. Defaults to 0.
+        max_iter (int, optional): Maximum number of passes. Defaults to 100.
+        deadline (Optional[float], optional): Time (of `time.perf_counter()`) after which no more passes are started.
+            Defaults to None.
+
+    Returns:
+        Tuple[np.ndarray, float]: Indices of the medoids, and their total deviation.
+    """
+    n = distances.shape[0]
+    medoids = np.random.default_rng(seed).choice(n, size=k, replace=False)
+    nearest, d_nearest, d_second = _nearest_two(distances[medoids])
+    removal_loss = np.bincount(nearest, weights=d_second - d_nearest, minlength=k)
+    for _ in range(max_iter):
+        swapped = False
+        for candidate in range(n):
+            if candidate in medoids:
+                continue
+            d_candidate = distances[candidate]
+            closer = d_candidate < d_nearest
+            shared = np.sum((d_candidate - d_nearest)[closer])
+            change = removal_loss + np.bincount(nearest[closer], weights=(d_nearest - d_second)[closer], minlength=k)
+            between = ~closer & (d_candidate < d_second)
+            change += np.bincount(
+                nearest[between], weights=(d_candidate - d_second)[between], minlength=k
+            )  # candidate becomes the nearest when the nearest medoid is removed
+            best = int(np.argmin(change))
+            if shared + change[best] < -1e-12:
+                medoids[best] = candidate
+                nearest, d_nearest, d_second = _nearest_two(distances[medoids])
+                removal_loss = np.bincount(nearest, weights=d_second - d_nearest, minlength=k)
+                swapped = True
+        if not swapped or deadline is not None and time.perf_counter() > deadline:
+            break
+    return medoids, float(d_nearest.sum())
+
+
+class ClaraKMedoids(_SparseEmbeddedMixin, _KMedoids):
+    def __init__(
+        self,
+        instances: MemoryBucketProvider,
+        embedder: Embedder = TfidfVectorizer,
+        seed: int = 0,
+        n_init: int = 5,
+        sample_size: Optional[int] = None,
+        time_budget: Optional[float] = None,
+        max_iter: int = 100,
+        chunk_size: int = 4096,
+    ):
+        """Select prototypes with k-medoids on samples of the instances (CLARA), for large numbers of instances.
+
+        Each of the `n_init` restarts selects medoids on a random sample with FasterPAM-style swaps, and scores them
+        by their total deviation over all instances (with the distances computed in chunks). The medoids with the
+        lowest deviation are the prototypes. Memory thus grows with the sample size squared, and linearly with the
+        number of instances.
+
+        Args:
+            instances (MemoryBucketProvider): Instances to select from (e.g. training set, all instance from class 0).
+            embedder (Embedder, optional): Method to embed instances (if the `.vector` property is not yet set).
+                Defaults to TfidfVectorizer.
+            seed (int, optional): Seed for reproducibility. Defaults to 0.
+            n_init (int, optional): Number of samples (restarts). Defaults to 5.
+            sample_size (Optional[int], optional): Number of instances in each sample; if None 40 + 2n for n
+                prototypes (the default of CLARA). Defaults to None.
+            time_budget (Optional[float], optional): Maximum number of seconds to spend, after which no more swaps
+                or restarts are started (the first restart is always scored); if None there is no time limit.
+                Defaults to None.
+            max_iter (int, optional): Maximum number of swap passes of each restart. Defaults to 100.
+            chunk_size (int, optional): Number of instances to compute the distances for at the same time.
+                Defaults to 4096.
+        """
+        super().__init__(instances, embedder=embedder, seed=seed)
+        self.n_init = n_init
+        self.sample_size = sample_size
+        self.time_budget = time_budget
+        self.max_iter = max_iter
+        self.chunk_size = chunk_size
+
+    def _deviation(
+        self, embedded: Union[np.ndarray, sparse.csr_matrix], medoids: np.ndarray, metric: Union[str, Callable]
+    ) -> float:
+        """Total distance of all (dense or sparse) instances to their nearest medoid."""
+        embedded_medoids = embedded[medoids]
+        chunks = (slice(start, start + self.chunk_size) for start in range(0, embedded.shape[0], self.chunk_size))
+        return float(
+            sum(pairwise_distances(embedded[c], embedded_medoids, metric=metric).min(axis=1).sum() for c in chunks)
+        )
+
+    def prototypes(self, n: int = 5, metric: Union[str, Callable] = "cosine") -> Sequence:
+        """Select `n` medoids as prototypes, using the sample whose medoids have the lowest total deviation.
+
+        Args:
+            n (int, optional): Number of prototypes to select. Defaults to 5.
+            metric (Union[str, Callable], optional): Distance metric used to calculate medoids (e.g. 'cosine',
+                'euclidean' or your own function). Defaults to 'cosine'.
+
+        Raises:
+            ValueError: Cannot select more instances than the total number of instances.
+
+        Returns:
+            Sequence[DataPoint]: List of prototype instances.
+        """
+        embedded = self.embedded
+        if n > embedded.shape[0]:
+            raise ValueError(f"Cannot select more than all instances ({embedded.shape[0]}).")
+        deadline = None if self.time_budget is None else time.perf_counter() + self.time_budget
+        sample_size = min(self.sample_size or 40 + 2 * n, embedded.shape[0])
+        rng = np.random.default_rng(self.seed)
+
+        best, best_deviation = None, np.inf
+        for _ in range(self.n_init):
+            sample = np.sort(rng.choice(embedded.shape[0], size=sample_size, replace=False))
+            medoids, _ = faster_pam(
+                pairwise_distances(embedded[sample], metric=metric),
+                n,
+                seed=int(rng.integers(2**32)),
+                max_iter=self.max_iter,
+                deadline=deadline,
+            )
+            medoids = sample[np.sort(medoids)]
+            deviation = self._deviation(embedded, medoids, metric)
+            if deviation < best_deviation:
+                best, best_deviation = medoids, deviation
+            if deadline is not None and time.perf_counter() > deadline:
+                break
+        self.deviation = best_deviation
+        return self._select_from_provider(best)
+
+
+class LabelwiseClaraKMedoids(LabelwisePrototypeSampler):
+    def __init__(
+        self,
+        instances: MemoryBucketProvider,
+        labels: Union[Sequence[str], Sequence[int], LabelProvider],
+        embedder: Embedder = TfidfVectorizer,
+        **kwargs,
+    ):
+        """Select prototypes for each label with `ClaraKMedoids`.
+
+        Args:
+            instances (MemoryBucketProvider): Instances to select from (e.g. training set, all instance from class 0).
+            labels (Union[Sequence[str], Sequence[int], LabelProvider]): Ground-truth or predicted labels, providing
+                the groups (e.g. classes) in which to subdivide the instances.
+            embedder (Embedder, optional): Method to embed instances (if the `.vector` property is not yet set).
+                Defaults to TfidfVectorizer.
+            **kwargs: Arguments passed to `ClaraKMedoids` (e.g. `seed`, `n_init`, `time_budget`).
+        """
+        super().__init__(ClaraKMedoids, instances=instances, labels=labels, embedder=embedder, **kwargs)
+
+
+class FastKMedoids(PrototypeWrapper):
+    def __init__(self, *args, **kwargs):
+        """Get prototypes with k-medoids on samples of the instances (CLARA), see `ClaraKMedoids`."""
+        super().__init__(ClaraKMedoids, *args, method="kmedoids", subtype="prototypes", **kwargs)
+
+
+class LabelwiseFastKMedoids(PrototypeWrapper):
+    def __init__(self, *args, **kwargs):
+        """Get prototypes for each label with k-medoids on samples of the instances (CLARA), see `ClaraKMedoids`."""
+        super().__init__(LabelwiseClaraKMedoids, *args, method="kmedoids", subtype="prototypes", **kwargs)
+        self.labelwise = True
@@ -0,0 +1,407 @@
+# Copyright (c) 2022 Marcel Robeer for National Police Lab AI (NPAI).
+#
+# This program is free software; you can redistribute it and/or modify it under the terms of the GNU Lesser General
+# Public License (LGPL) as published by the Free Software Foundation; either version 3 (LGPLv3) of the License, or (at
+# your option) any later version. You may not use this file except in compliance with the license. You may obtain a copy
+# of the license at:
+#
+#     https://www.gnu.org/licenses/lgpl-3.0.en.html
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public License for more
+# details.
+
+"""Global token explanations from a (cached) sparse document-term matrix, tokenizing each split only once."""
+
+import threading
+from collections import OrderedDict
+from math import log
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+from genbase import add_callargs, translate_list
+from instancelib import AbstractClassifier
+from instancelib.labels import LabelProvider
+from scipy import sparse
+from sklearn.feature_extraction.text import CountVectorizer
+from text_explainability import TokenFrequency as _TokenFrequency
+from text_explainability import TokenInformation as _TokenInformation
+from text_explainability import default_tokenizer
+from text_explainability.generation.return_types import FeatureList
+
+from .cache import digest, fingerprint_instances
+
+# Arguments of `CountVectorizer` that only change how texts are tokenized, not which terms are kept
+ANALYZER_KWARGS = frozenset(
+    [
+        "input",
+        "encoding",
+        "decode_error",
+        "strip_accents",
+        "lowercase",
+        "preprocessor",
+        "tokenizer",
+        "stop_words",
+        "token_pattern",
+        "ngram_range",
+        "analyzer",
+        "dtype",
+    ]
+)
+
+
+class DocumentTermMatrix:
+    def __init__(self, matrix: sparse.csr_matrix, vocabulary: np.ndarray):
+        """Sparse instance×term count matrix of a split, with its vocabulary.
+
+        The column indices of each row are in the order the terms first appear in the instance (instead of sorted), so
+        the order in which terms first appear in any subset of instances can be recovered without tokenizing again.
+
+        Args:
+            matrix (sparse.csr_matrix): Count of each term (columns) in each instance (rows).
+            vocabulary (np.ndarray): Term of each column, in the order of first appearance.
+        """
+        self.matrix = matrix
+        self.vocabulary = vocabulary
+        self._alphabetical: Optional[np.ndarray] = None
+
+    @property
+    def alphabetical(self) -> np.ndarray:
+        """Columns in alphabetical order of their terms (as the columns of `CountVectorizer`)."""
+        if self._alphabetical is None:
+            self._alphabetical = np.argsort(self.vocabulary.astype(str), kind="stable")
+        return self._alphabetical
+
+    @staticmethod
+    def supports(count_vectorizer_kwargs: dict) -> bool:
+        """Whether the `CountVectorizer` arguments only change the tokenization (and not which terms are kept)."""
+        return set(count_vectorizer_kwargs).issubset(ANALYZER_KWARGS)
+
+    @classmethod
+    def from_texts(cls, texts: Iterable[str], lower: bool = True, **count_vectorizer_kwargs) -> "DocumentTermMatrix":
+        """Tokenize texts (like `CountVectorizer`) into a document-term matrix.
+
+        Args:
+            texts (Iterable[str]): Text of each instance.
+            lower (bool, optional): Whether to make all texts lowercase. Defaults to True.
+            **count_vectorizer_kwargs: Arguments passed to `CountVectorizer`, see `DocumentTermMatrix.supports()`.
+
+        Returns:
+            DocumentTermMatrix: Document-term matrix.
+        """
+        if "tokenizer" not in count_vectorizer_kwargs:
+            count_vectorizer_kwargs["tokenizer"] = default_tokenizer
+        dtype = count_vectorizer_kwargs.pop("dtype", np.int64)
+        analyze = CountVectorizer(**count_vectorizer_kwargs).build_analyzer()
+
+        vocabulary: dict = {}
+        indices, indptr, data = [], [0], []
+        for text in texts:
+            terms = [
+                vocabulary.setdefault(term, len(vocabulary)) for term in analyze(str.lower(text) if lower else text)
+            ]
+            unique, first, counts = np.unique(np.asarray(terms, dtype=np.int64), return_index=True, return_counts=True)
+            order = np.argsort(first, kind="stable")
+            indices.append(unique[order])
+            data.append(counts[order])
+            indptr.append(indptr[-1] + len(unique))
+        if not vocabulary:
+            raise ValueError("empty vocabulary; perhaps the documents only contain stop words")
+
+        matrix = sparse.csr_matrix(
+            (np.concatenate(data).astype(dtype), np.concatenate(indices), np.asarray(indptr)),
+            shape=(len(indptr) - 1, len(vocabulary)),
+        )
+        return cls(matrix, np.array(list(vocabulary), dtype=object))
+
+    def to_config(self) -> dict:
+        """Size of the matrix (instead of its contents)."""
+        return {"n_instances": self.matrix.shape[0], "n_terms": self.matrix.shape[1]}
+
+    def rows(self, rows: Optional[np.ndarray] = None) -> sparse.csr_matrix:
+        """Rows of the matrix (all if None), keeping the order of their column indices."""
+        if rows is None:
+            return self.matrix
+        starts, ends = self.matrix.indptr[rows], self.matrix.indptr[np.asarray(rows) + 1]
+        lengths = ends - starts
+        positions = np.repeat(starts - np.cumsum(np.r_[0, lengths[:-1]]), lengths) + np.arange(lengths.sum())
+        return sparse.csr_matrix(
+            (self.matrix.data[positions], self.matrix.indices[positions], np.r_[0, np.cumsum(lengths)]),
+            shape=(len(lengths), self.matrix.shape[1]),
+        )
+
+    def count_matrix(self, rows: Optional[np.ndarray] = None) -> Tuple[sparse.csr_matrix, np.ndarray, np.ndarray]:
+        """Rows of the matrix (all if None) with the columns of `CountVectorizer`, their terms and token lengths.
+
+        Args:
+            rows (Optional[np.ndarray], optional): Rows to select. Defaults to None.
+
+        Returns:
+            Tuple[sparse.csr_matrix, np.ndarray, np.ndarray]: Count matrix (columns in alphabetical order of their
+                terms), terms (one per column) and the number of tokens in each row.
+        """
+        X = self.rows(rows)[:, self.alphabetical]
+        X.sort_indices()
+        return X, self.vocabulary[self.alphabetical], np.asarray(X.sum(axis=1)).ravel()
+
+    def first_appearance(self, matrix: sparse.csr_matrix) -> np.ndarray:
+        """Columns that occur in (rows of) the matrix, in the order they first appear."""
+        columns, first = np.unique(matrix.indices, return_index=True)
+        return columns[np.argsort(first, kind="stable")]
+
+
+# Document-term matrices of splits, shared by all explainers and examiners (least recently used last)
+MAX_DOCUMENT_TERMS = 8
+_DOCUMENT_TERMS: "OrderedDict[tuple, DocumentTermMatrix]" = OrderedDict()
+_DOCUMENT_TERMS_LOCK = threading.Lock()
+
+
+def document_terms(instances, lower: bool = True, **count_vectorizer_kwargs) -> DocumentTermMatrix:
+    """Document-term matrix of a split (rows in the order of its `key_list`), shared by all explainers and examiners.
+
+    Each split is tokenized only once for its fingerprint (identifiers and data) and tokenization options, and the
+    `MAX_DOCUMENT_TERMS` most recently used matrices are kept. Threads that request the same matrix at the same time
+    all get the one stored first.
+
+    Args:
+        instances (InstanceProvider): Instances of the split.
+        lower (bool, optional): Whether to make all texts lowercase. Defaults to True.
+        **count_vectorizer_kwargs: Arguments passed to `CountVectorizer`, see `DocumentTermMatrix.supports()`.
+
+    Returns:
+        DocumentTermMatrix: Document-term matrix.
+    """
+    if "tokenizer" not in count_vectorizer_kwargs:
+        count_vectorizer_kwargs["tokenizer"] = default_tokenizer
+    key = (fingerprint_instances(instances), lower, digest(count_vectorizer_kwargs))
+    with _DOCUMENT_TERMS_LOCK:
+        if key in _DOCUMENT_TERMS:
+            _DOCUMENT_TERMS.move_to_end(key)
+            return _DOCUMENT_TERMS[key]
+
+    texts = (instances[instance_key].data for instance_key in instances.key_list)
+    matrix = DocumentTermMatrix.from_texts(texts, lower=lower, **count_vectorizer_kwargs)
+    with _DOCUMENT_TERMS_LOCK:
+        matrix = _DOCUMENT_TERMS.setdefault(key, matrix)
+        _DOCUMENT_TERMS.move_to_end(key)
+        while len(_DOCUMENT_TERMS) > MAX_DOCUMENT_TERMS:
+            _DOCUMENT_TERMS.popitem(last=False)
+    return matrix
+
+
+def top_k(scores: np.ndarray, k: Optional[int]) -> np.ndarray:
+    """Indices of the k highest scores from high to low (ties in order of index), partitioning instead of sorting all.
+
+    Args:
+        scores (np.ndarray): Scores.
+        k (Optional[int]): Number of indices, or all if None.
+
+    Returns:
+        np.ndarray: Indices, as `np.argsort(-scores, kind='stable')[:k]`.
+    """
+    n = len(scores)
+    if k is None or k < 0 or k >= n:
+        return np.argsort(-scores, kind="stable")[:k]
+    if k == 0:
+        return np.empty(0, dtype=np.intp)
+    threshold = scores[np.argpartition(scores, n - k)[n - k]]
+    candidates = np.flatnonzero(scores >= threshold)  # includes all ties of the k-th highest score
+    return candidates[np.argsort(-scores[candidates], kind="stable")[:k]]
+
+
+def mutual_information(matrix: sparse.csr_matrix, codes: np.ndarray, n_labels: int) -> np.ndarray:
+    """Mutual information between the (discrete) count of each term and the labels, as `mutual_info_classif()`.
+
+    The contingency of each term is computed in closed form from the non-zero counts, where the instances without the
+    term follow from one sparse term×label co-occurrence matrix product.
+
+    Args:
+        matrix (sparse.csr_matrix): Count of each term (columns) in each instance (rows).
+        codes (np.ndarray): Label code of each instance.
+        n_labels (int): Number of labels.
+
+    Returns:
+        np.ndarray: Mutual information (in nats) of each term.
+    """
+    from ...examine.slices import indicator_matrix
+
+    n, n_terms = matrix.shape
+    if n_labels <= 1:
+        return np.zeros(n_terms)
+    coo = matrix.tocoo()
+    label_counts = np.bincount(codes, minlength=n_labels)
+
+    # Instances with each (term, count, label), for non-zero counts, with the triples encoded as one integer
+    n_counts = int(coo.data.max(initial=0)) + 1
+    values = coo.col.astype(np.int64) * n_counts + coo.data.astype(np.int64)
+    cells, cell_sizes = np.unique(values * n_labels + codes[coo.row], return_counts=True)
+    cell_values, cell_labels = np.divmod(cells, n_labels)
+    values, value_index = np.unique(cell_values, return_inverse=True)
+    cell_terms = cell_values // n_counts
+    value_sizes = np.bincount(value_index, weights=cell_sizes)[value_index]
+
+    # Instances without each term, for each label
+    occurrences = (matrix > 0).astype(np.int64).T @ indicator_matrix(codes, n_labels)
+    absent = label_counts[np.newaxis, :] - occurrences.toarray()
+    absent_sizes = absent.sum(axis=1)
+    absent_terms, absent_labels = np.nonzero(absent)
+
+    # Sum the information of the cells of each term in the order of `mutual_info_score()` (by count, then label)
+    terms = np.concatenate([absent_terms, cell_terms])
+    sizes = np.concatenate([absent[absent_terms, absent_labels], cell_sizes])
+    value_sizes = np.concatenate([absent_sizes[absent_terms], value_sizes])
+    labels = np.concatenate([absent_labels, cell_labels])
+    order = np.argsort(np.concatenate([absent_terms * n_counts, cell_values]) * n_labels + labels, kind="stable")
+    terms, sizes, value_sizes, labels = terms[order], sizes[order], value_sizes[order], labels[order]
+
+    p = sizes / n
+    log_outer = -np.log(value_sizes * label_counts[labels]) + log(n) + log(n)
+    mi = p * (np.log(sizes) - log(n)) + p * log_outer
+    mi = np.where(np.abs(mi) < np.finfo(mi.dtype).eps, 0.0, mi)
+    mi = np.bincount(terms, weights=mi, minlength=n_terms)
+
+    # A term with the same count in all instances has no information
+    n_values = np.bincount(values // n_counts, minlength=n_terms) + (absent_sizes > 0)
+    mi[n_values <= 1] = 0.0
+    return np.clip(mi, 0.0, None)
+
+
+class TokenFrequency(_TokenFrequency):
+    def __init__(self, provider, terms: DocumentTermMatrix, seed: int = 0):
+        """Token frequency from the document-term matrix of the provider, without tokenizing it again.
+
+        Gives the same result as `text_explainability.TokenFrequency`.
+
+        Args:
+            provider (InstanceProvider): Dataset to explain.
+            terms (DocumentTermMatrix): Document-term matrix of the dataset (rows in the order of its `key_list`).
+            seed (int, optional): Seed for reproducibility. Defaults to 0.
+        """
+        super().__init__(provider, seed=seed)
+        self.terms = terms
+
+    def _top_k(self, rows: Optional[np.ndarray], k: Optional[int], filter_words: List[str]):
+        """Top-k terms by count in the rows (ties in order of first appearance), excluding the filter words."""
+        matrix = self.terms.rows(rows)
+        columns = self.terms.first_appearance(matrix)
+        columns = columns[~np.isin(self.terms.vocabulary[columns], list(filter_words))]
+        counts = np.ravel(matrix.sum(axis=0))[columns]
+        order = top_k(counts, k)
+        return list(self.terms.vocabulary[columns[order]]), list(counts[order])
+
+    @add_callargs
+    def __call__(
+        self,
+        model: Optional[AbstractClassifier] = None,
+        labelprovider: Optional[LabelProvider] = None,
+        explain_model: bool = True,
+        labelwise: bool = True,
+        k: Optional[int] = None,
+        filter_words: List[str] = translate_list("stopwords"),
+        lower: bool = True,
+        **count_vectorizer_kwargs,
+    ) -> FeatureList:
+        """Show the top-k number of tokens for each ground-truth or predicted label.
+
+        Args:
+            model (Optional[AbstractClassifier], optional): Predictive model to explain. Defaults to None.
+            labelprovider (Optional[LabelProvider], optional): Ground-truth labels to explain. Defaults to None.
+            explain_model (bool, optional): Whether to explain the model (True) or ground-truth labels (False).
+                Defaults to True.
+            labelwise (bool, optional): Whether to summarize the counts for each label seperately. Defaults to True.
+            k (Optional[int], optional): Limit to the top-k words per label, or all words if None. Defaults to None.
+            filter_words (List[str], optional): Words to filter out from top-k. Defaults to ['a', 'an', 'the'].
+            lower (bool, optional): Ignored, the document-term matrix is already tokenized. Defaults to True.
+            **count_vectorizer_kwargs: Ignored, the document-term matrix is already tokenized.
+
+        Returns:
+            FeatureList: Each label with corresponding top words and their frequency
+        """
+        type, subtype = "global_explanation", "token_frequency"
+        callargs = count_vectorizer_kwargs.pop("__callargs__", None)
+
+        _, labels = self.get_instances_labels(model, labelprovider, explain_model=explain_model)
+
+        if labelwise:
+            label_names = np.unique(labels)
+            label_ids = list(range(len(label_names)))
+            used_features, scores = zip(
+                *[self._top_k(np.flatnonzero(labels == label), k, filter_words) for label in label_names]
+            )
+            return FeatureList(
+                labels=label_ids,
+                labelset=label_names,
+                used_features=dict(zip(label_ids, map(tuple, used_features))),
+                scores=dict(zip(label_ids, map(tuple, scores))),
+                type=type,
+                subtype=subtype,
+                callargs=callargs,
+            )
+        used_features, scores = self._top_k(None, k, filter_words)
+        return FeatureList(
+            used_features=tuple(used_features), scores=tuple(scores), type=type, subtype=subtype, callargs=callargs
+        )
+
+
+class TokenInformation(_TokenInformation):
+    def __init__(self, provider, terms: DocumentTermMatrix, seed: int = 0):
+        """Token mutual information from the document-term matrix of the provider, without tokenizing it again.
+
+        Gives the same result as `text_explainability.TokenInformation` (up to floating point rounding), but computes
+        the mutual information in closed form from the sparse counts and selects the top-k without sorting all terms.
+
+        Args:
+            provider (InstanceProvider): Dataset to explain.
+            terms (DocumentTermMatrix): Document-term matrix of the dataset (rows in the order of its `key_list`).
+            seed (int, optional): Seed for reproducibility. Defaults to 0.
+        """
+        super().__init__(provider, seed=seed)
+        self.terms = terms
+
+    @add_callargs
+    def __call__(
+        self,
+        model: Optional[AbstractClassifier] = None,
+        labelprovider: Optional[LabelProvider] = None,
+        explain_model: bool = True,
+        k: Optional[int] = None,
+        filter_words: List[str] = translate_list("stopwords"),
+        lower: bool = True,
+        **count_vectorizer_kwargs,
+    ) -> FeatureList:
+        """Show the top-k token mutual information for a dataset or model.
+
+        Args:
+            model (Optional[AbstractClassifier], optional): Predictive model to explain. Defaults to None.
+            labelprovider (Optional[LabelProvider], optional): Ground-truth labels to explain. Defaults to None.
+            explain_model (bool, optional): Whether to explain the model (True) or ground-truth labels (False).
+                Defaults to True.
+            k (Optional[int], optional): Limit to the top-k words, or all words if None. Defaults to None.
+            filter_words (List[str], optional): Words to filter out from top-k. Defaults to ['a', 'an', 'the'].
+            lower (bool, optional): Ignored, the document-term matrix is already tokenized. Defaults to True.
+            **count_vectorizer_kwargs: Ignored, the document-term matrix is already tokenized.
+
+        Returns:
+           FeatureList: k labels, sorted based on their mutual information with the output (predictive model labels
+                or ground-truth labels)
+        """
+        callargs = count_vectorizer_kwargs.pop("__callargs__", None)
+
+        _, labels = self.get_instances_labels(model, labelprovider, explain_model=explain_model)
+
+        label_names, codes = np.unique(labels, return_inverse=True)
+        mif = mutual_information(self.terms.matrix, np.ravel(codes), len(label_names))
+
+        # Columns in alphabetical order (as `CountVectorizer`), so ties are ordered alphabetically
+        columns = self.terms.alphabetical
+        columns = columns[~np.isin(self.terms.vocabulary[columns], list(filter_words))]
+        mif = mif[columns]
+        order = top_k(mif, k)
+        return FeatureList(
+            used_features=tuple(self.terms.vocabulary[columns[order]]),
+            scores=tuple(mif[order]),
+            type="global_explanation",
+            subtype="token_information",
+            method="mutual_information",
+            callargs=callargs,
+        )
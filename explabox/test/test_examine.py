@@ -12,13 +12,31 @@
 # details.
 
 import copy
+import json
 
 import genbase_test_helpers
+import numpy as np
+import pandas as pd
 import pytest
 
-from explabox.digestibles import Performance, WronglyClassified
+from explabox.digestibles import Calibration, Comparison, LabelIssues, Performance, Slices, WronglyClassified
 from explabox.examine import Examiner
+from explabox.examine.label_issues import find_label_issues
+from explabox.examine.metrics import (
+    ConfusionMatrix,
+    average_metrics,
+    bootstrap_metrics,
+    calibration,
+    confusion_matrix,
+    disagreement,
+    encode_labels,
+    label_metrics,
+    mcnemar,
+    proportional_allocation,
+)
+from explabox.examine.slices import candidate_slices, length_buckets, rank_slices, term_matrix
 from explabox.ingestibles import Ingestible
+from explabox.utils import MultipleReturn
 
 DATA, MODEL = genbase_test_helpers.TEST_ENVIRONMENT, genbase_test_helpers.TEST_MODEL
 INGESTIBLE = Ingestible(data=DATA, model=MODEL)
@@ -112,3 +130,488 @@ def test_wrongly_classified_valid_return():  # TODO: split
     assert wrongly_classified.type == "wrongly_classified"
     assert isinstance(wrongly_classified.content, dict)
     assert "wrongly_classified" in wrongly_classified.content
+
+
+def test_performance_content_memoized():
+    """Test: Performance content is computed once and can be rendered repeatedly."""
+    performance = Examiner(ingestibles=INGESTIBLE).performance()
+    assert performance.content is performance.content
+    assert isinstance(performance.raw_html, str)
+    assert isinstance(performance.raw_html, str)
+
+
+def test_wrongly_classified_memoized():
+    """Test: Wrongly classified instances are resolved once."""
+    wrongly_classified = Examiner(ingestibles=INGESTIBLE).wrongly_classified()
+    assert wrongly_classified.wrongly_classified is wrongly_classified.wrongly_classified
+
+
+def test_confusion_matrix_skips_unknown():
+    """Test: Confusion matrix counts (ground-truth, predicted) pairs and skips unknown (-1) codes."""
+    y_true = encode_labels([frozenset({"a"}), frozenset({"b"}), frozenset({"b"}), frozenset()], {"a": 0, "b": 1})
+    assert y_true.tolist() == [0, 1, 1, -1]
+    assert confusion_matrix(y_true, np.array([0, 0, 1, 1]), 2).tolist() == [[1, 0], [1, 1]]
+
+
+def test_label_metrics_batched():
+    """Test: Per-label metrics support a stack of confusion matrices and default to 0.0 if undefined."""
+    cm = np.array([[[5, 1], [2, 2]], [[0, 0], [3, 7]]])
+    metrics = label_metrics(cm)
+    assert metrics["precision"].shape == (2, 2)
+    assert metrics["precision"][0].tolist() == pytest.approx([5 / 7, 2 / 3])
+    assert metrics["recall"][1].tolist() == [0.0, 0.7]
+    assert average_metrics(cm)["accuracy"].tolist() == pytest.approx([0.7, 0.7])
+
+
+def test_performance_matches_label_metrics():
+    """Test: Metrics derived from the confusion matrix are equal to the per-label metrics from instancelib."""
+    from instancelib.analysis.base import get_keys
+    from instancelib.analysis.base import label_metrics as il_label_metrics
+
+    examiner = Examiner(ingestibles=INGESTIBLE)
+    performance = examiner.performance(split="test")
+    for label in examiner.labelset:
+        expected = il_label_metrics(examiner.labels, examiner.predictions["test"], get_keys(DATA["test"]), label)
+        for metric in ["accuracy", "precision", "recall", "f1", "wss"]:
+            assert performance.metrics[label][metric] == pytest.approx(getattr(expected, metric))
+        pd.testing.assert_frame_equal(performance.metrics[label]["confusion_matrix"], expected.confusion_matrix)
+
+
+def test_performance_averages():
+    """Test: Performance content includes accuracy and averaged metrics."""
+    performance = Examiner(ingestibles=INGESTIBLE).performance()
+    assert 0.0 <= performance.content["accuracy"] <= 1.0
+    assert set(performance.content["averages"]) == {"macro", "micro", "weighted"}
+    assert performance.content["averages"]["micro"]["f1"] == pytest.approx(performance.content["accuracy"])
+
+
+@pytest.mark.parametrize("split", ["all", ["test"], ["test", "test"]])
+def test_performance_multiple_splits(split):
+    """Test: Multiple splits (or 'all') return a performance for each split."""
+    examiner = Examiner(ingestibles=INGESTIBLE)
+    performance = examiner.performance(split=split)
+    assert isinstance(performance, MultipleReturn)
+    assert all(isinstance(p, Performance) for p in performance)
+    assert len(performance) == (len(examiner.splits) if split == "all" else len(split))
+
+
+def test_bootstrap_metrics_reproducible(monkeypatch):
+    """Test: Bootstrap confidence intervals are reproducible with a seed, independent of the number of processes."""
+    import explabox.examine.metrics
+
+    chunks = []
+
+    class RecordingExecutor(explabox.examine.metrics.ProcessPoolExecutor):
+        def map(self, fn, *iterables, **kwargs):
+            iterables = [list(iterable) for iterable in iterables]
+            chunks.extend(iterables[0])
+            return super().map(fn, *iterables, **kwargs)
+
+    monkeypatch.setattr(explabox.examine.metrics, "ProcessPoolExecutor", RecordingExecutor)
+    cm = np.array([[50, 10], [5, 35]])
+    per_label, averages = bootstrap_metrics(cm, n_resamples=200, seed=0)
+    assert not chunks
+    per_label_chunked, averages_chunked = bootstrap_metrics(cm, n_resamples=200, n_jobs=2, seed=0)
+    assert len(chunks) >= 2 and sum(sum(chunk[2]) for chunk in chunks) == 200
+    per_label_small, _ = bootstrap_metrics(cm, n_resamples=200, chunk_size=50, seed=0)
+    assert per_label["f1"].shape == (2, 2)
+    assert np.allclose(averages["macro_f1"], averages_chunked["macro_f1"])
+    assert np.allclose(per_label["recall"], per_label_chunked["recall"])
+    assert np.allclose(per_label["precision"], per_label_small["precision"])
+    assert averages["accuracy"][0] <= 0.85 <= averages["accuracy"][1]
+
+
+@pytest.mark.parametrize("alpha", [0.0, 1.0, -0.1])
+def test_bootstrap_metrics_invalid_alpha(alpha):
+    """Test: Alpha should be between 0 and 1."""
+    with pytest.raises(ValueError):
+        bootstrap_metrics(np.eye(2, dtype=int), alpha=alpha)
+
+
+def test_performance_confidence_intervals():
+    """Test: Confidence intervals are included in the performance content and contain the point estimates."""
+    performance = Examiner(ingestibles=INGESTIBLE).performance(confidence_intervals=True, n_resamples=100, seed=0)
+    intervals = performance.content["confidence_intervals"]
+    assert intervals["n_resamples"] == 100
+    for label in performance.labels:
+        lower, upper = intervals["label_metrics"][label]["precision"]
+        assert lower <= performance.metrics[label]["precision"] <= upper
+    assert isinstance(performance.raw_html, str)
+
+
+def test_length_buckets():
+    """Test: Length buckets cover all instances and collapse to a single bucket for constant lengths."""
+    codes, names = length_buckets(np.arange(100), n_buckets=4)
+    assert len(names) == 4
+    assert np.bincount(codes).tolist() == [25, 25, 25, 25]
+    codes, names = length_buckets(np.full(10, 3))
+    assert codes.tolist() == [0] * 10 and names == ["3"]
+
+
+def test_rank_slices_finds_worse_slice():
+    """Test: A slice containing all errors is ranked as significant, others are not."""
+    texts = ["bad token"] * 30 + ["good token"] * 70
+    errors = np.array([True] * 20 + [False] * 80)
+    X, terms, lengths = term_matrix(texts, tokenizer=str.split)
+    S, names = candidate_slices(terms=(X, terms), lengths=lengths, min_size=5)
+    ranking = rank_slices(S, errors)
+    significant = {names[i] for i in np.flatnonzero(ranking["significant"])}
+    assert significant == {("term", "bad")}
+    assert ranking["size"][names.index(("term", "token"))] == 100
+
+
+def test_slices_valid_return():
+    """Test: Slices digestible with metadata, renderable."""
+    examiner = Examiner(ingestibles=INGESTIBLE)
+    n = len(DATA["test"])
+    slices = examiner.slices(metadata={"half": [i < n // 2 for i in range(n)]}, min_size=5)
+    assert isinstance(slices, Slices)
+    assert slices.type == "slices"
+    assert slices.n_instances == n
+    assert all(s["accuracy"] < slices.accuracy for s in slices.content["slices"])
+    assert isinstance(slices.raw_html, str)
+
+
+def test_slices_excluded():
+    """Test: Instances without exactly one ground-truth label are left out of the slices, with a warning."""
+    data = copy.deepcopy(DATA)
+    examiner = Examiner(data=data, model=MODEL)
+    for key in list(data["test"].key_list)[:3]:
+        examiner.labels.set_labels(key, *examiner.labelset)
+    n = len(data["test"])
+    with pytest.warns(UserWarning, match="excluded"):
+        slices = examiner.slices(metadata={"half": [i < n // 2 for i in range(n)]}, min_size=5)
+        performance = examiner.performance(split="test")
+    assert slices.n_excluded == slices.content["n_excluded"] == performance.n_excluded == 3
+    assert slices.n_instances == n - 3
+    assert slices.accuracy == pytest.approx(performance.content["accuracy"])
+
+
+def test_slices_invalid_metadata():
+    """Test: Metadata columns of the wrong length throw a ValueError."""
+    with pytest.raises(ValueError):
+        Examiner(ingestibles=INGESTIBLE).slices(metadata={"source": ["web"]})
+
+
+def test_calibration_perfect():
+    """Test: Perfectly calibrated probabilities have zero calibration error."""
+    proba = np.array([[1.0, 0.0], [0.0, 1.0], [0.25, 0.75], [0.25, 0.75], [0.25, 0.75], [0.25, 0.75]])
+    y_true = np.array([0, 1, 0, 1, 1, 1])
+    res = calibration(proba, y_true, n_bins=4)
+    assert res["labels"]["ece"].tolist() == pytest.approx([0.0, 0.0])
+    assert res["labels"]["count"].sum(axis=1).tolist() == [6, 6]
+    assert res["top_label"]["ece"] == pytest.approx(0.0)
+    assert res["brier"] == pytest.approx((2 * 0.75**2 + 3 * 2 * 0.25**2) / 6)
+
+
+def test_calibration_valid_return():
+    """Test: Calibration digestible, with probabilities predicted once when they are first needed."""
+    examiner = Examiner(ingestibles=INGESTIBLE)
+    performance = examiner.performance()
+    assert examiner._proba_matrix is None
+    calibration = examiner.calibration(n_bins=5)
+    n_rows = len(examiner._proba_matrix)
+    examiner.calibration(n_bins=5)
+    assert len(examiner._proba_matrix) == n_rows
+    assert isinstance(calibration, Calibration)
+    assert calibration.type == "calibration"
+    assert set(calibration.ece) == set(performance.labels)
+    assert 0.0 <= calibration.brier <= 2.0
+    assert isinstance(calibration.raw_html, str)
+
+
+def test_performance_hard_labels_from_predict():
+    """Test: Hard labels are those of `model.predict()`, even if they are not the most probable labels."""
+
+    class FirstLabelClassifier(type(MODEL)):
+        def _pred_batch(self, batch):
+            keys, proba = self._pred_proba_batch_raw(batch)
+            return keys, self.encoder.decode_matrix(np.zeros(len(keys), dtype=int))
+
+    model = FirstLabelClassifier(MODEL.predict_function, MODEL.encoder.labelset)
+    performance = Examiner(data=DATA, model=model).performance(split="test")
+    assert performance.confusion_matrix[:, 1:].sum() == 0 and performance.confusion_matrix[:, 0].sum() > 0
+
+
+def test_calibration_invalid_bins():
+    """Test: n_bins should be >= 1."""
+    with pytest.raises(ValueError):
+        Examiner(ingestibles=INGESTIBLE).calibration(n_bins=0)
+
+
+def test_confusion_matrix_merge_serialize():
+    """Test: Confusion matrices with different labels merge by label, and survive a JSON round trip."""
+    a = ConfusionMatrix(["a", "b"]).update_labels(["a", "b", "b", "c"], ["a", "a", "b", "a"])
+    b = ConfusionMatrix(["b", "c"]).update_labels([frozenset({"c"})], ["b"])
+    assert a.n == 3 and a.n_skipped == 1
+    merged = ConfusionMatrix.from_dict(json.loads(json.dumps(a.to_dict()))) + b
+    assert merged.labels == ["a", "b", "c"]
+    assert merged.matrix.tolist() == [[1, 0, 0], [1, 1, 0], [0, 1, 0]]
+    assert merged.n_skipped == 1
+    assert sum([a, b]) == merged
+
+
+def test_confusion_matrix_invalid_shape():
+    """Test: Matrix shape should match the number of labels."""
+    with pytest.raises(ValueError):
+        ConfusionMatrix(["a", "b"], matrix=np.zeros((3, 3)))
+
+
+@pytest.mark.parametrize("batched", [False, True])
+@pytest.mark.parametrize("as_list", [False, True])
+def test_performance_stream(batched, as_list):
+    """Test: Performance on a stream (or list) of (text, label) pairs equals performance on the split."""
+    examiner = Examiner(ingestibles=INGESTIBLE)
+    pairs = [(instance.data, next(iter(examiner.labels.get_labels(key)))) for key, instance in DATA["test"].items()]
+    stream = (pairs[i : i + 30] for i in range(0, len(pairs), 30)) if batched else iter(pairs)
+    stream = list(stream) if as_list else stream
+    performance = examiner.performance(split=stream, batch_size=7)
+    assert isinstance(performance, Performance)
+    expected = examiner.performance(split="test")
+    for label in expected.labels:
+        assert performance.metrics[label]["f1"] == pytest.approx(expected.metrics[label]["f1"])
+
+
+def test_performance_excluded():
+    """Test: Instances without exactly one ground-truth label are reported as excluded, with a warning."""
+    examiner = Examiner(ingestibles=INGESTIBLE)
+    pairs = [(instance.data, next(iter(examiner.labels.get_labels(key)))) for key, instance in DATA["test"].items()]
+    with pytest.warns(UserWarning, match="excluded"):
+        performance = examiner.performance(split=iter([*pairs, (pairs[0][0], frozenset(examiner.labelset))]))
+    assert performance.n_excluded == performance.content["n_excluded"] == 1
+    assert examiner.performance(split="test").n_excluded == 0
+
+
+def test_performance_confusion_matrix_shards():
+    """Test: Performance of merged shards equals performance on all data."""
+    examiner = Examiner(ingestibles=INGESTIBLE)
+    pairs = [(instance.data, next(iter(examiner.labels.get_labels(key)))) for key, instance in DATA["test"].items()]
+    merged = examiner.confusion_matrix(pairs[:40]) + examiner.confusion_matrix(pairs[40:])
+    assert merged.n == len(pairs)
+    assert examiner.performance(split=merged).content["accuracy"] == pytest.approx(
+        examiner.performance(split="test").content["accuracy"]
+    )
+
+
+def test_mcnemar_disagreement():
+    """Test: Pairwise disagreement and McNemar test are symmetric, with p=1 for identical models."""
+    y_preds = np.array([[0, 1, 1, 0], [0, 1, 1, 0], [1, 1, 0, 0]])
+    assert disagreement(y_preds).tolist() == [[0.0, 0.0, 0.5], [0.0, 0.0, 0.5], [0.5, 0.5, 0.0]]
+    only_correct, p_value = mcnemar(y_preds == np.array([0, 1, 1, 0]))
+    assert only_correct[0, 2] == 2 and only_correct[2, 0] == 0
+    assert p_value[0, 1] == 1.0
+    assert np.allclose(p_value, p_value.T)
+
+
+def test_compare_valid_return():
+    """Test: Comparison of the own model and a constant model."""
+    constant = genbase_test_helpers.DeterministicTextClassifier.from_callable(
+        lambda _: np.array([0.0, 1.0]), ["punctuation", "no_punctuation"]
+    )
+    comparison = Examiner(ingestibles=INGESTIBLE).compare({"model": MODEL, "constant": constant})
+    assert isinstance(comparison, Comparison)
+    assert comparison.type == "model_comparison"
+    assert comparison.models == ["model", "constant"]
+    assert comparison.metrics[0]["accuracy"] != comparison.metrics[1]["accuracy"]
+    assert comparison.disagreement[0, 0] == 0.0
+    assert isinstance(comparison.raw_html, str)
+
+
+def test_compare_single_model():
+    """Test: At least two models are needed for a comparison."""
+    with pytest.raises(ValueError):
+        Examiner(ingestibles=INGESTIBLE).compare([MODEL])
+
+
+@pytest.mark.parametrize("sort_by", ["confidence", "margin"])
+def test_wrongly_classified_ranked(sort_by):
+    """Test: Wrongly classified instances are ranked by score (highest first) and limited to the top-k."""
+    wrongly_classified = Examiner(ingestibles=INGESTIBLE).wrongly_classified(sort_by=sort_by, top_k=3)
+    for cell in wrongly_classified.wrongly_classified:
+        assert len(cell["instances"]) == min(3, cell["n"])
+        assert cell[sort_by] == sorted(cell[sort_by], reverse=True)
+
+
+def test_wrongly_classified_pages():
+    """Test: Pages partition the wrongly classified instances of each cell."""
+    wrongly_classified = Examiner(ingestibles=INGESTIBLE).wrongly_classified(page_size=1)
+    n_total = sum(cell["n"] for cell in wrongly_classified.wrongly_classified)
+    pages = [wrongly_classified.page(i) for i in range(wrongly_classified.n_pages)]
+    assert sum(len(cell["instances"]) for page in pages for cell in page.wrongly_classified) == n_total
+    with pytest.raises(ValueError):
+        wrongly_classified.page(wrongly_classified.n_pages)
+
+
+def test_wrongly_classified_order():
+    """Test: Unranked cells are ordered by (ground-truth, predicted) label and their instances by key."""
+    table = {("a", "b"): frozenset([3, 1, 2]), ("a", "a"): frozenset([0]), ("b", "a"): frozenset([5, 4])}
+    wrongly_classified = WronglyClassified({k: k for k in range(6)}, contingency_table=table, page_size=2)
+    cells = wrongly_classified.wrongly_classified
+    assert [(c["ground_truth"], c["predicted"], c["instances"]) for c in cells] == [
+        ("a", "b", [1, 2]),
+        ("b", "a", [4, 5]),
+    ]
+    assert wrongly_classified.page(1).wrongly_classified[0]["instances"] == [3]
+
+
+def test_wrongly_classified_invalid_sort_by():
+    """Test: Unknown sort_by throws a ValueError."""
+    with pytest.raises(ValueError):
+        Examiner(ingestibles=INGESTIBLE).wrongly_classified(sort_by="loss")
+
+
+def test_incremental_growing_split():
+    """Test: When a split grows, only new instances are predicted and the metrics equal those of a fresh Examiner."""
+    from instancelib import TextEnvironment
+
+    env = TextEnvironment.from_data(
+        target_labels={"punctuation", "no_punctuation"},
+        indices=list(range(len(genbase_test_helpers.TEST_INSTANCES))),
+        data=genbase_test_helpers.TEST_INSTANCES,
+        ground_truth=genbase_test_helpers.TEST_LABELS,
+        vectors=None,
+    )
+    split = env.create_bucket(list(range(60)))
+    env.set_named_provider("test", split)
+
+    n_predicted = []
+
+    def predict(instances):
+        n_predicted.append(len(instances))
+        return np.vstack([genbase_test_helpers.predict_fn(instance) for instance in instances])
+
+    model = genbase_test_helpers.DeterministicTextClassifier.from_batched_callable(
+        predict, ["punctuation", "no_punctuation"]
+    )
+    examiner = Examiner(data=env, model=model)
+    _ = examiner.performance(split="test")
+    assert sum(n_predicted) == 60
+
+    for key in range(60, 100):
+        split.add(env.dataset[key])
+    performance = examiner.performance(split="test")
+    assert sum(n_predicted) == 100
+    assert len(examiner.predictions["test"]) == 100
+
+    expected = Examiner(data=env, model=MODEL).performance(split="test")
+    assert performance.content["confusion_matrix"] == expected.content["confusion_matrix"]
+
+
+def test_incremental_changed_split(monkeypatch):
+    """Test: Unchanged instances are not hashed again, and probabilities of replaced instances do not pile up."""
+    from instancelib import TextEnvironment
+    from instancelib.instances.text import MemoryTextInstance
+
+    import explabox.examine.examiner as examiner_module
+
+    env = TextEnvironment.from_data(
+        target_labels={"punctuation", "no_punctuation"},
+        indices=list(range(len(genbase_test_helpers.TEST_INSTANCES))),
+        data=genbase_test_helpers.TEST_INSTANCES,
+        ground_truth=genbase_test_helpers.TEST_LABELS,
+        vectors=None,
+    )
+    env.set_named_provider("test", env.create_bucket(list(range(60))))
+    examiner = Examiner(data=env, model=MODEL)
+    _ = examiner.calibration(split="test")
+    assert len(examiner._proba_matrix) == 60
+
+    n_hashed = []
+    monkeypatch.setattr(examiner_module, "_hash", lambda data: n_hashed.append(data) or hash(data))
+    _ = examiner.calibration(split="test")
+    assert not n_hashed
+
+    for i in range(3):
+        for key in range(40):
+            env.dataset[key] = MemoryTextInstance(key, f"{env.dataset[key].data} {i}.", None)
+        calibration = examiner.calibration(split="test")
+    assert len(n_hashed) == 3 * 40
+    assert len(examiner._proba_matrix) <= 2 * 60
+    expected = Examiner(data=env, model=MODEL).calibration(split="test")
+    assert calibration.content == expected.content
+
+
+def test_stratified_bootstrap_metrics():
+    """Test: A single stratum with weight 1 gives the same intervals as the unstratified bootstrap."""
+    cm = np.array([[50, 10], [5, 35]])
+    per_label, averages = bootstrap_metrics(cm, n_resamples=100, seed=0)
+    per_label_strata, averages_strata = bootstrap_metrics(cm[np.newaxis], n_resamples=100, seed=0, weights=[1.0])
+    assert np.allclose(averages["macro_f1"], averages_strata["macro_f1"])
+    assert np.allclose(per_label["precision"], per_label_strata["precision"])
+    with pytest.raises(ValueError):
+        bootstrap_metrics(np.stack([cm, cm]), weights=[1.0])
+
+
+def test_proportional_allocation():
+    """Test: Sample sizes are proportional to the stratum sizes, at least the minimum and at most the stratum size."""
+    assert proportional_allocation(np.array([800, 150, 49, 1]), 100).tolist() == [80, 15, 4, 1]
+    assert proportional_allocation(np.array([990, 10]), 10).tolist() == [8, 2]
+    assert proportional_allocation(np.array([3, 3, 3]), 7).tolist() == [3, 2, 2]
+    assert proportional_allocation(np.array([1, 1, 40]), 3).tolist() == [1, 1, 2]
+    for n in range(4, 43):
+        assert proportional_allocation(np.array([1, 1, 40]), n).sum() == min(n, 42)
+
+
+def test_performance_approximate():
+    """Test: Approximate performance spends fewer predictions than the split size and reports its sample."""
+    examiner = Examiner(ingestibles=INGESTIBLE)
+    performance = examiner.performance(approximate=True, tolerance=0.5, sample_size=20, n_resamples=100, seed=0)
+    approximation = performance.approximation
+    assert approximation["converged"] and approximation["half_width"] <= 0.5
+    assert approximation["n_predictions"] == approximation["n_sampled"] < approximation["n_instances"]
+    assert performance.confusion_matrix.sum() == pytest.approx(performance.confusion_matrix.sum().round())
+    assert "approximation" in performance.content and "confidence_intervals" in performance.content
+    assert isinstance(performance.raw_html, str)
+
+
+def test_performance_approximate_budget():
+    """Test: A sample size budget that does not divide over the strata is spent exactly, and then the sampling stops."""
+    examiner = Examiner(ingestibles=INGESTIBLE)
+    performance = examiner.performance(
+        approximate=True, tolerance=1e-9, sample_size=10, max_sample_size=37, n_resamples=50, seed=0
+    )
+    assert not performance.approximation["converged"]
+    assert performance.approximation["n_sampled"] == 37
+
+
+def test_performance_approximate_exhaustive():
+    """Test: With an unreachable tolerance the sample grows to the whole split and equals the exact performance."""
+    examiner = Examiner(ingestibles=INGESTIBLE)
+    performance = examiner.performance(approximate=True, tolerance=1e-9, sample_size=10, n_resamples=50, seed=0)
+    assert performance.approximation["n_sampled"] == performance.approximation["n_instances"]
+    assert not performance.approximation["converged"]
+    assert np.allclose(performance.confusion_matrix, examiner.performance().confusion_matrix)
+
+
+@pytest.mark.parametrize("kwargs", [{"tolerance": 0.0}, {"sample_size": 0}, {"growth": 1.0}])
+def test_performance_approximate_invalid(kwargs):
+    """Test: Invalid approximation arguments throw a ValueError."""
+    with pytest.raises(ValueError):
+        Examiner(ingestibles=INGESTIBLE).performance(approximate=True, **kwargs)
+
+
+@pytest.mark.parametrize("chunk_size", [None, 7])
+def test_find_label_issues(chunk_size):
+    """Test: Flipped labels of confidently predicted instances are found as label issues, with the original label."""
+    rng = np.random.default_rng(0)
+    y_true = rng.integers(0, 3, size=300)
+    proba = np.full((300, 3), 0.1)
+    proba[np.arange(300), y_true] = 0.8
+    given = y_true.copy()
+    given[:20] = (y_true[:20] + 1) % 3
+    issues = find_label_issues(proba, given, chunk_size=chunk_size)
+    assert sorted(issues["issues"].tolist()) == list(range(20))
+    assert np.array_equal(issues["suggested"], y_true[issues["issues"]])
+    assert issues["n_estimated"] == 20
+    assert issues["joint"].sum() == pytest.approx(1.0)
+
+
+def test_label_issues():
+    """Test: Label issues are ranked by increasing self-confidence and show at most n instances."""
+    issues = Examiner(ingestibles=INGESTIBLE).label_issues(split="test", n=3)
+    assert isinstance(issues, LabelIssues)
+    assert np.all(np.diff(issues.self_confidence) >= 0)
+    content = issues.content["label_issues"]
+    assert len(content["instances"]) == min(3, len(issues.keys))
+    assert all(given != suggested for given, suggested in zip(content["given"], content["suggested"]))
+    assert isinstance(issues.raw_html, str)
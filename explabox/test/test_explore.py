@@ -199,3 +199,13 @@ def test_instances_filter_args_type():
     with pytest.raises(ValueError):
         explorer = Explorer(ingestibles=INGESTIBLE)
         explorer.instances().filter(None)
+
+
+def test_instances_label_codes():
+    """Test: Labels are stored as integer codes that map back to the labels."""
+    explorer = Explorer(ingestibles=INGESTIBLE)
+    dataset = explorer.instances()
+    assert dataset.label_codes.dtype.kind == "i"
+    assert len(dataset.label_codes) == len(dataset)
+    assert [dataset.label_names[code] for code in dataset.label_codes] == dataset.labels
+    assert dataset.labels is dataset.labels
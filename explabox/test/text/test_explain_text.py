@@ -13,10 +13,13 @@
 
 """Tests for the `explabox.explain.text` module."""
 
+import json
+
 import genbase_test_helpers
+import numpy as np
 import pytest
 
-from explabox.explain import Explainer
+from explabox.explain import Explainer, ExplanationCache
 from explabox.explain.text import FeatureList, Instances
 from explabox.ingestibles import Ingestible
 from explabox.utils import MultipleReturn
@@ -182,3 +185,831 @@ def test_prototypes_criticisms_valid_return(n_prototypes, n_criticisms):  # TODO
 
 
 # TODO: labelwise
+
+
+def _counting_model(calls):
+    def predict(instances):
+        calls.append(len(instances))
+        return np.vstack([genbase_test_helpers.predict_fn(instance) for instance in instances])
+
+    return genbase_test_helpers.DeterministicTextClassifier.from_batched_callable(
+        predict, ["punctuation", "no_punctuation"]
+    )
+
+
+def test_explain_predictions_pooled():
+    """Test: Explaining many samples gives the same explanations as one by one, in fewer model calls."""
+    calls = []
+    explainer = Explainer(data=genbase_test_helpers.TEST_ENVIRONMENT, model=_counting_model(calls))
+    samples = list(range(10)) + ["a longer text, with punctuation!"]
+    explanations = explainer.explain_predictions(samples, methods=["lime"], n_concurrent=11)
+    assert list(explanations.keys()) == samples
+    assert all(isinstance(explanation, MultipleReturn) for explanation in explanations.values())
+    assert len(calls) < len(samples)
+
+    single = explainer.explain_prediction(samples[-1], methods=["lime"])
+    assert explanations[samples[-1]][0].content["scores"] == single[0].content["scores"]
+
+
+def test_explain_predictions_path(tmp_path):
+    """Test: Explanations are streamed to a JSON lines file, one line per sample."""
+    explainer = Explainer(ingestibles=INGESTIBLE)
+    path = explainer.explain_predictions(list(range(5)), methods=["lime"], path=str(tmp_path / "explanations.jsonl"))
+    with open(path) as f:
+        lines = [json.loads(line) for line in f]
+    assert sorted(line["sample"] for line in lines) == list(range(5))
+    assert all(len(line["explanations"]) == 1 for line in lines)
+
+
+def test_pooled_classifier_rows():
+    """Test: Concurrent workers of a pooled classifier each get the predictions of their own instances."""
+    from concurrent.futures import ThreadPoolExecutor
+
+    from text_explainability import from_string
+
+    from explabox.explain.text.pooling import PooledClassifier
+
+    calls = []
+    model = PooledClassifier(_counting_model(calls))
+    texts = [[from_string(f"{i}{'!' * (i % 2)}") for _ in range(i + 1)] for i in range(8)]
+
+    def predict(instances):
+        with model.worker():
+            return next(model.predict_proba_raw(instances))[1]
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(predict, texts))
+    for instances, proba in zip(texts, results):
+        assert np.allclose(proba, np.vstack([genbase_test_helpers.predict_fn(i.data) for i in instances]))
+    assert model.n_calls == len(calls) <= len(texts)
+
+
+def test_explain_prediction_shared_neighbourhood():
+    """Test: With a shared neighbourhood LIME and KernelSHAP predict one neighbourhood, and LIME is unaffected."""
+    calls = []
+    explainer = Explainer(data=genbase_test_helpers.TEST_ENVIRONMENT, model=_counting_model(calls))
+    sample = "a longer text, with punctuation!"
+    shared = explainer.explain_prediction(sample, methods=["lime", "kernel_shap"], shared_neighbourhood=True)
+    assert len(calls) == 1
+    assert len(shared) == 2
+
+    separate = explainer.explain_prediction(sample, methods=["lime", "kernel_shap"])
+    assert len(calls) == 3
+    assert shared[0].content["scores"] == separate[0].content["scores"]
+
+
+def test_shared_neighbourhood_kernel_shap():
+    """Test: KernelSHAP on a shared neighbourhood equals its own design if the samples cover all perturbations."""
+    explainer = Explainer(ingestibles=INGESTIBLE)
+    sample = "good bad movie!"
+    shared = explainer.explain_prediction(sample, methods=["lime", "kernel_shap"], shared_neighbourhood=True)
+    own = explainer.explain_prediction(sample, methods=["kernel_shap"])
+    for label, scores in own[0].content["scores"].items():
+        assert [s for _, s in shared[1].content["scores"][label]] == pytest.approx([s for _, s in scores])
+
+
+def test_shared_neighbourhood_settings():
+    """Test: Methods without the background instance get the design without it, in the same number of samples."""
+    from explabox.explain.text.neighbourhood import SharedNeighbourhood
+
+    class Method:
+        def augment_sample(self, sample, model, n_samples=50, seed=None, **kwargs):
+            n = n_samples + 2  # with the original and the background instance
+            return "provider", 0, np.arange(n), np.arange(n), 0
+
+    neighbourhood = SharedNeighbourhood()
+    first, second = neighbourhood.share(Method()), neighbourhood.share(Method())
+    assert first.augment_sample("sample", None, n_samples=5)[2].tolist() == list(range(6))
+    assert second.augment_sample("sample", None, n_samples=5, add_background_instance=True)[3].tolist() == list(
+        range(7)
+    )
+    assert neighbourhood.n_generated == 1
+    with pytest.raises(ValueError):
+        second.augment_sample("sample", None, n_samples=10)
+    with pytest.raises(ValueError):
+        second.augment_sample("sample", None, n_samples=5, seed=1)
+
+
+def test_explain_prediction_adaptive():
+    """Test: Adaptive LIME stops growing the number of samples once the attributions converge."""
+    calls = []
+    explainer = Explainer(data=genbase_test_helpers.TEST_ENVIRONMENT, model=_counting_model(calls))
+    res = explainer.explain_prediction("short!", methods="lime", adaptive=True, n_samples=50, max_samples=3200)
+    assert res[0].callargs["n_samples"] < 3200
+    assert sum(calls) <= res[0].callargs["n_samples"] + 1
+
+
+def test_growing_neighbourhood():
+    """Test: A growing neighbourhood only draws and predicts the additional samples, keeping the earlier ones."""
+    from text_explainability import from_string
+    from text_explainability.local_explanation import LIME
+
+    from explabox.explain.text.perturbation import GrowingNeighbourhood, perturb_with_masks
+
+    calls = []
+    model, growing = _counting_model(calls), GrowingNeighbourhood()
+    sample = "a somewhat longer text, with more tokens to perturb and punctuation!"
+    _, _, first, y_first, _ = perturb_with_masks(LIME(seed=0), growing=growing).augment_sample(
+        from_string(sample), model, n_samples=50
+    )
+    _, _, grown, y_grown, _ = perturb_with_masks(LIME(seed=0), growing=growing).augment_sample(
+        from_string(sample), model, n_samples=100
+    )
+    assert len(first) < len(grown) <= 101
+    assert np.array_equal(grown[: len(first)], first) and np.allclose(y_grown[: len(first)], y_first)
+    assert sum(calls) == growing.n_predicted == len(grown)
+    assert len(np.unique(grown[1:], axis=0)) == len(grown) - 1
+
+    _, _, fresh, _, _ = perturb_with_masks(LIME(seed=0)).augment_sample(from_string(sample), model, n_samples=50)
+    assert np.array_equal(fresh, first)
+
+
+def test_adaptive_converged():
+    """Test: Attributions converge if the top-k ranking is equal and the scores are within tolerance."""
+    from explabox.explain.text.adaptive import converged
+
+    previous = [{("a", 0): 0.5, ("b", 0): -0.3, ("a", 1): 0.1}]
+    assert converged(previous, [{("a", 0): 0.51, ("b", 0): -0.3, ("a", 1): 0.1}], top_k=2, tolerance=0.05)
+    assert not converged(previous, [{("a", 0): 0.6, ("b", 0): -0.3, ("a", 1): 0.1}], top_k=2, tolerance=0.05)
+    assert not converged(previous, [{("a", 0): 0.2, ("b", 0): -0.3, ("a", 1): 0.1}], top_k=2, tolerance=1.0)
+
+
+@pytest.mark.parametrize("min_samples,max_samples,growth", [(0, 10, 2.0), (20, 10, 2.0), (10, 20, 1.0)])
+def test_explain_adaptive_invalid(min_samples, max_samples, growth):
+    """Test: Invalid number of samples or growth raises a ValueError."""
+    from explabox.explain.text.adaptive import explain_adaptive
+
+    with pytest.raises(ValueError):
+        explain_adaptive(lambda n: [], min_samples=min_samples, max_samples=max_samples, growth=growth)
+
+
+def test_explanation_cache_hit(tmp_path):
+    """Test: A cached explanation is returned without calling the model again, also by another explainer."""
+    calls = []
+    model = _counting_model(calls)
+    explainer = Explainer(data=genbase_test_helpers.TEST_ENVIRONMENT, model=model, cache=str(tmp_path))
+    fingerprint = explainer.cache.fingerprint(model)
+    first = explainer.explain_prediction("a longer text, with punctuation!", methods=["lime"])
+    n_calls = len(calls)
+
+    other = Explainer(
+        data=genbase_test_helpers.TEST_ENVIRONMENT,
+        model=model,
+        cache=ExplanationCache(tmp_path, model_fingerprint=fingerprint),
+    )
+    second = other.explain_prediction("a longer text, with punctuation!", methods=["lime"])
+    assert len(calls) == n_calls
+    assert other.cache.hits == 1
+    assert first[0].content["scores"] == second[0].content["scores"]
+
+    other.explain_prediction("a longer text, with punctuation!", methods=["lime"], seed=1)
+    assert len(calls) > n_calls
+    assert other.cache.misses == 1
+
+
+def test_explanation_cache_other_process(tmp_path):
+    """Test: An explanation cached by another process (with another hash seed) is found for an equal model.
+
+    The labels are given, as the order of the labels of the data (a set) differs between hash seeds.
+    """
+    import os
+    import subprocess
+    import sys
+
+    from sklearn.linear_model import LogisticRegression
+
+    script = (
+        "from sklearn.linear_model import LogisticRegression\n"
+        "from test_explain_text import _sklearn_explainer\n"
+        "from explabox.explain import ExplanationCache\n"
+        "explainer = _sklearn_explainer(LogisticRegression())\n"
+        f"explainer.cache = ExplanationCache({str(tmp_path)!r})\n"
+        "explainer.explain_prediction('the movie was good', methods=['lime'], labels=['neg', 'pos'])\n"
+        "print(explainer.cache.fingerprint(explainer.model))\n"
+    )
+    test_dir = os.path.dirname(os.path.abspath(__file__))
+    path = os.pathsep.join([test_dir, os.path.dirname(test_dir), os.environ.get("PYTHONPATH", "")])
+    result = subprocess.run(
+        [sys.executable, "-c", script],
+        env={**os.environ, "PYTHONPATH": path, "PYTHONHASHSEED": "1"},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    explainer = _sklearn_explainer(LogisticRegression())
+    explainer.cache = ExplanationCache(tmp_path)
+    assert explainer.cache.fingerprint(explainer.model) == result.stdout.split()[-1]
+    explainer.explain_prediction("the movie was good", methods=["lime"], labels=["neg", "pos"])
+    assert (explainer.cache.hits, explainer.cache.misses) == (1, 0)
+    assert explainer.cache.fingerprint(_sklearn_explainer(LogisticRegression(C=0.1)).model) != result.stdout.split()[-1]
+
+
+def test_explanation_cache_splits(tmp_path):
+    """Test: Explanations of splits are cached per method, split and arguments."""
+    explainer = Explainer(data=genbase_test_helpers.TEST_ENVIRONMENT, model=genbase_test_helpers.TEST_MODEL)
+    explainer.cache = ExplanationCache(tmp_path)
+    explainer.token_frequency(k=10)
+    explainer.token_frequency(k=10)
+    explainer.token_frequency(k=5)
+    explainer.prototypes(n=3)
+    explainer.prototypes(n=3)
+    assert (explainer.cache.hits, explainer.cache.misses) == (2, 3)
+
+
+def test_explanation_cache_lru(tmp_path):
+    """Test: The least recently used explanations are removed when the cache is full."""
+    cache = ExplanationCache(tmp_path, max_entries=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert len(cache) == 2
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+
+
+def test_explain_prediction_n_jobs():
+    """Test: Explaining methods in parallel gives the same explanations as explaining them serially."""
+    explainer = Explainer(data=genbase_test_helpers.TEST_ENVIRONMENT, model=genbase_test_helpers.TEST_MODEL)
+    sample, methods = "a longer text, with punctuation!", ["lime", "kernel_shap", "tree"]
+    serial = explainer.explain_prediction(sample, methods=methods, seed=1)
+    parallel = explainer.explain_prediction(sample, methods=methods, seed=1, n_jobs=3)
+    assert [e.to_config()["CONTENT"] for e in serial] == [e.to_config()["CONTENT"] for e in parallel]
+
+
+def test_prototypes_n_jobs():
+    """Test: Selecting prototypes with several methods in parallel gives the same prototypes as serially."""
+    explainer = Explainer(data=genbase_test_helpers.TEST_ENVIRONMENT, model=genbase_test_helpers.TEST_MODEL)
+    serial = explainer.prototypes(method=["kmedoids", "mmdcritic"], n=3)
+    parallel = explainer.prototypes(method=["kmedoids", "mmdcritic"], n=3, n_jobs=2)
+    assert [e.to_config()["CONTENT"] for e in serial] == [e.to_config()["CONTENT"] for e in parallel]
+
+
+def test_unit_seeds():
+    """Test: The seed of a unit only depends on the seed and its name."""
+    from explabox.explain.text.parallel import unit_seeds
+
+    assert unit_seeds(0, ["test", "train"]) == unit_seeds(0, ["train", "test"])[::-1]
+    assert unit_seeds(0, ["test"]) != unit_seeds(1, ["test"])
+    assert len(set(unit_seeds(0, ["LIME", "KernelSHAP", "LocalTree"]))) == 3
+
+
+def test_run_parallel_invalid_backend():
+    """Test: An unknown backend raises a ValueError."""
+    from explabox.explain.text.parallel import run_parallel
+
+    with pytest.raises(ValueError):
+        run_parallel(print, [(1,), (2,)], n_jobs=2, backend="gpu")
+
+
+def test_token_frequency_document_terms(monkeypatch):
+    """Test: Token frequency and information tokenize a split once, giving the same result as `text_explainability`."""
+    from collections import OrderedDict
+
+    from text_explainability import TokenFrequency, TokenInformation
+
+    from explabox.explain.text import terms
+
+    monkeypatch.setattr(terms, "_DOCUMENT_TERMS", OrderedDict())
+    explainer = Explainer(data=genbase_test_helpers.TEST_ENVIRONMENT, model=genbase_test_helpers.TEST_MODEL)
+    instances = explainer.ingestibles.get_named_split("test")
+    for labelwise in [True, False]:
+        expected = TokenFrequency(instances)(model=explainer.model, labelwise=labelwise, k=10, filter_words=[])
+        res = explainer.token_frequency(labelwise=labelwise, k=10, filter_words=[])
+        assert res.to_config()["CONTENT"] == expected.to_config()["CONTENT"]
+    expected = TokenInformation(instances)(model=explainer.model, k=10, filter_words=[])
+    res = explainer.token_information(k=10, filter_words=[]).to_config()["CONTENT"]["all"]
+    expected = expected.to_config()["CONTENT"]["all"]
+    assert [feature for feature, _ in res] == [feature for feature, _ in expected]
+    assert np.allclose([score for _, score in res], [score for _, score in expected])
+    assert len(terms._DOCUMENT_TERMS) == 1
+
+    explainer.token_frequency(lower=False)
+    assert len(terms._DOCUMENT_TERMS) == 2
+
+
+def test_document_terms_shared(monkeypatch):
+    """Test: The examiner and explainer share one document-term matrix per split, also when requested concurrently."""
+    from collections import OrderedDict
+    from concurrent.futures import ThreadPoolExecutor
+
+    from explabox.examine import Examiner
+    from explabox.explain.text import terms
+
+    monkeypatch.setattr(terms, "_DOCUMENT_TERMS", OrderedDict())
+    from_texts, calls = terms.DocumentTermMatrix.from_texts, []
+
+    def counting_from_texts(*args, **kwargs):
+        calls.append(kwargs)
+        return from_texts(*args, **kwargs)
+
+    monkeypatch.setattr(terms.DocumentTermMatrix, "from_texts", counting_from_texts)
+    ingestible = Ingestible(data=genbase_test_helpers.TEST_ENVIRONMENT, model=genbase_test_helpers.TEST_MODEL)
+    Examiner(ingestibles=ingestible).slices(min_size=5)
+    Explainer(ingestibles=ingestible).token_frequency(lower=False, lowercase=False)
+    assert len(calls) == 1
+
+    instances = ingestible.get_named_split("test")
+    with ThreadPoolExecutor(4) as executor:
+        matrices = list(executor.map(lambda _: terms.document_terms(instances), range(8)))
+    assert all(matrix is matrices[0] for matrix in matrices)
+    assert matrices[0] is terms.document_terms(instances)
+
+
+def test_document_term_matrix_rows():
+    """Test: Selecting rows of a document-term matrix keeps the order in which terms first appear."""
+    from explabox.explain.text.terms import DocumentTermMatrix
+
+    terms = DocumentTermMatrix.from_texts(["b a b", "c", "a d c"])
+    assert list(terms.vocabulary) == ["b", "a", "c", "d"]
+    rows = terms.rows(np.array([2, 1]))
+    assert rows.toarray().tolist() == [[0, 1, 1, 1], [0, 0, 1, 0]]
+    assert list(terms.vocabulary[terms.first_appearance(rows)]) == ["a", "d", "c"]
+
+
+def test_mutual_information():
+    """Test: Closed-form mutual information of sparse counts equals that of `mutual_info_classif()`."""
+    from scipy import sparse
+    from sklearn.feature_selection import mutual_info_classif
+
+    from explabox.explain.text.terms import mutual_information
+
+    rng = np.random.default_rng(0)
+    X = sparse.random(300, 40, density=0.1, random_state=0, format="csr")
+    X.data = rng.integers(1, 4, len(X.data)).astype(float)
+    X = X.astype(np.int64)
+    y = rng.integers(0, 3, 300)
+    assert np.allclose(mutual_information(X, y, 3), mutual_info_classif(X, y, discrete_features=True))
+    assert np.array_equal(mutual_information(X, np.zeros(300, dtype=int), 1), np.zeros(40))
+
+
+@pytest.mark.parametrize("k", [None, 0, 1, 5, 100])
+def test_top_k(k):
+    """Test: Partial top-k selection gives the same order as a full stable sort."""
+    from explabox.explain.text.terms import top_k
+
+    scores = np.random.default_rng(0).integers(0, 5, 100).astype(float)
+    assert np.array_equal(top_k(scores, k), np.argsort(-scores, kind="stable")[:k])
+
+
+def test_nystroem_mmdcritic_full_rank():
+    """Test: MMD-critic on a full-rank Nyström approximation selects the same prototypes and criticisms as exactly."""
+    from instancelib import TextEnvironment
+    from text_explainability.data.sampling import MMDCritic
+
+    from explabox.explain.text.prototypes import NystroemMMDCritic
+
+    rng = np.random.default_rng(0)
+    words = [f"word{i}" for i in range(100)]
+    texts = [" ".join(rng.choice(words, size=rng.integers(3, 10))) for _ in range(100)]
+    instances = TextEnvironment.from_data(["a"], list(range(100)), texts, [["a"]] * 100, None).dataset
+    for regularizer in [None, "logdet", "iterative"]:
+        exact, approximate = MMDCritic(instances), NystroemMMDCritic(instances, n_components=100)
+        assert [p.identifier for p in exact.prototypes(5)] == [p.identifier for p in approximate.prototypes(5)]
+        assert [c.identifier for c in exact.criticisms(3, regularizer)] == [
+            c.identifier for c in approximate.criticisms(3, regularizer)
+        ]
+    assert approximate.approximation["relative_error"] < 1e-8
+
+
+def test_approximate_prototypes_sparse():
+    """Test: Approximate prototype samplers keep sparse vectors sparse, and select as they would on dense vectors."""
+    from instancelib import TextEnvironment
+    from scipy import sparse
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+    from explabox.explain.text.prototypes import ClaraKMedoids, NystroemMMDCritic
+
+    rng = np.random.default_rng(0)
+    words = [f"word{i}" for i in range(100)]
+    texts = [" ".join(rng.choice(words, size=rng.integers(3, 10))) for _ in range(100)]
+    matrix = sparse.csr_matrix(TfidfVectorizer().fit_transform(texts))
+    selected = []
+    for vectors in [[matrix[i] for i in range(100)], list(matrix.toarray())]:
+        instances = TextEnvironment.from_data(["a"], list(range(100)), texts, [["a"]] * 100, vectors).dataset
+        nystroem = NystroemMMDCritic(instances, n_components=20, chunk_size=16)
+        clara = ClaraKMedoids(instances, chunk_size=16)
+        assert sparse.issparse(nystroem.embedded) == sparse.issparse(vectors[0])
+        selected.append(
+            (
+                [p.identifier for p in nystroem.prototypes(5)],
+                [c.identifier for c in nystroem.criticisms(3)],
+                [p.identifier for p in clara.prototypes(3)],
+                round(clara.deviation, 8),
+            )
+        )
+    assert selected[0] == selected[1]
+
+
+@pytest.mark.parametrize("labelwise", [True, False])
+def test_prototypes_criticisms_approximate(labelwise):
+    """Test: Approximate prototypes and criticisms report the approximation of the kernel."""
+    explainer = Explainer(data=genbase_test_helpers.TEST_ENVIRONMENT, model=genbase_test_helpers.TEST_MODEL)
+    res = explainer.prototypes_criticisms(n_prototypes=3, n_criticisms=2, labelwise=labelwise, approximate=True)
+    assert isinstance(res, Instances)
+    approximation = res.meta["approximation"]
+    for a in approximation.values() if labelwise else [approximation]:
+        assert a["method"] == "nystroem" and 0.0 <= a["relative_error"] < 1.0
+    res = explainer.prototypes(n=3, labelwise=labelwise, approximate=True, n_components=10)
+    assert "approximation" in res.meta
+
+
+def test_faster_pam():
+    """Test: FasterPAM-style swaps reach a total deviation comparable to PAM."""
+    from sklearn.metrics import pairwise_distances
+    from sklearn_extra.cluster import KMedoids
+
+    from explabox.explain.text.prototypes import faster_pam
+
+    rng = np.random.default_rng(0)
+    distances = pairwise_distances(rng.normal(size=(200, 4)) + rng.integers(0, 5, size=(200, 1)))
+    medoids, deviation = faster_pam(distances, 5)
+    assert len(set(medoids)) == 5 and np.isclose(deviation, distances[medoids].min(axis=0).sum())
+    pam = KMedoids(5, metric="precomputed", method="pam", init="build").fit(distances)
+    assert deviation <= 1.05 * distances[pam.medoid_indices_].min(axis=0).sum()
+
+
+@pytest.mark.parametrize("labelwise", [True, False])
+def test_prototypes_kmedoids_approximate(labelwise):
+    """Test: Approximate k-medoids returns the same type of prototypes, reproducibly."""
+    explainer = Explainer(data=genbase_test_helpers.TEST_ENVIRONMENT, model=genbase_test_helpers.TEST_MODEL)
+    res = explainer.prototypes(method="kmedoids", n=3, labelwise=labelwise, approximate=True, n_init=3)
+    assert isinstance(res, Instances)
+    prototypes = res.content["prototypes"]
+    assert all(len(p) == 3 for p in prototypes.values()) if labelwise else len(prototypes) == 3
+    again = explainer.prototypes(method="kmedoids", n=3, labelwise=labelwise, approximate=True, n_init=3)
+    assert again.to_config()["CONTENT"] == res.to_config()["CONTENT"]
+    res = explainer.prototypes(method="kmedoids", n=3, labelwise=labelwise, approximate=True, time_budget=0.0)
+    assert isinstance(res, Instances)
+
+
+def test_embedding_cache(tmp_path):
+    """Test: A split is embedded once per embedder, without altering its instances, and dense embeddings are mapped."""
+    from scipy import sparse
+    from text_explainability.data.embedding import Embedder, TfidfVectorizer
+
+    calls = []
+
+    def embed(texts):
+        calls.append(len(texts))
+        return [[len(text), text.count("a"), 1.0] for text in texts]
+
+    embedder = Embedder(embed)
+    explainer = Explainer(
+        data=genbase_test_helpers.TEST_ENVIRONMENT, model=genbase_test_helpers.TEST_MODEL, cache=str(tmp_path)
+    )
+    for method in ["mmdcritic", "kmedoids"]:
+        explainer.prototypes(method=method, n=3, embedder=embedder)
+    explainer.prototypes(n=3, embedder=embedder, labelwise=True)
+    explainer.prototypes_criticisms(n_prototypes=3, n_criticisms=2, embedder=embedder)
+    assert len(calls) == 1
+    instances = explainer.ingestibles.get_named_split("test")
+    assert all(instances[key].vector is None for key in instances)
+
+    explainer.prototypes(n=3)
+    explainer.prototypes(n=4)
+    assert len(list((tmp_path / "embeddings").glob("*.npz"))) == 1
+    assert explainer._embeddings.matrix("test", instances, embedder).dtype == np.float32
+
+    embedder.to_config = lambda: {"features": ["length", "a", "bias"]}
+    explainer.prototypes(n=3, embedder=embedder)
+    assert len(calls) == 2
+    explainer = Explainer(
+        data=genbase_test_helpers.TEST_ENVIRONMENT, model=genbase_test_helpers.TEST_MODEL, cache=str(tmp_path)
+    )
+    assert isinstance(explainer._embeddings.matrix("test", instances, embedder), np.memmap)
+    assert len(calls) == 2
+
+    # The samplers get the cached matrices as they are, instead of copies of their (densified) rows
+    embedded = explainer._embeddings.embed("test", instances, embedder)
+    assert embedded.embedded() is explainer._embeddings.matrix("test", instances, embedder)
+    assert sparse.issparse(explainer._embeddings.embed("test", instances, TfidfVectorizer).embedded())
+
+    # Embeddings count towards the size of the cache, and are cleared with it
+    ExplanationCache(tmp_path, max_entries=2).put("explanation", 1)
+    assert len(list((tmp_path / "embeddings").iterdir())) == 1
+    explainer.cache.clear()
+    assert not list((tmp_path / "embeddings").iterdir())
+
+
+def _sklearn_explainer(estimator, vectorizer=None):
+    """Explainer of a scikit-learn pipeline of a count vectorizer and `estimator`, fitted on sentiment-like texts."""
+    from instancelib import TextEnvironment
+    from instancelib.machinelearning import SkLearnDataClassifier
+    from sklearn.feature_extraction.text import CountVectorizer
+    from sklearn.pipeline import make_pipeline
+
+    rng = np.random.default_rng(0)
+    words = {"pos": ["good", "great"], "neg": ["bad", "awful"]}
+    texts, labels = [], []
+    for i in range(100):
+        label = ["pos", "neg"][i % 2]
+        texts.append(" ".join([*rng.choice(["the", "movie", "plot", "was"], 3), *rng.choice(words[label], 2)]))
+        labels.append([label])
+    env = TextEnvironment.from_data(["neg", "pos"], list(range(100)), texts, labels, None)
+    if vectorizer is None:
+        vectorizer = CountVectorizer(ngram_range=(1, 2))
+    model = SkLearnDataClassifier.build(make_pipeline(vectorizer, estimator), env)
+    model.fit_provider(env.dataset, env.labels)
+    return Explainer(data=env, model=model)
+
+
+def test_explain_predictions_pooled_featurized(monkeypatch):
+    """Test: Mask neighbourhoods of a featurized pipeline are pooled into fewer calls, with the same explanations."""
+    from sklearn.linear_model import LogisticRegression
+
+    from explabox.explain.text.featurization import FeaturizedClassifier
+
+    calls = []
+    predict_proba_features = FeaturizedClassifier.predict_proba_features
+
+    def counting(self, X):
+        calls.append(X.shape[0])
+        return predict_proba_features(self, X)
+
+    monkeypatch.setattr(FeaturizedClassifier, "predict_proba_features", counting)
+    explainer = _sklearn_explainer(LogisticRegression())
+    samples = [f"the movie {i} was {['good', 'bad'][i % 2]} and the plot {i} was great" for i in range(10)]
+    explanations = explainer.explain_predictions(samples, methods=["lime"], exact=False, n_concurrent=10)
+    assert 0 < len(calls) < len(samples)
+
+    single = explainer.explain_prediction(samples[-1], methods=["lime"], exact=False)
+    assert explanations[samples[-1]][0].content["scores"] == single[0].content["scores"]
+
+
+@pytest.mark.parametrize("estimator", ["LogisticRegression", "RandomForestClassifier", "GradientBoostingClassifier"])
+def test_explain_prediction_exact(estimator):
+    """Test: Exact attribution replaces sampling if asked to, and sums to the output minus the base score."""
+    import sklearn.ensemble
+    import sklearn.linear_model
+
+    from explabox.explain.text.exact import feature_attributions
+
+    module = sklearn.linear_model if estimator == "LogisticRegression" else sklearn.ensemble
+    explainer = _sklearn_explainer(getattr(module, estimator)(random_state=0))
+    text = "The movie was good, but the plot was awful!"
+    with pytest.warns(UserWarning, match="replaced by one exact feature attribution"):
+        res = explainer.explain_prediction(text, methods=["lime", "kernel_shap", "tree"], exact=True)
+    assert len(res) == 2 and isinstance(res[0], FeatureList) and "FeatureAttribution" in type(res[0]).__name__
+    assert res[0].to_config()["META"]["method"] == (
+        "linear_contributions" if module is sklearn.linear_model else "tree_shap"
+    )
+
+    _, scores, base = feature_attributions(explainer.model, text)
+    pipeline = explainer.model.innermodel
+    X = pipeline[:-1].transform([text])
+    if estimator == "RandomForestClassifier":
+        output = pipeline[-1].predict_proba(X)[0]
+    else:  # decision function of the second class
+        output = np.array([-1.0, 1.0]) * pipeline[-1].decision_function(X)[0]
+    assert np.allclose(scores.sum(axis=1) + base, output)
+    columns = [explainer.model.get_label_column_index(label) for label in explainer.labelset]
+    assert np.allclose(np.sum(res[0].get_raw_scores(), axis=1), scores.sum(axis=1)[columns])
+
+    assert explainer.explain_prediction(text, methods="lime", exact=None).to_config()["META"]["method"] != "lime"
+    assert explainer.explain_prediction(text, methods="lime").to_config()["META"]["method"] == "lime"
+
+
+def test_explain_prediction_exact_unsupported():
+    """Test: Requiring exact attribution for an unsupported model raises a ValueError."""
+    explainer = Explainer(data=genbase_test_helpers.TEST_ENVIRONMENT, model=genbase_test_helpers.TEST_MODEL)
+    with pytest.raises(ValueError):
+        explainer.explain_prediction("a text!", methods="lime", exact=True)
+
+
+@pytest.mark.parametrize(
+    "vectorizer,kwargs",
+    [
+        ("CountVectorizer", {}),
+        ("CountVectorizer", {"ngram_range": (1, 3), "binary": True, "lowercase": False}),
+        ("TfidfVectorizer", {"ngram_range": (1, 2), "stop_words": "english"}),
+        ("TfidfVectorizer", {"sublinear_tf": True, "use_idf": False, "norm": "l1"}),
+    ],
+)
+def test_token_featurizer(vectorizer, kwargs):
+    """Test: Featurizing perturbed tokens gives the features of the vectorizer for the perturbed texts."""
+    import sklearn.feature_extraction.text
+    from text_explainability import from_string
+    from text_explainability.data.augmentation import LeaveOut
+
+    from explabox.explain.text.featurization import TokenFeaturizer
+
+    texts = ["The movie was good, but the plot was awful!", "Don't e-mail me at 10:30 (it was great)", "was the bad"]
+    vectorizer = getattr(sklearn.feature_extraction.text, vectorizer)(**kwargs).fit(texts)
+    featurizer = TokenFeaturizer(vectorizer)
+    for text in texts:
+        perturbed = [from_string(text), *LeaveOut(seed=0)(from_string(text), n_samples=50, sequential=False)]
+        X = featurizer.transform([instance.tokenized for instance in perturbed])
+        assert np.allclose(X.toarray(), vectorizer.transform([instance.data for instance in perturbed]).toarray())
+
+
+def test_featurized_classifier():
+    """Test: A featurized classifier predicts perturbations as the model does, and passes on untokenized instances."""
+    import pickle
+
+    from instancelib.instances.text import MemoryTextInstance
+    from sklearn.linear_model import LogisticRegression
+    from text_explainability import LIME, from_string
+
+    from explabox.explain.text.featurization import FeaturizedClassifier, featurized
+
+    explainer = _sklearn_explainer(LogisticRegression())
+    model = featurized(explainer.model)
+    assert isinstance(model, FeaturizedClassifier) and featurized(genbase_test_helpers.TEST_MODEL) is not model
+
+    provider, *_ = LIME(seed=0).augment_sample(from_string("The plot was good, the movie great!"), None, predict=False)
+    instances = list(provider.values())
+    expected = {
+        key: row for keys, proba in explainer.model.predict_proba_raw(instances) for key, row in zip(keys, proba)
+    }
+    (keys, proba), *rest = model.predict_proba_raw(provider)
+    assert not rest and list(keys) == [instance.identifier for instance in instances]
+    assert np.allclose(proba, [expected[key] for key in keys]) and model.n_featurized == len(instances)
+
+    list(model.predict_proba_raw([MemoryTextInstance(i, text, None) for i, text in enumerate(["Good!", "Awful."])]))
+    assert model.n_passed == 2
+
+    assert isinstance(pickle.loads(pickle.dumps(model)), FeaturizedClassifier)  # e.g. for the processes backend
+    res = explainer.explain_prediction("The plot was good, the movie great!", methods=["lime", "tree"], exact=False)
+    assert len(res) == 2
+
+
+def test_featurized_classifier_token_pattern():
+    """Test: Only vectorizers whose words cannot span tokens are featurized, even if the sample itself would match."""
+    from sklearn.feature_extraction.text import CountVectorizer
+    from sklearn.linear_model import LogisticRegression
+    from text_explainability import from_string
+    from text_explainability.data.augmentation import LeaveOut
+
+    from explabox.explain.text.featurization import FeaturizedClassifier, TokenFeaturizer, featurized, supports
+
+    text = "I e - mail , don ' t x . y now"
+    perturbed = [from_string(text), *LeaveOut(seed=0)(from_string(text), n_samples=50, sequential=False)]
+    for token_pattern, featurizable in [(r"\S+", False), (CountVectorizer().token_pattern, True)]:
+        vectorizer = CountVectorizer(token_pattern=token_pattern, ngram_range=(1, 2)).fit([text])
+        X = TokenFeaturizer(vectorizer).transform([instance.tokenized for instance in perturbed])
+        expected = vectorizer.transform([instance.data for instance in perturbed]).toarray()
+        assert np.allclose(X[0].toarray(), expected[0]) and np.allclose(X.toarray(), expected) == featurizable
+
+        explainer = _sklearn_explainer(LogisticRegression(), vectorizer=vectorizer)
+        assert supports(explainer.model) == featurizable
+        assert (featurized(explainer.model) is explainer.model) != featurizable
+        if not featurizable:  # neither for predictions of instances nor of mask matrices
+            with pytest.raises(ValueError):
+                FeaturizedClassifier(explainer.model)
+
+
+@pytest.mark.parametrize("sequential", [True, False])
+@pytest.mark.parametrize("contiguous", [True, False])
+def test_leave_out_masks(sequential, contiguous):
+    """Test: Mask matrices are drawn as the perturbations of `LeaveOut`, with a background leaving out all tokens."""
+    from text_explainability.data.augmentation import LeaveOut
+
+    from explabox.explain.text.perturbation import leave_out_masks
+
+    tokens = "The plot was good , the movie great !".split()
+    kwargs = {"n_samples": 30, "sequential": sequential, "contiguous": contiguous, "seed": 3}
+    expected = [mask for _, mask in LeaveOut().perturb(tokens, **kwargs)]
+    masks = leave_out_masks(len(tokens), add_background_instance=True, **kwargs)
+    assert masks.dtype == bool and np.array_equal(masks[:-1], np.asarray(expected, dtype=bool)) and masks[-1].all()
+
+
+def test_perturb_with_masks():
+    """Test: Neighbourhoods of mask methods start with the sample, have no duplicates and are predicted from masks."""
+    from sklearn.linear_model import LogisticRegression
+    from text_explainability import LIME, KernelSHAP, LocalTree, from_string
+
+    from explabox.explain.text.featurization import featurized
+    from explabox.explain.text.perturbation import NeighbourhoodProvider, perturb_with_masks, supports
+
+    assert supports(LIME) and supports(LocalTree()) and not supports(LIME(augmenter=object()))
+    explainer = _sklearn_explainer(LogisticRegression())
+    model = featurized(explainer.model)
+    sample = from_string("The plot was good, the movie great!")
+    provider, _, perturbed, y, y_orig = perturb_with_masks(KernelSHAP()).augment_sample(
+        sample, model, n_samples=100, add_background_instance=True
+    )
+    assert isinstance(provider, NeighbourhoodProvider) and provider.neighbourhood._instances is None
+    assert perturbed[0].all() and perturbed[-1].all() and len(np.unique(perturbed[1:-1], axis=0)) == len(perturbed) - 2
+    assert model.n_featurized == len(perturbed) and model.n_passed == 0 and np.allclose(y[0], y_orig)
+
+    expected = np.vstack([proba for _, proba in explainer.model.predict_proba_raw(provider.values())])
+    assert provider.neighbourhood._instances is not None and np.allclose(y, expected)
+    assert all(provider[key].data == instance.data for key, instance in zip(provider, provider.values()))
+
+    res = explainer.explain_prediction("The plot was good, the movie great!", methods=["tree", "rules"], exact=False)
+    assert len(res) == 2
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_perturb_with_masks_leave_out(seed):
+    """Test: Mask neighbourhoods have the unique texts of `LeaveOut`, with the background instance only at the end."""
+    from text_explainability import LIME, default_detokenizer, from_string
+    from text_explainability.data.augmentation import LeaveOut
+
+    from explabox.explain.text.perturbation import perturb_with_masks
+
+    sample = from_string("good good movie, good plot!")
+    tokens = list(sample.tokenized)
+    texts = [
+        default_detokenizer(perturbed) for perturbed, _ in LeaveOut().perturb(tokens, 60, sequential=False, seed=seed)
+    ]
+    assert "" in texts and len(set(texts)) < len(texts)  # draws leaving out all tokens, and duplicate texts
+    expected = [text for text in dict.fromkeys(texts) if text not in (sample.data, "")] + [""]
+
+    provider, _, perturbed = perturb_with_masks(LIME()).augment_sample(
+        sample, None, n_samples=60, add_background_instance=True, predict=False, seed=seed
+    )
+    assert provider.neighbourhood.texts() == expected and perturbed[-1].all()
+    without, rows = provider.neighbourhood.without_background()  # as drawn without a background instance
+    assert without.texts() == [text for text in dict.fromkeys(texts) if text != sample.data]
+    assert np.array_equal(perturbed[rows], without.perturbed())
+
+
+@pytest.mark.parametrize(
+    "level,expected",
+    [
+        ("sentences", ["The plot was good.", "Was it?", '"Great!"', "It was (not) awful", "New one."]),
+        ("paragraphs", ['The plot was good. Was it?  "Great!" It was (not) awful', "New one."]),
+    ],
+)
+def test_split_segments(level, expected):
+    """Test: Texts are split into sentences or paragraphs, without surrounding whitespace."""
+    from explabox.explain.text.hierarchical import split_segments
+
+    assert split_segments(' The plot was good. Was it?  "Great!" It was (not) awful\n \nNew one.', level) == expected
+
+
+@pytest.mark.parametrize(
+    "n_samples,n_features,n_words,expected", [(1000, 3, None, 8), (1000, 20, 200, 100), (100, 20, 1000, 40)]
+)
+def test_stage_samples(n_samples, n_features, n_words, expected):
+    """Test: Stages draw at most all distinct perturbations, and samples proportional to their share of the words."""
+    from explabox.explain.text.hierarchical import stage_samples
+
+    assert stage_samples(n_samples, n_features, n_words) == expected
+
+
+def test_explain_prediction_hierarchical():
+    """Test: Hierarchical explanations attribute to segments, then to the tokens of the top segments in context."""
+    from sklearn.linear_model import LogisticRegression
+
+    explainer = _sklearn_explainer(LogisticRegression())
+    document = "The plot was the movie. The movie was great! It was the plot.\n\nThe plot was awful. It was the movie."
+    res = explainer.explain_prediction(
+        document, methods=["lime", "shap", "tree"], exact=False, hierarchical=True, top_segments=2, n_samples=50
+    )
+    assert len(res) == 5 and type(res[4]).__name__ != "FeatureAttribution"
+    for segments, tokens in [res[0:2], res[2:4]]:
+        assert segments.content["features"] == [
+            "The plot was the movie.",
+            "The movie was great!",
+            "It was the plot.",
+            "The plot was awful.",
+            "It was the movie.",
+        ]
+        assert tokens.content["features"] == "The movie was great ! The plot was awful .".split()
+        assert all(instance.data.startswith("The plot was the movie.") for instance in tokens.perturbed_instances)
+
+    paragraphs = explainer.explain_prediction(document, methods="shap", exact=False, hierarchical="paragraphs")
+    assert len(paragraphs[0].content["features"]) == 2 and len(paragraphs[1].content["features"]) == 26
+
+
+def test_explain_prediction_hierarchical_samples():
+    """Test: Each hierarchical stage draws samples for its own features, and predicts the document from its tokens."""
+    from text_explainability import default_tokenizer
+
+    from explabox.explain.text.hierarchical import split_segments, stage_samples
+
+    predicted = []
+
+    def predict(instances):
+        predicted.append(list(instances))
+        return np.vstack([genbase_test_helpers.predict_fn(instance) for instance in instances])
+
+    model = genbase_test_helpers.DeterministicTextClassifier.from_batched_callable(
+        predict, ["punctuation", "no_punctuation"]
+    )
+    explainer = Explainer(data=genbase_test_helpers.TEST_ENVIRONMENT, model=model)
+    document = "The plot was good.  The movie was great!\n\nIt was the plot, the  movie."
+    segments, tokens = explainer.explain_prediction(
+        document, methods="lime", hierarchical=True, top_segments=1, n_samples=200
+    )
+    n_words, n_document_words = len(tokens.content["features"]), len(default_tokenizer(document))
+    budgets = [stage_samples(200, 3), stage_samples(200, n_words, n_document_words)]
+    assert budgets == [8, min(2**n_words, int(np.ceil(200 * n_words / n_document_words)))]
+    assert len(predicted) == 2 and all(len(rows) <= 1 + n for rows, n in zip(predicted, budgets))
+    assert all(rows[0] == " ".join(split_segments(document)) for rows in predicted)
+
+
+@pytest.mark.parametrize(
+    "hierarchical,top_segments,shared_neighbourhood", [("words", 3, False), (True, 0, False), (True, 3, True)]
+)
+def test_explain_prediction_hierarchical_invalid(hierarchical, top_segments, shared_neighbourhood):
+    """Test: Unknown segment levels, no top segments or a shared neighbourhood raise a ValueError."""
+    explainer = Explainer(ingestibles=INGESTIBLE)
+    with pytest.raises(ValueError):
+        explainer.explain_prediction(
+            "a", hierarchical=hierarchical, top_segments=top_segments, shared_neighbourhood=shared_neighbourhood
+        )
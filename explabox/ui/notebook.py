@@ -76,14 +76,152 @@ def format_table(header, content):
     return f'<div class="table-wrapper"><table><tr>{header}</tr>{content}</table></div>'
 
 
+def performance_renderer(meta, content, **renderargs):
+    """Renderer for `explabox.digestibles.Performance`."""
+    html = metrics_renderer(meta, content, **renderargs)
+
+    if "approximation" in content:
+        approximation = content["approximation"]
+        html = (
+            f'<p>Estimated from a stratified sample of {approximation["n_sampled"]} of '
+            f'{approximation["n_instances"]} instances in {approximation["n_rounds"]} round(s), spending '
+            f'{approximation["n_predictions"]} predictions. Confidence intervals are within '
+            f'&plusmn;{approximation["half_width"]:.2%} (tolerance &plusmn;{approximation["tolerance"]:.2%}).</p>'
+        ) + html
+
+    if "averages" in content:
+        html += f'<h3>Averages (accuracy = {content["accuracy"]:.2%})</h3>'
+        metrics = list(next(iter(content["averages"].values())).keys())
+        averages = [
+            "<tr>" + f"<td>{average}</td>" + "".join(f"<td>{v[metric]:.2%}</td>" for metric in metrics) + "</tr>"
+            for average, v in content["averages"].items()
+        ]
+        html += format_table(["<th>Average</th>"] + [f"<th>{metric}</th>" for metric in metrics], averages)
+
+    if "confidence_intervals" in content:
+        intervals = content["confidence_intervals"]
+
+        def fmt(bounds):
+            return f"<td>{bounds[0]:.2%} &ndash; {bounds[1]:.2%}</td>"
+
+        html += f'<h3>{1 - intervals["alpha"]:.0%} confidence intervals ({intervals["n_resamples"]} resamples)</h3>'
+        metrics = list(next(iter(intervals["label_metrics"].values())).keys())
+        label_intervals = [
+            f"<tr><td><kbd>{label}</kbd></td>" + "".join(fmt(v[metric]) for metric in metrics) + "</tr>"
+            for label, v in intervals["label_metrics"].items()
+        ]
+        html += format_table(["<th>Label</th>"] + [f"<th>{metric}</th>" for metric in metrics], label_intervals)
+        html += format_table(
+            "<th>Metric</th><th>Interval</th>",
+            [f"<tr><td>{metric}</td>{fmt(v)}</tr>" for metric, v in intervals["averages"].items()],
+        )
+    return html
+
+
+def comparison_renderer(meta, content, **renderargs):
+    """Renderer for `explabox.digestibles.Comparison`."""
+    models = content["models"]
+    html = f'<p>Compared {len(models)} models on {content["n_instances"]} instances '
+    html += f'({content["n_unique"]} unique).</p>'
+
+    metrics = list(next(iter(content["metrics"].values())).keys())
+    rows = [
+        f"<tr><td>{model}</td>" + "".join(f"<td>{content['metrics'][model][m]:.2%}</td>" for m in metrics) + "</tr>"
+        for model in models
+    ]
+    html += format_table(["<th>Model</th>"] + [f"<th>{m}</th>" for m in metrics], rows)
+
+    def pairwise(title, matrix, fmt):
+        rows = [
+            f"<tr><td>{model}</td>" + "".join(f"<td>{fmt(v)}</td>" for v in matrix[i]) + "</tr>"
+            for i, model in enumerate(models)
+        ]
+        return f"<h3>{title}</h3>" + format_table(["<th></th>"] + [f"<th>{model}</th>" for model in models], rows)
+
+    html += pairwise("Disagreement", content["disagreement"], lambda v: f"{v:.2%}")
+    html += pairwise("McNemar p-value", content["mcnemar"]["p_value"], lambda v: f"{v:.3g}")
+    return html
+
+
+def calibration_renderer(meta, content, **renderargs):
+    """Renderer for `explabox.digestibles.Calibration`."""
+    html = f'<p>Multi-class Brier score is {content["brier"]:.4f} on {content["n_instances"]} instances, with '
+    html += f'{content["n_bins"]} probability bins.</p>'
+
+    rows = [
+        f'<tr><td><kbd>{c["label"]}</kbd></td><td>{c["ece"]:.4f}</td><td>{c["mce"]:.4f}</td><td>{c["brier"]:.4f}</td>'
+        "</tr>"
+        for c in content["label_calibration"]
+    ]
+    top_label = content["top_label"]
+    rows.append(f'<tr><td>Top label</td><td>{top_label["ece"]:.4f}</td><td>{top_label["mce"]:.4f}</td><td></td></tr>')
+    html += format_table("".join(f"<th>{h}</th>" for h in ["Label", "ECE", "MCE", "Brier score"]), rows)
+
+    html += "<h3>Reliability (top label)</h3>"
+    curve = top_label["curve"]
+    html += format_table(
+        "<th>Mean confidence</th><th>Accuracy</th><th>Count</th>",
+        [
+            f"<tr><td>{c:.2%}</td><td>{f:.2%}</td><td>{n}</td></tr>"
+            for c, f, n in zip(curve["confidence"], curve["fraction_positive"], curve["count"])
+        ],
+    )
+    return html
+
+
+def slices_renderer(meta, content, **renderargs):
+    """Renderer for `explabox.digestibles.Slices`."""
+    html = f'<p>Accuracy on all {content["n_instances"]} instances is {content["accuracy"]:.2%}. '
+    html += f'Found {len(content["slices"])} of {content["n_candidates"]} candidate slices with a significantly '
+    html += f'lower accuracy (false discovery rate {content["alpha"]:.0%}).'
+    if content.get("n_excluded"):
+        html += f' {content["n_excluded"]} instances without exactly one known label are excluded.'
+    html += "</p>"
+
+    if content["slices"]:
+        rows = [
+            f'<tr><td>{s["feature"]}</td><td><kbd>{s["value"]}</kbd></td><td>{s["size"]}</td>'
+            f'<td>{s["accuracy"]:.2%}</td><td>{s["difference"]:+.2%}</td><td>{s["q_value"]:.2e}</td></tr>'
+            for s in content["slices"]
+        ]
+        html += format_table(
+            "".join(f"<th>{h}</th>" for h in ["Feature", "Value", "Size", "Accuracy", "Difference", "q-value"]), rows
+        )
+    return html
+
+
 def wrongly_classified_renderer(meta, content, **renderargs):
     """Rendered for `explabox.digestibles.WronglyClassified`."""
     html = ""
 
+    if content.get("n_pages", 1) > 1:
+        html += f'<p>Page {content["page"] + 1} of {content["n_pages"]}.</p>'
+
     for c in content["wrongly_classified"]:
+        if not c["instances"]:
+            continue
         html += f'<h3>Should be <kbd>{c["ground_truth"]}</kbd> but predicted as <kbd>{c["predicted"]}</kbd>'
-        html += f' (n={len(c["instances"])})</h3>'
-        html += format_instances(c["instances"])
+        html += f' (n={c.get("n", len(c["instances"]))})</h3>'
+        scores = {k: [f"{v:.2%}" for v in c[k]] for k in ["confidence", "margin"] if k in c}
+        html += format_instances(c["instances"], **{k.title(): v for k, v in scores.items()})
+    return html
+
+
+def label_issues_renderer(meta, content, **renderargs):
+    """Renderer for `explabox.digestibles.LabelIssues`."""
+    html = f'<p>Found {content["n_issues"]} likely mislabelled instances of {content["n_instances"]} '
+    html += f'(estimated {content["n_estimated"]}).</p>'
+
+    issues = content["label_issues"]
+    if issues["instances"]:
+        html += format_instances(
+            issues["instances"],
+            **{
+                "Given label": [f"<kbd>{label}</kbd>" for label in issues["given"]],
+                "Suggested label": [f"<kbd>{label}</kbd>" for label in issues["suggested"]],
+                "Self-confidence": [f"{v:.2%}" for v in issues["self_confidence"]],
+            },
+        )
     return html
 
 
@@ -176,7 +314,15 @@ class Render(GBRenderRestyled):
         elif type == "descriptives":
             return descriptives_renderer
         elif type == "model_performance":
-            return metrics_renderer
+            return performance_renderer
+        elif type == "model_comparison":
+            return comparison_renderer
+        elif type == "calibration":
+            return calibration_renderer
+        elif type == "slices":
+            return slices_renderer
+        elif type == "label_issues":
+            return label_issues_renderer
         elif type == "wrongly_classified":
             return wrongly_classified_renderer
 